@@ -0,0 +1,196 @@
+# FlotaBenchmark.py
+# Mide el rendimiento de los motores de simulación y comprueba que todos dan niveles de servicio estadísticamente
+# indistinguibles del bucle de referencia.
+#
+#   python FlotaBenchmark.py rendimiento --linea-base base.json --guardar     # mide y guarda la línea base
+#   python FlotaBenchmark.py rendimiento --linea-base base.json               # falla si algún caso empeora
+#   python FlotaBenchmark.py equivalencia                                     # contraste frente a "bucle"
+#   python FlotaBenchmark.py todo --completo
+#
+# El código de salida es 1 si hay una regresión respecto a la línea base o algún motor no es equivalente.
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+
+import numpy as np
+
+import FlotaReserva as sim
+
+MATRIZ_RAPIDA = {"flotas": [18, 100], "replicas": [100], "dias": [365], "disponibilidades": [0.93]}
+MATRIZ_COMPLETA = {"flotas": [18, 50, 100, 300, 500], "replicas": [100, 1000], "dias": [365, 730],
+                   "disponibilidades": [0.90, 0.93, 0.97]}
+# Casos del contraste de equivalencia: (trenes requeridos, trenes de reserva, disponibilidad)
+CASOS_EQUIVALENCIA = [(18, 0, 0.93), (18, 3, 0.93), (18, 2, 0.90), (40, 2, 0.93)]
+
+
+def params_escalados(trenes_requeridos, dias, disponibilidad, motor, base=None):
+    # El perfil horario por defecto está pensado para 18 trenes: se escala en proporción al tamaño de la flota
+    base = base or sim.default_params
+    escala = trenes_requeridos / base["TRENES_OPERATIVOS_REQUERIDOS"]
+    requisitos = np.rint(np.multiply(base["REQUISITOS_TRENES_HORA"], escala)).astype(int).tolist()
+    return dict(base, TRENES_OPERATIVOS_REQUERIDOS=trenes_requeridos, DIAS_POR_SIMULACION=dias,
+                DISPONIBILIDAD=disponibilidad, MOTOR=motor, REQUISITOS_TRENES_HORA=requisitos)
+
+
+def id_caso(motor, flota, replicas, dias, disponibilidad):
+    return f"{motor}|flota={flota}|replicas={replicas}|dias={dias}|disp={disponibilidad}"
+
+
+def medir(funcion, repeticiones):
+    # Se descarta una primera ejecución de calentamiento y se toma el mejor tiempo de las repeticiones
+    funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def medir_motores(motores, matriz, repeticiones, semilla):
+    stop_event = threading.Event()
+    resultados = {}
+    for motor, flota, replicas, dias, disponibilidad in itertools.product(
+            motores, matriz["flotas"], matriz["replicas"], matriz["dias"], matriz["disponibilidades"]):
+        params = params_escalados(flota, dias, disponibilidad, motor)
+        reserva = max(1, flota // 10)
+        tiempo = medir(lambda: sim.simular_replicas(reserva, params, replicas, stop_event,
+                                                    np.random.default_rng(semilla)), repeticiones)
+        caso = id_caso(motor, flota, replicas, dias, disponibilidad)
+        resultados[caso] = {"tiempo_s": tiempo, "replicas_s": replicas / tiempo,
+                            "tren_dias_s": replicas * dias * (flota + reserva) / tiempo}
+        print(f"{caso:<60} {resultados[caso]['replicas_s']:>12.1f} réplicas/s "
+              f"{resultados[caso]['tren_dias_s']:>14.0f} tren-días/s", flush=True)
+    return resultados
+
+
+def medir_analisis(motores, num_simulaciones, semilla):
+    # Búsqueda completa con los parámetros por defecto: incluye el coste de la estrategia y del registro
+    resultados = {}
+    for motor in motores:
+        params = dict(sim.default_params, MOTOR=motor, NUM_SIMULACIONES=num_simulaciones, SEMILLA=semilla)
+        replicas_totales = []
+
+        def ejecutar():
+            results = sim.run_full_analysis(params, threading.Event())
+            replicas_totales.append(sum(h[4] for h in results["plot_history"]))
+
+        tiempo = medir(ejecutar, 1)
+        caso = f"analisis|{motor}|replicas={num_simulaciones}"
+        replicas = replicas_totales[-1]
+        flota_media = params["TRENES_OPERATIVOS_REQUERIDOS"] + 5
+        resultados[caso] = {"tiempo_s": tiempo, "replicas_s": replicas / tiempo,
+                            "tren_dias_s": replicas * params["DIAS_POR_SIMULACION"] * flota_media / tiempo}
+        print(f"{caso:<60} {tiempo:>12.2f} s ({resultados[caso]['replicas_s']:.1f} réplicas/s)", flush=True)
+    return resultados
+
+
+def comparar_linea_base(resultados, linea_base, tolerancia):
+    regresiones = []
+    for caso, medida in resultados.items():
+        referencia = linea_base.get("casos", {}).get(caso)
+        if referencia is None: continue
+        relacion = medida["replicas_s"] / referencia["replicas_s"]
+        if relacion < 1 - tolerancia:
+            regresiones.append(caso)
+            print(f"REGRESIÓN {caso}: {relacion:.1%} del rendimiento de la línea base")
+    return regresiones
+
+
+def contrastar_equivalencia(motores, replicas, alfa, semilla):
+    # Contraste z de Welch sobre la media de horas fallidas por réplica frente al bucle de referencia, con
+    # corrección de Bonferroni por el número de comparaciones. Cada motor usa su propia semilla derivada para que
+    # las muestras sean independientes.
+    stop_event = threading.Event()
+    candidatos = [m for m in motores if m != "bucle"]
+    comparaciones = len(candidatos) * len(CASOS_EQUIVALENCIA)
+    if comparaciones == 0: return []
+    critico = statistics.NormalDist().inv_cdf(1 - alfa / (2 * comparaciones))
+    fallos = []
+    for requeridos, reserva, disponibilidad in CASOS_EQUIVALENCIA:
+        muestras = {}
+        for i, motor in enumerate(["bucle"] + candidatos):
+            params = params_escalados(requeridos, 365, disponibilidad, motor)
+            rng = np.random.default_rng(np.random.SeedSequence(semilla, spawn_key=(requeridos, reserva, i)))
+            muestras[motor] = (params, sim.simular_replicas(reserva, params, replicas, stop_event, rng))
+        params_ref, referencia = muestras["bucle"]
+        nivel_ref = sim.nivel_servicio(int(referencia.sum()), replicas, 365)
+        for motor in candidatos:
+            params, horas = muestras[motor]
+            nivel = sim.nivel_servicio(int(horas.sum()), replicas, 365)
+            error = math.sqrt(referencia.var(ddof=1) / replicas + horas.var(ddof=1) / replicas)
+            diferencia = float(horas.mean() - referencia.mean())
+            z = 0.0 if error == 0 and diferencia == 0 else (diferencia / error if error > 0 else math.inf)
+            estado = "OK" if abs(z) <= critico else "DISTINTO"
+            if estado != "OK": fallos.append((motor, requeridos, reserva, disponibilidad))
+            print(f"{motor:<12} requeridos={requeridos:<4} reserva={reserva:<3} disp={disponibilidad:<5} "
+                  f"nivel={nivel:.4%} (bucle {nivel_ref:.4%}) z={z:+.2f} |z|<={critico:.2f} {estado}", flush=True)
+    return fallos
+
+
+def _lista(tipo):
+    return lambda texto: [tipo(v) for v in texto.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark y contraste de equivalencia de los motores de simulación.")
+    parser.add_argument("accion", choices=["rendimiento", "equivalencia", "todo"], nargs="?", default="todo")
+    parser.add_argument("--motores", type=_lista(str), default=list(sim.MOTORES),
+                        help="Motores separados por comas (por defecto todos).")
+    parser.add_argument("--completo", action="store_true", help="Recorre la matriz completa de casos.")
+    parser.add_argument("--flotas", type=_lista(int), help="Trenes requeridos, p. ej. 18,100,300.")
+    parser.add_argument("--replicas", type=_lista(int), help="Réplicas por medida, p. ej. 100,1000.")
+    parser.add_argument("--dias", type=_lista(int), help="Horizontes en días, p. ej. 365,730.")
+    parser.add_argument("--disponibilidades", type=_lista(float), help="Disponibilidades, p. ej. 0.90,0.97.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Repeticiones por caso (se toma la mejor).")
+    parser.add_argument("--analisis", type=int, default=200, metavar="REPLICAS",
+                        help="Réplicas por punto de la búsqueda completa medida (0 para omitirla).")
+    parser.add_argument("--linea-base", help="Fichero JSON con la línea base de rendimiento.")
+    parser.add_argument("--guardar", action="store_true", help="Guarda las medidas como nueva línea base.")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="Pérdida de rendimiento admitida frente a la línea base (por defecto 25%%).")
+    parser.add_argument("--replicas-equivalencia", type=int, default=400)
+    parser.add_argument("--alfa", type=float, default=0.001, help="Nivel de significación global del contraste.")
+    parser.add_argument("--semilla", type=int, default=12345)
+    args = parser.parse_args(argv)
+    desconocidos = [m for m in args.motores if m not in sim.MOTORES]
+    if desconocidos: parser.error(f"motores desconocidos: {', '.join(desconocidos)}")
+
+    correcto = True
+    if args.accion in ("rendimiento", "todo"):
+        matriz = dict(MATRIZ_COMPLETA if args.completo else MATRIZ_RAPIDA)
+        for clave in matriz:
+            if getattr(args, clave): matriz[clave] = getattr(args, clave)
+        print("--- Rendimiento ---")
+        resultados = medir_motores(args.motores, matriz, args.repeticiones, args.semilla)
+        if args.analisis > 0: resultados.update(medir_analisis(args.motores, args.analisis, args.semilla))
+        if args.linea_base and args.guardar:
+            with open(args.linea_base, "w", encoding="utf-8") as fichero:
+                json.dump({"maquina": {"sistema": platform.platform(), "python": platform.python_version(),
+                                       "numpy": np.__version__, "cpus": os.cpu_count()},
+                           "version_motor": sim.VERSION_MOTOR, "casos": resultados}, fichero, indent=2)
+            print(f"Línea base guardada en {args.linea_base}")
+        elif args.linea_base:
+            with open(args.linea_base, encoding="utf-8") as fichero:
+                linea_base = json.load(fichero)
+            regresiones = comparar_linea_base(resultados, linea_base, args.tolerancia)
+            print(f"{len(regresiones)} regresiones frente a {args.linea_base}")
+            correcto = correcto and not regresiones
+    if args.accion in ("equivalencia", "todo"):
+        print("--- Equivalencia frente al bucle de referencia ---")
+        fallos = contrastar_equivalencia(args.motores, args.replicas_equivalencia, args.alfa, args.semilla)
+        print(f"{len(fallos)} casos no equivalentes")
+        correcto = correcto and not fallos
+    return 0 if correcto else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+# FlotaCLI.py
+# Ejecución por lotes sin interfaz gráfica: lee escenarios de ficheros JSON o YAML y/o una rejilla de parámetros,
+# ejecuta run_full_analysis para cada uno (varios a la vez en procesos separados) y escribe una fila de resultados
+# en CSV o Parquet en cuanto termina cada escenario.
+# Las importaciones pesadas (numpy, el simulador, PyYAML, pyarrow) se difieren hasta que hacen falta, de modo que
+# el arranque y --help no cargan nada de tkinter ni matplotlib.
+#
+# Ejemplo:
+#   python FlotaCLI.py escenarios.yaml --rejilla DISPONIBILIDAD=0.90,0.93,0.95 --rejilla MNT_MEDIO=1,2 \
+#       --fijar MOTOR=vectorizado --concurrentes 4 --salida resultados.csv
+#   python FlotaCLI.py escenarios.json --requisitos semana.csv   (7 x 24 requisitos, un perfil por día de la semana)
+#   python FlotaCLI.py escenarios.json --instrumentacion medidas/ --perfilado cprofile
+#   python FlotaCLI.py escenarios.json --puntos-control puntos/   (al repetirlo, reanuda los escenarios interrumpidos)
+#   python FlotaCLI.py escenarios.json --trazas trazas/   (trazas diarias, un directorio por escenario; ver FlotaTraza)
+#   python FlotaCLI.py escenarios.json --distribuido 0.0.0.0:5800 --concurrentes 4   (ver FlotaDistribuido)
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+
+COLUMNAS_RESULTADO = {
+    "trenes_optimos": "int", "nivel_optimo": "float", "ic_inf": "float", "ic_sup": "float",
+    "reserva_analitica": "int", "nivel_analitico": "float", "puntos_evaluados": "int",
+    "replicas_totales": "int", "prob_anio_incumple": "float", "horas_p95": "int", "peor_dia_max": "int",
+    "semilla": "str", "detenido": "bool", "duracion_s": "float", "error": "str",
+}
+
+
+def _valor(texto):
+    # Los valores de la línea de órdenes se interpretan como JSON (números, listas, true/false, null) y, si no lo
+    # son, como cadenas: MOTOR=vectorizado equivale a MOTOR="vectorizado"
+    try:
+        return json.loads(texto)
+    except ValueError:
+        return texto
+
+
+def _asignacion(texto):
+    clave, separador, valor = texto.partition("=")
+    if not separador or not clave:
+        raise argparse.ArgumentTypeError(f"se esperaba CLAVE=VALOR: {texto!r}")
+    return clave.strip(), valor.strip()
+
+
+def _valores_rejilla(texto):
+    # Una lista JSON completa permite valores que contienen comas: LISTA_MNT=[[1,2],[1,2,3]]
+    valor = _valor(texto)
+    if isinstance(valor, list): return valor
+    return [_valor(parte.strip()) for parte in texto.split(",")]
+
+
+def cargar_escenarios(ruta):
+    with open(ruta, encoding="utf-8") as fichero:
+        if ruta.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit(f"Se necesita PyYAML para leer {ruta} (pip install pyyaml).")
+            contenido = yaml.safe_load(fichero)
+        else:
+            contenido = json.load(fichero)
+    # Formatos admitidos: un escenario, una lista de escenarios, o {"base": {...}, "escenarios": [...]}
+    base = {}
+    if isinstance(contenido, dict) and "escenarios" in contenido:
+        base = contenido.get("base") or {}
+        contenido = contenido["escenarios"]
+    if isinstance(contenido, dict): contenido = [contenido]
+    nombre_fichero = os.path.splitext(os.path.basename(ruta))[0]
+    escenarios = []
+    for i, escenario in enumerate(contenido):
+        escenario = dict(base, **escenario)
+        nombre = str(escenario.pop("nombre", f"{nombre_fichero}[{i}]"))
+        escenarios.append((nombre, escenario))
+    return escenarios
+
+
+def construir_escenarios(rutas, rejilla, fijos):
+    escenarios = []
+    for ruta in rutas: escenarios.extend(cargar_escenarios(ruta))
+    if not escenarios: escenarios = [("base", {})]
+    claves = [clave for clave, _ in rejilla]
+    combinaciones = list(itertools.product(*[valores for _, valores in rejilla]))
+    resultado = []
+    for nombre, escenario in escenarios:
+        for combinacion in combinaciones:
+            variacion = dict(zip(claves, combinacion))
+            sufijo = ",".join(f"{k}={json.dumps(v)}" for k, v in variacion.items())
+            resultado.append((f"{nombre}|{sufijo}" if sufijo else nombre, {**escenario, **variacion, **fijos}))
+    return resultado
+
+
+def _nombre_fichero(directorio, indice, nombre, extension):
+    return os.path.join(directorio, f"{indice:04d}_{re.sub(r'[^0-9A-Za-z.=-]+', '_', nombre)[:80]}{extension}")
+
+
+def ejecutar_escenario(nombre, cambios, directorio_instrumentacion=None, indice=0, directorio_puntos_control=None,
+                       stop_event=None):
+    # Se ejecuta en un proceso hijo (o en un hilo, en modo distribuido): el simulador se importa aquí para no
+    # cargarlo en el arranque del CLI
+    import threading
+
+    import FlotaReserva as sim
+
+    params = {**sim.default_params, **cambios}
+    if directorio_puntos_control:
+        os.makedirs(directorio_puntos_control, exist_ok=True)
+        params["PUNTO_CONTROL"] = _nombre_fichero(directorio_puntos_control, indice, nombre, ".npz")
+    inicio = time.perf_counter()
+    fila = {"escenario": nombre, **params}
+    try:
+        results = sim.run_full_analysis(params, stop_event or threading.Event())
+    except Exception as e:
+        fila.update(error=f"{type(e).__name__}: {e}", duracion_s=time.perf_counter() - inicio)
+        return fila
+    history = results.get("plot_history", [])
+    optimo = next((h for h in history if h[0] == results["trenes_optimos"]), None)
+    analitica = results.get("estimacion_analitica") or {}
+    fila.update(trenes_optimos=results["trenes_optimos"], puntos_evaluados=len(history),
+                replicas_totales=sum(h[4] for h in history), semilla=results.get("semilla"),
+                reserva_analitica=analitica.get("trenes"), nivel_analitico=analitica.get("nivel"),
+                detenido=results["stopped"], duracion_s=time.perf_counter() - inicio, error="")
+    if optimo is not None: fila.update(nivel_optimo=optimo[1], ic_inf=optimo[2], ic_sup=optimo[3])
+    distribucion = (results.get("distribuciones") or {}).get(results["trenes_optimos"])
+    if distribucion is not None:
+        fila.update(prob_anio_incumple=distribucion["prob_incumplir"],
+                    horas_p95=distribucion["cuantiles_horas"]["p95"], peor_dia_max=distribucion["peor_dia_max"])
+    if directorio_instrumentacion:
+        _volcar_instrumentacion(directorio_instrumentacion, indice, nombre, params, results)
+    return fila
+
+
+def _volcar_instrumentacion(directorio, indice, nombre, params, results):
+    # Un JSON por escenario con los tiempos por fase, los contadores por reserva y el informe del perfilador
+    os.makedirs(directorio, exist_ok=True)
+    ruta = _nombre_fichero(directorio, indice, nombre, ".json")
+    with open(ruta, "w", encoding="utf-8") as fichero:
+        json.dump({"escenario": nombre, "params": params, "instrumentacion": results.get("instrumentacion"),
+                   "perfil": results.get("perfil"), "rendimiento_procesos": results.get("rendimiento_procesos"),
+                   "trenes_optimos": results["trenes_optimos"]}, fichero, indent=2, default=str)
+
+
+def _tipo_columna(valores):
+    if all(isinstance(v, bool) for v in valores): return "bool"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in valores): return "int"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in valores): return "float"
+    return "str"
+
+
+def _celda(valor, tipo):
+    if valor is None: return None
+    if tipo == "str": return valor if isinstance(valor, str) else json.dumps(valor)
+    return {"int": int, "float": float, "bool": bool}[tipo](valor)
+
+
+class EscritorCSV:
+    def __init__(self, ruta, columnas):
+        self.fichero = sys.stdout if ruta == "-" else open(ruta, "w", newline="", encoding="utf-8")
+        self.columnas = columnas
+        self.escritor = csv.DictWriter(self.fichero, fieldnames=list(columnas))
+        self.escritor.writeheader()
+
+    def escribir(self, fila):
+        self.escritor.writerow({k: _celda(fila.get(k), tipo) for k, tipo in self.columnas.items()})
+        self.fichero.flush()
+
+    def cerrar(self):
+        if self.fichero is not sys.stdout: self.fichero.close()
+
+
+class EscritorParquet:
+    # Parquet escribe por grupos de filas: se acumulan `lote` escenarios antes de volcarlos al fichero
+    def __init__(self, ruta, columnas, lote=16):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Se necesita pyarrow para escribir Parquet (pip install pyarrow).")
+        tipos = {"int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(), "str": pa.string()}
+        self.pa = pa
+        self.columnas = columnas
+        self.esquema = pa.schema([(k, tipos[tipo]) for k, tipo in columnas.items()])
+        self.escritor = pq.ParquetWriter(ruta, self.esquema)
+        self.lote = lote
+        self.pendientes = []
+
+    def escribir(self, fila):
+        self.pendientes.append({k: _celda(fila.get(k), tipo) for k, tipo in self.columnas.items()})
+        if len(self.pendientes) >= self.lote: self._volcar()
+
+    def _volcar(self):
+        if not self.pendientes: return
+        self.escritor.write_table(self.pa.Table.from_pylist(self.pendientes, schema=self.esquema))
+        self.pendientes = []
+
+    def cerrar(self):
+        self._volcar()
+        self.escritor.close()
+
+
+def _columnas(escenarios, claves_por_defecto, default_params):
+    claves = list(claves_por_defecto)
+    for _, cambios in escenarios:
+        claves.extend(k for k in cambios if k not in claves)
+    columnas = {"escenario": "str"}
+    for clave in claves:
+        columnas[clave] = _tipo_columna([cambios.get(clave, default_params.get(clave)) for _, cambios in escenarios])
+    columnas.update(COLUMNAS_RESULTADO)
+    return columnas
+
+
+def _iterar_resultados(escenarios, concurrentes, directorio_instrumentacion=None, directorio_puntos_control=None,
+                       en_hilos=False):
+    # en_hilos: los escenarios comparten el coordinador distribuido del proceso y solo esperan a sus trabajadores
+    if concurrentes <= 1:
+        for i, (nombre, cambios) in enumerate(escenarios):
+            yield ejecutar_escenario(nombre, cambios, directorio_instrumentacion, i, directorio_puntos_control)
+        return
+    import concurrent.futures
+    import multiprocessing
+    import threading
+
+    stop_event = None
+    if en_hilos:
+        stop_event = threading.Event()
+        ejecutor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrentes)
+    else:
+        ejecutor = concurrent.futures.ProcessPoolExecutor(max_workers=concurrentes,
+                                                          mp_context=multiprocessing.get_context("spawn"))
+    with ejecutor:
+        futuros = [ejecutor.submit(ejecutar_escenario, nombre, cambios, directorio_instrumentacion, i,
+                                   directorio_puntos_control, stop_event)
+                   for i, (nombre, cambios) in enumerate(escenarios)]
+        try:
+            for futuro in concurrent.futures.as_completed(futuros):
+                yield futuro.result()
+        finally:
+            for futuro in futuros: futuro.cancel()
+            if stop_event is not None: stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ejecución por lotes del simulador de flota, sin interfaz gráfica.")
+    parser.add_argument("escenarios", nargs="*", help="Ficheros de escenarios (.json, .yaml o .yml).")
+    parser.add_argument("--rejilla", type=_asignacion, action="append", default=[], metavar="CLAVE=V1,V2,...",
+                        help="Valores de un parámetro a recorrer; varias rejillas se combinan en producto cartesiano.")
+    parser.add_argument("--fijar", type=_asignacion, action="append", default=[], metavar="CLAVE=VALOR",
+                        help="Fija un parámetro en todos los escenarios.")
+    parser.add_argument("--requisitos", metavar="FICHERO",
+                        help="Requisitos de trenes por hora para todos los escenarios: 24 valores o una matriz de "
+                             "perfiles x 24 (7 x 24 semanal, 365 x 24 estacional) en .csv, .txt, .json o .npy.")
+    parser.add_argument("--salida", default="-",
+                        help="Fichero .csv o .parquet de resultados (por defecto CSV por la salida estándar).")
+    parser.add_argument("--concurrentes", type=int, default=1,
+                        help="Escenarios simulados a la vez (0 = uno por núcleo).")
+    parser.add_argument("--lote", type=int, default=16, help="Filas por grupo de filas Parquet.")
+    parser.add_argument("--instrumentacion", metavar="DIRECTORIO",
+                        help="Mide tiempos por fase y contadores y los vuelca en un JSON por escenario.")
+    parser.add_argument("--perfilado", choices=["cprofile", "muestreo"],
+                        help="Añade al JSON de instrumentación el informe del perfilador indicado.")
+    parser.add_argument("--puntos-control", metavar="DIRECTORIO",
+                        help="Guarda un punto de control por escenario; al repetir el lote se reanudan los escenarios "
+                             "interrumpidos y los terminados no se vuelven a simular.")
+    parser.add_argument("--trazas", metavar="DIRECTORIO",
+                        help="Escribe la traza diaria del estado de la flota de cada escenario en un subdirectorio "
+                             "(ver FlotaTraza).")
+    parser.add_argument("--distribuido", metavar="HOST:PUERTO",
+                        help="Reparte los bloques de réplicas entre trabajadores de FlotaDistribuido conectados a "
+                             "esta dirección; los escenarios concurrentes se ejecutan en hilos.")
+    parser.add_argument("--trabajadores-locales", type=int, default=0, metavar="N",
+                        help="Con --distribuido, lanza N trabajadores en esta máquina.")
+    args = parser.parse_args(argv)
+
+    import FlotaReserva as sim
+
+    for clave, _ in args.rejilla + args.fijar:
+        if clave not in sim.default_params: parser.error(f"parámetro desconocido: {clave}")
+    rejilla = [(clave, _valores_rejilla(valor)) for clave, valor in args.rejilla]
+    fijos = {clave: _valor(valor) for clave, valor in args.fijar}
+    if args.perfilado and not args.instrumentacion: parser.error("--perfilado requiere --instrumentacion")
+    if args.requisitos:
+        try:
+            fijos["REQUISITOS_TRENES_HORA"] = sim.cargar_requisitos(args.requisitos)
+        except (OSError, ValueError) as e:
+            parser.error(f"--requisitos: {e}")
+    if args.instrumentacion: fijos["INSTRUMENTACION"] = True
+    if args.perfilado: fijos["PERFILADO"] = args.perfilado
+    if args.trabajadores_locales and not args.distribuido:
+        parser.error("--trabajadores-locales requiere --distribuido")
+    if args.distribuido: fijos["DISTRIBUIDO"] = args.distribuido
+    escenarios = construir_escenarios(args.escenarios, rejilla, fijos)
+    # Las claves de los ficheros se comprueban como las de --rejilla y --fijar: una errata no debe simular con el
+    # valor por defecto
+    for nombre, cambios in escenarios:
+        desconocidos = sorted(set(cambios) - set(sim.default_params))
+        if desconocidos: parser.error(f"escenario {nombre}: parámetros desconocidos: {', '.join(desconocidos)}")
+    if args.trazas:
+        escenarios = [(nombre, dict(cambios, TRAZA=_nombre_fichero(args.trazas, i, nombre, "")))
+                      for i, (nombre, cambios) in enumerate(escenarios)]
+    concurrentes = args.concurrentes or os.cpu_count() or 1
+
+    columnas = _columnas(escenarios, sim.default_params, sim.default_params)
+    if args.salida.lower().endswith(".parquet"):
+        escritor = EscritorParquet(args.salida, columnas, args.lote)
+    else:
+        escritor = EscritorCSV(args.salida, columnas)
+    errores = 0
+    inicio = time.perf_counter()
+    # El coordinador se mantiene abierto durante todo el lote para que los trabajadores no se despidan entre
+    # escenarios
+    coordinador = trabajadores = None
+    if args.distribuido:
+        import FlotaDistribuido
+        coordinador = FlotaDistribuido.coordinador(args.distribuido)
+        trabajadores = FlotaDistribuido.lanzar_trabajadores_locales(coordinador, args.trabajadores_locales)
+        host, puerto = coordinador.direccion
+        print(f"Coordinador distribuido en {host}:{puerto}", file=sys.stderr)
+    try:
+        for i, fila in enumerate(_iterar_resultados(escenarios, concurrentes, args.instrumentacion,
+                                                    args.puntos_control, bool(args.distribuido)), 1):
+            escritor.escribir(fila)
+            if fila.get("error"): errores += 1
+            estado = f"ERROR {fila['error']}" if fila.get("error") else f"{fila['trenes_optimos']} trenes de reserva"
+            print(f"[{i}/{len(escenarios)}] {fila['escenario']}: {estado} ({fila['duracion_s']:.1f} s)",
+                  file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Ejecución interrumpida por el usuario.", file=sys.stderr)
+        return 130
+    finally:
+        escritor.cerrar()
+        if coordinador is not None:
+            FlotaDistribuido.soltar(coordinador)
+            for trabajador in trabajadores: trabajador.wait()
+    print(f"{len(escenarios)} escenarios en {time.perf_counter() - inicio:.1f} s, {errores} con errores.",
+          file=sys.stderr)
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# FlotaCache.py
+# Caché persistente de resultados de simulación, direccionada por contenido.
+# Cada punto (una reserva o una ventana de reservas) se guarda bajo el hash de los parámetros que influyen en el
+# resultado, la semilla y la versión del motor, de modo que dos ejecuciones con entradas idénticas comparten
+# resultados. Se almacena en SQLite con expulsión LRU cuando se supera el tamaño máximo.
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+DIRECTORIO_POR_DEFECTO = os.path.join(os.path.expanduser("~"), ".cache", "FlotaReserva")
+TAMANO_MAX_POR_DEFECTO_MB = 256
+
+# Parámetros que no cambian las horas fallidas simuladas y por tanto no forman parte de la clave
+CLAVES_SIN_EFECTO = {"NUM_PROCESOS", "MODO_BUSQUEDA", "VENTANA_CRN",
+                     "CACHE", "DIRECTORIO_CACHE", "TAMANO_MAX_CACHE_MB", "INSTRUMENTACION", "PERFILADO",
+                     "PUNTO_CONTROL", "INTERVALO_PUNTO_CONTROL", "DISTRIBUIDO", "TRAZA"}
+
+
+def _canonico(valor):
+    # 2 y 2.0 producen la misma simulación: los reales enteros se normalizan a int
+    if hasattr(valor, "tolist"): valor = valor.tolist()
+    if isinstance(valor, dict): return {str(k): _canonico(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)): return [_canonico(v) for v in valor]
+    if isinstance(valor, float) and valor.is_integer(): return int(valor)
+    return valor
+
+
+def clave_resultado(params, tipo, reservas, version_motor):
+    contenido = {k: v for k, v in params.items() if k not in CLAVES_SIN_EFECTO}
+    texto = json.dumps({"params": _canonico(contenido), "tipo": tipo, "reservas": _canonico(reservas),
+                        "version": version_motor}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class CacheResultados:
+    def __init__(self, directorio=None, tamano_max_mb=TAMANO_MAX_POR_DEFECTO_MB):
+        self.directorio = directorio or DIRECTORIO_POR_DEFECTO
+        self.tamano_max = int(tamano_max_mb * 1024 * 1024)
+        os.makedirs(self.directorio, exist_ok=True)
+        self.conexion = sqlite3.connect(os.path.join(self.directorio, "resultados.sqlite"))
+        self.conexion.execute("CREATE TABLE IF NOT EXISTS puntos (clave TEXT PRIMARY KEY, datos BLOB NOT NULL, "
+                              "tamano INTEGER NOT NULL, creado REAL NOT NULL, accedido REAL NOT NULL)")
+        self.conexion.execute("CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER)")
+        self.conexion.commit()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _contar(self, nombre):
+        self.conexion.execute("INSERT INTO contadores VALUES (?, 1) "
+                              "ON CONFLICT(nombre) DO UPDATE SET valor = valor + 1", (nombre,))
+
+    def obtener(self, clave, contar=True):
+        # contar=False para los datos que acompañan a un punto ya contado (por ejemplo, su distribución)
+        fila = self.conexion.execute("SELECT datos FROM puntos WHERE clave = ?", (clave,)).fetchone()
+        if fila is None:
+            if contar:
+                self.fallos += 1
+                self._contar("fallos")
+                self.conexion.commit()
+            return None
+        if contar:
+            self.aciertos += 1
+            self._contar("aciertos")
+        self.conexion.execute("UPDATE puntos SET accedido = ? WHERE clave = ?", (time.time(), clave))
+        self.conexion.commit()
+        return np.load(io.BytesIO(fila[0]), allow_pickle=False)
+
+    def guardar(self, clave, horas_fallidas):
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(horas_fallidas), allow_pickle=False)
+        datos = buffer.getvalue()
+        ahora = time.time()
+        self.conexion.execute("INSERT OR REPLACE INTO puntos VALUES (?, ?, ?, ?, ?)",
+                              (clave, datos, len(datos), ahora, ahora))
+        self._expulsar()
+        self.conexion.commit()
+
+    def _expulsar(self):
+        # LRU: se eliminan las entradas menos usadas recientemente hasta volver bajo el tamaño máximo
+        total = self.conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM puntos").fetchone()[0]
+        if total <= self.tamano_max: return
+        for clave, tamano in self.conexion.execute("SELECT clave, tamano FROM puntos ORDER BY accedido").fetchall():
+            if total <= self.tamano_max: break
+            self.conexion.execute("DELETE FROM puntos WHERE clave = ?", (clave,))
+            total -= tamano
+
+    def invalidar(self):
+        self.conexion.execute("DELETE FROM puntos")
+        self.conexion.execute("DELETE FROM contadores")
+        self.conexion.commit()
+        self.conexion.execute("VACUUM")
+
+    def estadisticas(self):
+        entradas, total = self.conexion.execute("SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM puntos").fetchone()
+        contadores = dict(self.conexion.execute("SELECT nombre, valor FROM contadores").fetchall())
+        return {"directorio": self.directorio, "entradas": entradas, "bytes": total, "bytes_max": self.tamano_max,
+                "aciertos_totales": contadores.get("aciertos", 0), "fallos_totales": contadores.get("fallos", 0),
+                "aciertos_sesion": self.aciertos, "fallos_sesion": self.fallos}
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gestión de la caché de resultados del simulador de flota.")
+    parser.add_argument("accion", choices=["estadisticas", "invalidar"])
+    parser.add_argument("--directorio", default=None,
+                        help=f"Directorio de la caché (por defecto {DIRECTORIO_POR_DEFECTO}).")
+    args = parser.parse_args(argv)
+    cache = CacheResultados(args.directorio)
+    try:
+        if args.accion == "invalidar":
+            cache.invalidar()
+            print(f"Caché vaciada: {cache.directorio}")
+        else:
+            for nombre, valor in cache.estadisticas().items():
+                print(f"{nombre}: {valor}")
+    finally:
+        cache.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+# FlotaDistribuido.py
+# Ejecución distribuida en varias máquinas. Un coordinador, dentro del proceso que lanza las búsquedas, reparte los
+# bloques de réplicas (escenario x tamaño de reserva x bloque) entre trabajadores conectados por TCP, que ejecutan
+# los mismos núcleos que los procesos locales (_simular_bloque_en_proceso y _simular_curva_en_proceso).
+# Cada bloque lleva su propia semilla derivada (ver bloques_replicas) y la búsqueda consume los bloques en orden,
+# así que el resultado es idéntico, bit a bit, al de una ejecución local, calcule cada bloque el trabajador que lo
+# calcule y termine cuando termine. Si un trabajador se desconecta o deja de enviar latidos durante
+# SILENCIO_MAXIMO segundos, sus bloques vuelven al principio de la cola y los calcula otro.
+# El coordinador es un concurrent.futures.Executor: SimuladorParalelo lo usa en lugar de su ProcessPoolExecutor
+# cuando params["DISTRIBUIDO"] = "host:puerto". Las búsquedas de un mismo proceso con la misma dirección (los
+# escenarios de FlotaCLI --distribuido) comparten coordinador y cola.
+#
+# Protocolo: cada mensaje es una cabecera JSON precedida de su longitud (4 bytes, big endian) y seguida de los
+# arrays que referencia, en binario. No se usa pickle y el trabajador solo ejecuta los núcleos de NUCLEOS, de modo
+# que un mensaje no puede ejecutar código arbitrario en quien lo recibe.
+#
+# Uso:
+#   python FlotaDistribuido.py trabajador coordinador:5800 --procesos 8        (en cada máquina de cálculo)
+#   python FlotaCLI.py escenarios.json --distribuido 0.0.0.0:5800 --concurrentes 4
+#   python FlotaCLI.py escenarios.json --distribuido 127.0.0.1:0 --trabajadores-locales 4   (prueba en local)
+
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+PUERTO_POR_DEFECTO = 5800
+INTERVALO_LATIDO = 5
+SILENCIO_MAXIMO = 30
+# Bloques enviados a cada trabajador antes de que devuelva el anterior, para que no espere a la red entre bloques
+PREBUSQUEDA = 2
+ESPERA_CONEXION = 60
+NUCLEOS = ("_simular_bloque_en_proceso", "_simular_curva_en_proceso")
+
+
+def direccion(texto):
+    # "host:puerto" -> (host, puerto); sin host se escucha en todas las interfaces
+    host, _, puerto = texto.rpartition(":")
+    return host or "0.0.0.0", int(puerto) if puerto else PUERTO_POR_DEFECTO
+
+
+# --- PROTOCOLO ---
+def _codificar(valor, arrays):
+    if isinstance(valor, np.ndarray):
+        arrays.append(np.ascontiguousarray(valor))
+        return {"__array__": len(arrays) - 1}
+    if isinstance(valor, np.random.SeedSequence):
+        return {"__semilla__": valor.entropy, "spawn_key": list(valor.spawn_key)}
+    if isinstance(valor, np.generic): return valor.item()
+    if isinstance(valor, dict): return {k: _codificar(v, arrays) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)): return [_codificar(v, arrays) for v in valor]
+    return valor
+
+
+def _decodificar(valor, arrays):
+    if isinstance(valor, dict):
+        if "__array__" in valor: return arrays[valor["__array__"]]
+        if "__semilla__" in valor: return np.random.SeedSequence(valor["__semilla__"], spawn_key=valor["spawn_key"])
+        return {k: _decodificar(v, arrays) for k, v in valor.items()}
+    if isinstance(valor, list): return [_decodificar(v, arrays) for v in valor]
+    return valor
+
+
+def enviar_mensaje(conexion, mensaje):
+    arrays = []
+    contenido = _codificar(mensaje, arrays)
+    cabecera = json.dumps({"mensaje": contenido, "arrays": [[a.dtype.str, list(a.shape)] for a in arrays]},
+                          separators=(",", ":")).encode("utf-8")
+    conexion.sendall(b"".join([struct.pack("!I", len(cabecera)), cabecera] + [a.tobytes() for a in arrays]))
+
+
+def _leer(conexion, tamano):
+    datos = bytearray(tamano)
+    vista = memoryview(datos)
+    leido = 0
+    while leido < tamano:
+        n = conexion.recv_into(vista[leido:])
+        if n == 0: raise ConnectionError("conexión cerrada")
+        leido += n
+    return datos
+
+
+def recibir_mensaje(conexion):
+    tamano, = struct.unpack("!I", _leer(conexion, 4))
+    cabecera = json.loads(_leer(conexion, tamano).decode("utf-8"))
+    arrays = []
+    for tipo, forma in cabecera["arrays"]:
+        dtype = np.dtype(tipo)
+        arrays.append(np.frombuffer(_leer(conexion, dtype.itemsize * int(np.prod(forma))), dtype).reshape(forma))
+    return _decodificar(cabecera["mensaje"], arrays)
+
+
+# --- COORDINADOR ---
+class _Tarea:
+    def __init__(self, futuro, funcion, argumentos):
+        self.futuro = futuro
+        self.funcion = funcion
+        self.argumentos = argumentos
+        self.trabajador = None
+
+
+class _Trabajador:
+    def __init__(self, conexion, nombre):
+        self.conexion = conexion
+        self.nombre = nombre
+        self.en_curso = set()
+        self._cerrojo = threading.Lock()
+
+    def enviar(self, mensaje):
+        with self._cerrojo: enviar_mensaje(self.conexion, mensaje)
+
+
+class Coordinador(concurrent.futures.Executor):
+    # Cola FIFO de tareas (un bloque cada una) que se asignan al trabajador con menos bloques en curso. Los futuros
+    # quedan pendientes hasta que llega el resultado, así que cancel() funciona también con el bloque ya enviado:
+    # se avisa al trabajador para que lo abandone y deja sitio a otro.
+    def __init__(self, direccion_escucha):
+        self.servidor = socket.create_server(direccion_escucha)
+        self.direccion = self.servidor.getsockname()[:2]
+        self._condicion = threading.Condition()
+        self._cola = collections.deque()
+        self._tareas = {}
+        self._trabajadores = []
+        self._ids = itertools.count()
+        self._cerrado = False
+        self.reenviadas = 0
+        threading.Thread(target=self._aceptar, name="coordinador-aceptar", daemon=True).start()
+        threading.Thread(target=self._repartir, name="coordinador-repartir", daemon=True).start()
+
+    def capacidad(self):
+        with self._condicion: return len(self._trabajadores)
+
+    def trabajadores(self):
+        with self._condicion: return [trabajador.nombre for trabajador in self._trabajadores]
+
+    def submit(self, fn, /, *args, **kwargs):
+        if fn.__name__ not in NUCLEOS or kwargs: raise ValueError(f"{fn.__name__} no se puede ejecutar a distancia")
+        futuro = concurrent.futures.Future()
+        with self._condicion:
+            if self._cerrado: raise RuntimeError("el coordinador está cerrado")
+            id_tarea = next(self._ids)
+            self._tareas[id_tarea] = _Tarea(futuro, fn.__name__, args)
+            self._cola.append(id_tarea)
+            self._condicion.notify_all()
+        futuro.add_done_callback(lambda f, i=id_tarea: self._al_terminar(i, f))
+        return futuro
+
+    def _al_terminar(self, id_tarea, futuro):
+        if not futuro.cancelled(): return
+        with self._condicion:
+            tarea = self._tareas.pop(id_tarea, None)
+            trabajador = tarea.trabajador if tarea is not None else None
+            if trabajador is not None:
+                trabajador.en_curso.discard(id_tarea)
+                self._condicion.notify_all()
+        if trabajador is not None:
+            try:
+                trabajador.enviar({"tipo": "cancelar", "id": id_tarea})
+            except OSError:
+                self._perder(trabajador)
+
+    def _aceptar(self):
+        while True:
+            try:
+                conexion, _ = self.servidor.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._atender, args=(conexion,), name="coordinador-trabajador",
+                             daemon=True).start()
+
+    def _atender(self, conexion):
+        conexion.settimeout(SILENCIO_MAXIMO)
+        conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        trabajador = None
+        try:
+            saludo = recibir_mensaje(conexion)
+            if saludo.get("tipo") != "hola": return
+            trabajador = _Trabajador(conexion, saludo["nombre"])
+            with self._condicion:
+                if self._cerrado: return
+                self._trabajadores.append(trabajador)
+                self._condicion.notify_all()
+            while True:
+                mensaje = recibir_mensaje(conexion)
+                if mensaje["tipo"] in ("resultado", "error"): self._resolver(trabajador, mensaje)
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            if trabajador is not None:
+                self._perder(trabajador)
+            else:
+                conexion.close()
+
+    def _resolver(self, trabajador, mensaje):
+        with self._condicion:
+            tarea = self._tareas.get(mensaje["id"])
+            if tarea is None or tarea.trabajador is not trabajador: return
+            del self._tareas[mensaje["id"]]
+            trabajador.en_curso.discard(mensaje["id"])
+            self._condicion.notify_all()
+        if not tarea.futuro.set_running_or_notify_cancel(): return
+        if mensaje["tipo"] == "resultado":
+            tarea.futuro.set_result(tuple(mensaje["resultado"]))
+        else:
+            tarea.futuro.set_exception(RuntimeError(f"Trabajador {trabajador.nombre}: {mensaje['error']}"))
+
+    def _perder(self, trabajador):
+        # Los bloques en curso del trabajador vuelven al principio de la cola, en su orden
+        with self._condicion:
+            if trabajador not in self._trabajadores: return
+            self._trabajadores.remove(trabajador)
+            for id_tarea in sorted(trabajador.en_curso, reverse=True):
+                tarea = self._tareas.get(id_tarea)
+                if tarea is None: continue
+                tarea.trabajador = None
+                self._cola.appendleft(id_tarea)
+                self.reenviadas += 1
+            trabajador.en_curso.clear()
+            self._condicion.notify_all()
+        try:
+            trabajador.conexion.close()
+        except OSError:
+            pass
+
+    def _asignacion(self):
+        libres = [t for t in self._trabajadores if len(t.en_curso) < PREBUSQUEDA]
+        if not libres: return None
+        while self._cola:
+            id_tarea = self._cola.popleft()
+            tarea = self._tareas.get(id_tarea)
+            if tarea is None or tarea.futuro.cancelled(): continue
+            trabajador = min(libres, key=lambda t: len(t.en_curso))
+            tarea.trabajador = trabajador
+            trabajador.en_curso.add(id_tarea)
+            return trabajador, id_tarea, tarea
+        return None
+
+    def _repartir(self):
+        while True:
+            with self._condicion:
+                asignacion = self._asignacion()
+                while asignacion is None:
+                    if self._cerrado: return
+                    self._condicion.wait()
+                    asignacion = self._asignacion()
+            trabajador, id_tarea, tarea = asignacion
+            try:
+                trabajador.enviar({"tipo": "tarea", "id": id_tarea, "funcion": tarea.funcion,
+                                   "argumentos": tarea.argumentos})
+            except OSError:
+                self._perder(trabajador)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        # Cancela los bloques pendientes y despide a los trabajadores
+        with self._condicion:
+            if self._cerrado: return
+            self._cerrado = True
+            tareas = list(self._tareas.values())
+            trabajadores = list(self._trabajadores)
+            self._condicion.notify_all()
+        for tarea in tareas: tarea.futuro.cancel()
+        for trabajador in trabajadores:
+            try:
+                trabajador.enviar({"tipo": "fin"})
+            except OSError:
+                pass
+            self._perder(trabajador)
+        self.servidor.close()
+
+
+_coordinadores = {}
+_cerrojo_coordinadores = threading.Lock()
+
+
+def coordinador(texto_direccion):
+    # Coordinador compartido por las búsquedas del proceso que usan la misma dirección; soltar() lo cierra cuando
+    # ninguna lo usa
+    with _cerrojo_coordinadores:
+        entrada = _coordinadores.get(texto_direccion)
+        if entrada is None: entrada = _coordinadores[texto_direccion] = [Coordinador(direccion(texto_direccion)), 0]
+        entrada[1] += 1
+        return entrada[0]
+
+
+def soltar(coordinador_usado):
+    with _cerrojo_coordinadores:
+        for texto_direccion, entrada in list(_coordinadores.items()):
+            if entrada[0] is not coordinador_usado: continue
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del _coordinadores[texto_direccion]
+                coordinador_usado.shutdown()
+
+
+def lanzar_trabajadores_locales(coordinador_usado, numero):
+    # Trabajadores en subprocesos de esta máquina (pruebas y máquinas sin cola de trabajos)
+    host, puerto = coordinador_usado.direccion
+    if host in ("0.0.0.0", "::", ""): host = "127.0.0.1"
+    return [subprocess.Popen([sys.executable, os.path.abspath(__file__), "trabajador", f"{host}:{puerto}"])
+            for _ in range(numero)]
+
+
+# --- TRABAJADOR ---
+def _conectar(direccion_coordinador, espera):
+    limite = time.monotonic() + espera
+    while True:
+        try:
+            return socket.create_connection(direccion_coordinador, timeout=SILENCIO_MAXIMO)
+        except OSError:
+            if time.monotonic() >= limite: return None
+            time.sleep(0.5)
+
+
+def _sesion(conexion, sim):
+    # Atiende a un coordinador hasta que lo despide (True) o se pierde la conexión (False). Un hilo lee los mensajes
+    # y otro envía los latidos; el hilo principal ejecuta los bloques de uno en uno.
+    nombre = f"{socket.gethostname()}:{os.getpid()}"
+    conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    conexion.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    conexion.settimeout(None)
+    cerrojo_envio = threading.Lock()
+    cerrojo = threading.Lock()
+    tareas = queue.Queue()
+    cancelados = set()
+    actual = {"id": None, "evento": None}
+    despedido = threading.Event()
+    terminado = threading.Event()
+
+    def enviar(mensaje):
+        with cerrojo_envio: enviar_mensaje(conexion, mensaje)
+
+    def leer():
+        try:
+            while True:
+                mensaje = recibir_mensaje(conexion)
+                if mensaje["tipo"] == "tarea":
+                    tareas.put(mensaje)
+                elif mensaje["tipo"] == "cancelar":
+                    with cerrojo:
+                        if actual["id"] == mensaje["id"]:
+                            actual["evento"].set()
+                        else:
+                            cancelados.add(mensaje["id"])
+                elif mensaje["tipo"] == "fin":
+                    despedido.set()
+                    return
+        except (OSError, ValueError, KeyError):
+            return
+        finally:
+            terminado.set()
+            tareas.put(None)
+
+    def latir():
+        while not terminado.wait(INTERVALO_LATIDO):
+            try:
+                enviar({"tipo": "latido"})
+            except OSError:
+                return
+
+    enviar({"tipo": "hola", "nombre": nombre})
+    threading.Thread(target=leer, daemon=True).start()
+    threading.Thread(target=latir, daemon=True).start()
+    try:
+        while True:
+            tarea = tareas.get()
+            if tarea is None: break
+            with cerrojo:
+                if tarea["id"] in cancelados:
+                    cancelados.discard(tarea["id"])
+                    continue
+                evento = threading.Event()
+                actual.update(id=tarea["id"], evento=evento)
+            try:
+                # El coordinador ya filtra lo que envía, pero el trabajador no ejecuta nada fuera de NUCLEOS
+                if tarea["funcion"] not in NUCLEOS:
+                    raise ValueError(f"{tarea['funcion']} no se puede ejecutar a distancia")
+                resultado = list(getattr(sim, tarea["funcion"])(*tarea["argumentos"], evento_parada=evento))
+                resultado[1] = nombre
+                respuesta = {"tipo": "resultado", "id": tarea["id"], "resultado": resultado}
+            except Exception as e:
+                respuesta = {"tipo": "error", "id": tarea["id"], "error": f"{type(e).__name__}: {e}"}
+            with cerrojo:
+                actual.update(id=None, evento=None)
+            if evento.is_set(): continue
+            try:
+                enviar(respuesta)
+            except OSError:
+                break
+    finally:
+        terminado.set()
+        conexion.close()
+    return despedido.is_set()
+
+
+def trabajar(texto_direccion, espera=ESPERA_CONEXION, persistente=False):
+    # Con persistente=True el trabajador vuelve a esperar a un coordinador cuando termina una sesión
+    import FlotaReserva as sim
+
+    direccion_coordinador = direccion(texto_direccion)
+    while True:
+        conexion = _conectar(direccion_coordinador, espera)
+        if conexion is None:
+            print(f"No se pudo conectar con el coordinador {texto_direccion}.", file=sys.stderr)
+            return 1
+        despedido = _sesion(conexion, sim)
+        if not persistente: return 0 if despedido else 1
+
+
+def _trabajar_en_proceso(texto_direccion, espera, persistente):
+    sys.exit(trabajar(texto_direccion, espera, persistente))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ejecución distribuida del simulador de flota.")
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+    trabajador = subparsers.add_parser("trabajador", help="Calcula bloques de réplicas para un coordinador.")
+    trabajador.add_argument("coordinador", help="Dirección del coordinador (host:puerto).")
+    trabajador.add_argument("--procesos", type=int, default=1,
+                            help="Trabajadores en esta máquina, uno por proceso (0 = uno por núcleo).")
+    trabajador.add_argument("--espera", type=float, default=ESPERA_CONEXION,
+                            help="Segundos esperando a que el coordinador acepte la conexión.")
+    trabajador.add_argument("--persistente", action="store_true",
+                            help="Al terminar una sesión, espera al siguiente coordinador en lugar de salir.")
+    args = parser.parse_args(argv)
+
+    procesos = args.procesos or os.cpu_count() or 1
+    try:
+        if procesos == 1: return trabajar(args.coordinador, args.espera, args.persistente)
+        contexto = multiprocessing.get_context("spawn")
+        hijos = [contexto.Process(target=_trabajar_en_proceso, args=(args.coordinador, args.espera, args.persistente))
+                 for _ in range(procesos)]
+        for hijo in hijos: hijo.start()
+        for hijo in hijos: hijo.join()
+        return max(hijo.exitcode or 0 for hijo in hijos)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# FlotaJIT.py
+# Núcleo de simulación compilado con Numba (opcional). Recorre las réplicas en paralelo (prange) y, dentro de
+# cada una, los días y los trenes con bucles simples, con la misma semántica que el motor de referencia: avance
+# de los paros, entrada a mantenimiento sin reemplazo entre los disponibles, fallos con riesgo h(1) (ver el motor
+# de eventos) y horas fallidas por la tabla de déficit (perfil del día x disponibles).
+# Cada réplica tiene su propio generador splitmix64 sembrado desde el Generator de NumPy del bloque, así que el
+# resultado no depende del número de hilos. Si Numba no está instalado (o FLOTA_SIN_JIT está definida) las
+# funciones se ejecutan como Python puro y FlotaReserva usa en su lugar el motor vectorizado.
+
+import math
+import os
+import time
+
+import numpy as np
+
+try:
+    if os.environ.get("FLOTA_SIN_JIT"): raise ImportError("desactivado por FLOTA_SIN_JIT")
+    import numba
+    from numba import njit, prange
+except ImportError:
+    numba = None
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]): return args[0]
+        return lambda funcion: funcion
+
+DISPONIBLE = numba is not None
+NUM_CONTADORES = 4  # fallos, días de reparación, entradas a mantenimiento, días de mantenimiento
+
+_DORADO = np.uint64(0x9E3779B97F4A7C15)
+_MEZCLA_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MEZCLA_2 = np.uint64(0x94D049BB133111EB)
+_ESCALA_53 = 1.0 / 9007199254740992.0
+
+
+@njit(cache=True)
+def _uniforme(estado):
+    # splitmix64: devuelve el nuevo estado y un uniforme en [0, 1) con 53 bits
+    estado = estado + _DORADO
+    z = estado
+    z = (z ^ (z >> np.uint64(30))) * _MEZCLA_1
+    z = (z ^ (z >> np.uint64(27))) * _MEZCLA_2
+    z = z ^ (z >> np.uint64(31))
+    return estado, (z >> np.uint64(11)) * _ESCALA_53
+
+
+@njit(cache=True)
+def _weibull_discreta(estado, inv_beta, log_q):
+    # Inversión de la Weibull discreta, como sample_discrete_weibull
+    estado, u = _uniforme(estado)
+    return estado, int(math.ceil((math.log(1.0 - u) / log_q) ** inv_beta))
+
+
+@njit(parallel=True, cache=True)
+def _nucleo(flota_total, dias, semillas, prob_falla, cdf_mnt, lista_mnt, inv_beta_mnt, log_q_mnt, inv_beta_rep,
+            log_q_rep, deficit, horas_fallidas, peor_dia, contadores):
+    for r in prange(len(semillas)):
+        estado = semillas[r]
+        paro = np.zeros(flota_total, dtype=np.int32)  # >0 reparación, <0 mantenimiento, 0 disponible
+        disponibles = np.empty(flota_total, dtype=np.int64)
+        horas = 0
+        peor = 0
+        fallos = 0
+        dias_reparacion = 0
+        entradas_mnt = 0
+        dias_mnt = 0
+        for dia in range(dias):
+            n = 0
+            for i in range(flota_total):
+                if paro[i] > 0:
+                    paro[i] -= 1
+                elif paro[i] < 0:
+                    paro[i] += 1
+                if paro[i] == 0:
+                    disponibles[n] = i
+                    n += 1
+
+            # Mantenimiento: Fisher-Yates parcial sobre los disponibles al inicio del día
+            estado, u = _uniforme(estado)
+            k = 0
+            while k < len(cdf_mnt) - 1 and u >= cdf_mnt[k]: k += 1
+            num_a_mnt = min(lista_mnt[k], n)
+            for j in range(num_a_mnt):
+                estado, u = _uniforme(estado)
+                m = j + int(u * (n - j))
+                tren = disponibles[m]
+                disponibles[m] = disponibles[j]
+                disponibles[j] = tren
+                estado, duracion = _weibull_discreta(estado, inv_beta_mnt, log_q_mnt)
+                paro[tren] = -min(duracion, dias)
+                entradas_mnt += 1
+                dias_mnt += duracion
+
+            # Fallos entre los que siguen operativos
+            operativos = n - num_a_mnt
+            for j in range(num_a_mnt, n):
+                estado, u = _uniforme(estado)
+                if u < prob_falla:
+                    estado, duracion = _weibull_discreta(estado, inv_beta_rep, log_q_rep)
+                    paro[disponibles[j]] = min(duracion, dias)
+                    operativos -= 1
+                    fallos += 1
+                    dias_reparacion += duracion
+            deficit_hoy = deficit[dia % deficit.shape[0], operativos]
+            horas += deficit_hoy
+            peor = max(peor, deficit_hoy)
+        horas_fallidas[r] = horas
+        peor_dia[r] = peor
+        contadores[r, 0] = fallos
+        contadores[r, 1] = dias_reparacion
+        contadores[r, 2] = entradas_mnt
+        contadores[r, 3] = dias_mnt
+
+
+def simular(flota_total, dias, num_replicas, rng, prob_falla, lista_mnt, p_mnt, beta_mnt, eta_mnt, beta_rep, eta_rep,
+            deficit):
+    # Devuelve (horas fallidas por réplica, horas fallidas del peor día de cada réplica, contadores por réplica)
+    semillas = rng.integers(np.iinfo(np.uint64).max, size=num_replicas, dtype=np.uint64, endpoint=True)
+    cdf_mnt = np.cumsum(np.asarray(p_mnt, dtype=np.float64))
+    horas_fallidas = np.zeros(num_replicas, dtype=np.int64)
+    peor_dia = np.zeros(num_replicas, dtype=np.int64)
+    contadores = np.zeros((num_replicas, NUM_CONTADORES), dtype=np.int64)
+    _nucleo(int(flota_total), int(dias), semillas, float(prob_falla), cdf_mnt, np.asarray(lista_mnt, dtype=np.int64),
+            1.0 / beta_mnt, -(1.0 / eta_mnt) ** beta_mnt, 1.0 / beta_rep, -(1.0 / eta_rep) ** beta_rep,
+            np.ascontiguousarray(deficit, dtype=np.int64).reshape(-1, flota_total + 1), horas_fallidas, peor_dia,
+            contadores)
+    return horas_fallidas, peor_dia, contadores
+
+
+_estado = None
+
+
+def preparar():
+    # Compila (o carga de la caché de Numba) el núcleo con una simulación mínima y devuelve qué backend se usa y
+    # cuánto costó el arranque en frío. Se hace una vez por proceso.
+    global _estado
+    if _estado is not None: return _estado
+    if not DISPONIBLE:
+        _estado = {"backend": "numpy", "version": None, "hilos": 1, "tiempo_compilacion": 0.0, "desde_cache": False}
+        return _estado
+    inicio = time.perf_counter()
+    simular(2, 2, 1, np.random.default_rng(0), 0.1, [1], [1.0], 2.0, 1.0, 2.0, 1.0, [0, 0, 0])
+    tiempo = time.perf_counter() - inicio
+    try:
+        desde_cache = sum(_nucleo.stats.cache_hits.values()) > 0
+    except AttributeError:
+        desde_cache = False
+    _estado = {"backend": "numba", "version": numba.__version__, "hilos": numba.get_num_threads(),
+               "tiempo_compilacion": tiempo, "desde_cache": desde_cache}
+    return _estado
@@ -0,0 +1,217 @@
+# FlotaPuntoControl.py
+# Puntos de control de las búsquedas largas. Con PUNTO_CONTROL, la búsqueda guarda en un fichero .npz los puntos
+# ya evaluados (horas fallidas por réplica, distribución, medición y duración), los acumuladores de la reserva o
+# ventana en curso tras cada bloque y el estado de la búsqueda (última reserva, racha de 100%, flota mínima e
+# historial).
+# El fichero se reescribe como mucho cada INTERVALO_PUNTO_CONTROL segundos, al detener la búsqueda, al terminar y si
+# se interrumpe con una excepción, siempre de forma atómica (fichero temporal y os.replace): un corte de luz o un
+# fallo dejan el último punto de control completo.
+# No hace falta guardar el estado de ningún generador: cada bloque tiene su propio flujo, derivado de la semilla y
+# de la clave (reserva, bloque) (ver bloques_replicas), así que basta con la semilla y los bloques ya hechos. Al
+# reanudar, la búsqueda recorre los puntos guardados sin simularlos y sigue con el primer bloque que faltaba: el
+# resultado es idéntico, bit a bit, al de una ejecución sin interrupciones, con cualquier número de procesos.
+#
+# Uso:
+#   python FlotaPuntoControl.py estado busqueda.npz
+#   python FlotaPuntoControl.py reanudar busqueda.npz --procesos 4
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import FlotaCache
+
+FORMATO = 1
+INTERVALO_POR_DEFECTO = 60
+
+
+def _clave(params, version_motor):
+    # Mismos parámetros con efecto en el resultado que la caché; la semilla forma parte de ellos
+    return FlotaCache.clave_resultado(params, "punto_control", None, version_motor)
+
+
+class PuntoControl:
+    def __init__(self, ruta, params, version_motor):
+        self.ruta = ruta
+        self.params = params
+        self.version_motor = version_motor
+        self.clave = _clave(params, version_motor)
+        self.intervalo = params.get("INTERVALO_PUNTO_CONTROL", INTERVALO_POR_DEFECTO)
+        # (tipo, reserva) -> punto terminado; tipo "reserva" o "curva" (la ventana que empieza en `reserva`)
+        self.puntos = {}
+        self.parcial = None
+        self.estado = {}
+        self.completo = False
+        self.pendiente = False
+        self.escrito = None
+        self._ultima_escritura = time.monotonic()
+
+    def punto(self, tipo, reserva):
+        return self.puntos.get((tipo, reserva))
+
+    def parcial_de(self, tipo, reserva):
+        if self.parcial is None or (self.parcial["tipo"], self.parcial["reserva"]) != (tipo, reserva): return None
+        return self.parcial
+
+    def guardar_punto(self, tipo, reserva, horas_fallidas, distribucion, medicion, duracion, desde_cache=False):
+        self.puntos[(tipo, reserva)] = {"horas": horas_fallidas, "distribucion": distribucion, "medicion": medicion,
+                                        "duracion": duracion, "desde_cache": desde_cache}
+        if self.parcial_de(tipo, reserva) is not None: self.parcial = None
+        self._cambio()
+
+    def guardar_parcial(self, tipo, reserva, bloques, horas_fallidas, distribucion, medicion, duracion):
+        # Acumulado tras `bloques` bloques de una reserva (o ventana) que aún no ha terminado
+        self.parcial = {"tipo": tipo, "reserva": reserva, "bloques": bloques, "horas": horas_fallidas,
+                        "distribucion": distribucion, "medicion": medicion, "duracion": duracion}
+        self._cambio()
+
+    def anotar_estado(self, n_reserva, trenes_optimos, racha, historial):
+        self.estado = {"n_reserva": int(n_reserva), "trenes_optimos": int(trenes_optimos), "racha": int(racha),
+                       "historial": [[int(h[0]), float(h[1]), float(h[2]), float(h[3]), int(h[4])] for h in historial]}
+        self.pendiente = True
+
+    def descripcion(self):
+        texto = f"{len(self.puntos)} puntos guardados"
+        if self.parcial is not None:
+            texto += f", {'ventana' if self.parcial['tipo'] == 'curva' else 'reserva'} {self.parcial['reserva']} " \
+                     f"con {self.parcial['bloques']} bloques"
+        return texto
+
+    def _cambio(self):
+        self.pendiente = True
+        if time.monotonic() - self._ultima_escritura >= self.intervalo: self.escribir()
+
+    def terminar(self):
+        self.completo = True
+        self.escribir()
+
+    def cerrar(self):
+        if self.pendiente: self.escribir()
+
+    def escribir(self):
+        arrays, puntos = {}, []
+        for i, ((tipo, reserva), punto) in enumerate(self.puntos.items()):
+            arrays[f"horas_{i}"] = punto["horas"]
+            if punto["distribucion"] is not None: arrays[f"distribucion_{i}"] = punto["distribucion"]
+            puntos.append({"tipo": tipo, "reserva": reserva, "duracion": punto["duracion"],
+                           "desde_cache": punto["desde_cache"], "medicion": punto["medicion"]})
+        parcial = None
+        if self.parcial is not None:
+            arrays["parcial_horas"] = self.parcial["horas"]
+            arrays["parcial_distribucion"] = self.parcial["distribucion"]
+            parcial = {k: v for k, v in self.parcial.items() if k not in ("horas", "distribucion")}
+        metadatos = {"formato": FORMATO, "version_motor": self.version_motor, "clave": self.clave,
+                     "params": self.params, "puntos": puntos, "parcial": parcial, "estado": self.estado,
+                     "completo": self.completo, "escrito": time.time()}
+        directorio = os.path.dirname(os.path.abspath(self.ruta))
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=".punto_control_", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as fichero:
+                np.savez(fichero, metadatos=np.array(json.dumps(metadatos, default=str)), **arrays)
+                fichero.flush()
+                os.fsync(fichero.fileno())
+            os.replace(temporal, self.ruta)
+        except BaseException:
+            if os.path.exists(temporal): os.unlink(temporal)
+            raise
+        self.pendiente = False
+        self.escrito = metadatos["escrito"]
+        self._ultima_escritura = time.monotonic()
+
+
+def cargar(ruta):
+    with np.load(ruta, allow_pickle=False) as fichero:
+        metadatos = json.loads(str(fichero["metadatos"]))
+        if metadatos.get("formato") != FORMATO:
+            raise ValueError(f"{ruta}: formato de punto de control no admitido ({metadatos.get('formato')})")
+        control = PuntoControl(ruta, metadatos["params"], metadatos["version_motor"])
+        control.clave = metadatos["clave"]
+        for i, punto in enumerate(metadatos["puntos"]):
+            distribucion = fichero[f"distribucion_{i}"] if f"distribucion_{i}" in fichero.files else None
+            control.puntos[(punto["tipo"], punto["reserva"])] = {
+                "horas": fichero[f"horas_{i}"], "distribucion": distribucion, "medicion": punto["medicion"],
+                "duracion": punto["duracion"], "desde_cache": punto["desde_cache"]}
+        if metadatos["parcial"] is not None:
+            control.parcial = dict(metadatos["parcial"], horas=fichero["parcial_horas"],
+                                   distribucion=fichero["parcial_distribucion"])
+        control.estado = metadatos["estado"]
+        control.completo = metadatos["completo"]
+        control.escrito = metadatos["escrito"]
+    return control
+
+
+def abrir(params, version_motor):
+    # Punto de control de params["PUNTO_CONTROL"]: el guardado, si existe y corresponde a los mismos parámetros (sin
+    # semilla se adopta la suya), o uno nuevo con la semilla fijada. Las opciones que no cambian el resultado (número
+    # de procesos, caché, intervalo...) son las de esta ejecución.
+    ruta = params["PUNTO_CONTROL"]
+    if not os.path.exists(ruta):
+        if params.get("SEMILLA") is None: params = dict(params, SEMILLA=np.random.SeedSequence().entropy)
+        return PuntoControl(ruta, params, version_motor)
+    control = cargar(ruta)
+    if params.get("SEMILLA") is None: params = dict(params, SEMILLA=control.params.get("SEMILLA"))
+    if control.version_motor != version_motor or _clave(params, version_motor) != control.clave:
+        raise ValueError(f"El punto de control {ruta} corresponde a otros parámetros o a otra versión del motor; "
+                         f"elija otro fichero o bórrelo para empezar de nuevo.")
+    control.params = params
+    control.intervalo = params.get("INTERVALO_PUNTO_CONTROL", INTERVALO_POR_DEFECTO)
+    return control
+
+
+def informe(control):
+    texto = f"Punto de control: {control.ruta}\n"
+    texto += f"Escrito: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(control.escrito))} | " \
+             f"{'búsqueda terminada' if control.completo else 'búsqueda sin terminar'} | {control.descripcion()}\n"
+    texto += f"Semilla: {control.params.get('SEMILLA')} | Búsqueda: {control.params.get('MODO_BUSQUEDA', 'lineal')} " \
+             f"| Motor: {control.params.get('MOTOR', 'bucle')} | Réplicas: {control.params.get('NUM_SIMULACIONES')}\n"
+    estado = control.estado
+    if estado:
+        texto += f"Última reserva evaluada: {estado['n_reserva']} | flota mínima: {estado['trenes_optimos']} | " \
+                 f"racha de 100%: {estado['racha']}\n"
+        for n_reserva, nivel, ic_inf, ic_sup, replicas in estado["historial"]:
+            texto += f"   {n_reserva:>4} trenes: {nivel:.4%} [{ic_inf:.4%}, {ic_sup:.4%}] con {replicas} réplicas\n"
+    return texto
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta y reanudación de puntos de control de búsquedas de flota.")
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+    estado = subparsers.add_parser("estado", help="Muestra el progreso guardado en un punto de control.")
+    estado.add_argument("ruta")
+    reanudar = subparsers.add_parser("reanudar", help="Continúa la búsqueda guardada sin interfaz gráfica.")
+    reanudar.add_argument("ruta")
+    reanudar.add_argument("--procesos", type=int,
+                          help="Número de procesos (por defecto, el de la ejecución original).")
+    reanudar.add_argument("--intervalo", type=float, help="Segundos mínimos entre escrituras del punto de control.")
+    args = parser.parse_args(argv)
+
+    control = cargar(args.ruta)
+    if args.accion == "estado":
+        print(informe(control), end="")
+        return 0
+
+    import threading
+
+    import FlotaReserva as sim
+
+    params = dict(control.params, PUNTO_CONTROL=args.ruta)
+    if args.procesos: params["NUM_PROCESOS"] = args.procesos
+    if args.intervalo is not None: params["INTERVALO_PUNTO_CONTROL"] = args.intervalo
+    stop_event = threading.Event()
+    try:
+        for evento in sim.iterar_analisis(params, stop_event):
+            print(evento.get("texto", ""), end="", flush=True)
+    except KeyboardInterrupt:
+        print(f"\nBúsqueda interrumpida; el progreso queda en {args.ruta}.", file=sys.stderr)
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,28 @@
 
 
 import numpy as np
+import bisect
+import concurrent.futures
+import cProfile
+import functools
+import heapq
+import io
+import json
 import math
+import multiprocessing
+import os
+import pstats
+import re
+import statistics
+import sys
+import threading
 import time
 
+import FlotaCache
+import FlotaDistribuido
+import FlotaPuntoControl
+import FlotaTraza
+
 # --- PARÁMETROS POR DEFECTO ---
 default_params = {
     "TRENES_OPERATIVOS_REQUERIDOS": 18,
@@ -12,16 +31,30 @@ default_params = {
     "FORMA_BETA_REPARACION_DISCRETA": 3, "REPARACION_MEDIA": 2,
     "FORMA_BETA_MNT_DISCRETA": 4, "MNT_MEDIO": 1,
     "NUM_SIMULACIONES": 1000, "DIAS_POR_SIMULACION": 365,
+    "LISTA_MNT": [1, 2, 3], "P_MNT": [0.70, 0.25, 0.05],
+    "MOTOR": "bucle", "SEMILLA": None,
+    "NUM_PROCESOS": 1, "TAMANO_BLOQUE": 100, "DISTRIBUIDO": None,
+    "MODO_BUSQUEDA": "lineal", "VENTANA_CRN": 16,
+    "SECUENCIAL": False, "CONFIANZA": 0.95, "TOLERANCIA_ERROR": 0.0005,
+    "CACHE": False, "DIRECTORIO_CACHE": None, "TAMANO_MAX_CACHE_MB": 256,
+    "INSTRUMENTACION": False, "PERFILADO": "ninguno",
+    "REDUCCION_VARIANZA": "ninguna",
+    "PUNTO_CONTROL": None, "INTERVALO_PUNTO_CONTROL": 60, "TRAZA": None,
     "REQUISITOS_TRENES_HORA": [
         0, 0, 0, 0, 0, 10, 12, 15, 15, 15, 10, 10, 10, 10, 10, 10, 15, 15, 15, 12, 12, 10, 10, 0
     ]
 }
 
 
+# Se incrementa cada vez que cambia la semántica o el consumo de números aleatorios de algún motor, para que la
+# caché de resultados no devuelva puntos simulados con una versión anterior.
+VERSION_MOTOR = 3
+
+
 # --- FUNCIONES BÁSICAS DE SIMULACIÓN ---
-def sample_discrete_weibull(beta, eta, size=1):
+def sample_discrete_weibull(beta, eta, size=1, rng=np.random):
     q = math.exp(-(1.0 / eta) ** beta);
-    u = np.random.rand(size)
+    u = rng.random(size)
     return np.ceil((np.log(1 - u) / np.log(q)) ** (1.0 / beta)).astype(int)
 
 
@@ -30,52 +63,1207 @@ def weibull_hazard_rate(t, k, lam):
     return (k / lam) * (t / lam) ** (k - 1)
 
 
-def ejecutar_simulacion_unitaria(trenes_reserva, params, stop_event):
-
-    horas_con_servicio_fallido_total = 0;
-    flota_total = params["TRENES_OPERATIVOS_REQUERIDOS"] + trenes_reserva;
+def calcular_escalas(params):
+    # Escalas de las tres distribuciones a partir de las medias introducidas por el usuario
     tasa_fallo = 1 - params["DISPONIBILIDAD"];
     mttf_falla = round(1 / tasa_fallo, 2);
     escala_lambda_falla = mttf_falla / math.gamma(1 + 1 / params["FORMA_K_FALLA"]);
     escala_eta_reparacion = params["REPARACION_MEDIA"] / math.gamma(1 + 1 / params["FORMA_BETA_REPARACION_DISCRETA"]);
     escala_eta_mnt = params["MNT_MEDIO"] / math.gamma(1 + 1 / params["FORMA_BETA_MNT_DISCRETA"])
-    for sim_num in range(params["NUM_SIMULACIONES"]):
+    return mttf_falla, escala_lambda_falla, escala_eta_reparacion, escala_eta_mnt
+
+
+def nivel_servicio(horas_con_servicio_fallido_total, num_simulaciones, dias_por_simulacion):
+    total_horas_simuladas = num_simulaciones * dias_por_simulacion * 24
+    if total_horas_simuladas == 0: return 1.0
+    if horas_con_servicio_fallido_total == 0: return 1.0
+    return 1 - (horas_con_servicio_fallido_total / total_horas_simuladas)
+
+
+def intervalo_confianza(horas_fallidas, dias_por_simulacion, confianza=0.95):
+    # Intervalo normal para el nivel de servicio a partir del nivel de cada réplica (año simulado)
+    niveles = 1 - np.asarray(horas_fallidas) / (dias_por_simulacion * 24)
+    if len(niveles) < 2: return 0.0, 1.0
+    z = statistics.NormalDist().inv_cdf(0.5 + confianza / 2)
+    semiancho = z * niveles.std(ddof=1) / math.sqrt(len(niveles))
+    media = niveles.mean()
+    return max(0.0, float(media - semiancho)), min(1.0, float(media + semiancho))
+
+
+# --- REDUCCIÓN DE VARIANZA ---
+# Solo se ofrecen las variables de control: en este modelo las antitéticas dejan la varianza igual (los fallos son
+# sucesos de probabilidad pequeña y 1 - u casi nunca los cambia) y el muestreo por importancia de un año completo
+# no pasa de 1,1-1,5x, mientras que los controles la dividen por 4-9.
+MODOS_REDUCCION = ("ninguna", "control")
+
+
+def estimar_nivel(horas_fallidas, params):
+    # Nivel de servicio, intervalo de confianza, error estándar y tamaño efectivo de muestra a partir de lo que
+    # devuelven los motores. Sin reducción de varianza es un array con las horas fallidas de cada réplica; con ella
+    # el motor vectorizado devuelve filas [horas, controles...] con controles de media conocida cero (fallos menos
+    # fallos esperados, días de reparación menos su media, trenes sorteados a mantenimiento menos su media, y horas
+    # fallidas de cada día menos las esperadas según los operativos antes de los fallos), que se restan con el
+    # coeficiente de regresión estimado sobre la propia muestra. El tamaño efectivo es el número de réplicas de
+    # Monte Carlo simple con el mismo error estándar.
+    dias = params["DIAS_POR_SIMULACION"]
+    confianza = params.get("CONFIANZA", 0.95)
+    horas_fallidas = np.asarray(horas_fallidas)
+    replicas = horas_fallidas.shape[-1]
+    modo = params.get("REDUCCION_VARIANZA", "ninguna")
+    if modo == "ninguna" or horas_fallidas.ndim == 1:
+        ic_inf, ic_sup = intervalo_confianza(horas_fallidas, dias, confianza)
+        error = float(horas_fallidas.std(ddof=1)) / math.sqrt(replicas) / (dias * 24) if replicas >= 2 else math.inf
+        return {"nivel": nivel_servicio(int(horas_fallidas.sum()), replicas, dias), "ic_inf": ic_inf,
+                "ic_sup": ic_sup, "error_estandar": error, "tamano_efectivo": float(replicas), "replicas": replicas}
+
+    horas = np.asarray(horas_fallidas[0], dtype=float)
+    controles = horas_fallidas[1:].T
+    if replicas > controles.shape[1] + 1:
+        beta = np.linalg.lstsq(controles - controles.mean(axis=0), horas - horas.mean(), rcond=None)[0]
+        unidades = horas - controles @ beta
+    else:
+        unidades = horas
+    if replicas < 2:
+        return {"nivel": nivel_servicio(int(horas.sum()), replicas, dias), "ic_inf": 0.0, "ic_sup": 1.0,
+                "error_estandar": math.inf, "tamano_efectivo": float(replicas), "replicas": replicas}
+    escala = dias * 24
+    nivel = min(max(1 - float(unidades.mean()) / escala, 0.0), 1.0)
+    varianza = float(unidades.var(ddof=1)) / replicas
+    varianza_simple = float(horas.var(ddof=1))
+    efectivo = varianza_simple / varianza if varianza > 0 else (math.inf if varianza_simple > 0 else float(replicas))
+    error = math.sqrt(varianza) / escala
+    semiancho = statistics.NormalDist().inv_cdf(0.5 + confianza / 2) * error
+    return {"nivel": nivel, "ic_inf": max(0.0, nivel - semiancho), "ic_sup": min(1.0, nivel + semiancho),
+            "error_estandar": error, "tamano_efectivo": efectivo, "replicas": replicas}
+
+
+# --- INSTRUMENTACIÓN ---
+class Medidor:
+    # Tiempos por fase y contadores de los motores. marcar(fase) suma a la fase el tiempo transcurrido desde la
+    # marca anterior. Con activo=False todos los métodos vuelven sin hacer nada, así que los motores los llaman
+    # siempre; los contadores que requieren reducir un array se calculan solo si el medidor está activo.
+    def __init__(self, activo=True):
+        self.activo = activo
+        self.tiempos = {}
+        self.contadores = {}
+        self._ultimo = time.perf_counter()
+
+    def iniciar(self):
+        if self.activo: self._ultimo = time.perf_counter()
+
+    def marcar(self, fase):
+        if not self.activo: return
+        ahora = time.perf_counter()
+        self.tiempos[fase] = self.tiempos.get(fase, 0.0) + ahora - self._ultimo
+        self._ultimo = ahora
+
+    def contar(self, nombre, cantidad=1):
+        if self.activo: self.contadores[nombre] = self.contadores.get(nombre, 0) + int(cantidad)
+
+    def combinar(self, datos):
+        if not self.activo or datos is None: return
+        for fase, tiempo in datos["tiempos"].items(): self.tiempos[fase] = self.tiempos.get(fase, 0.0) + tiempo
+        for nombre, valor in datos["contadores"].items(): self.contar(nombre, valor)
+
+    def datos(self):
+        return {"tiempos": dict(self.tiempos), "contadores": dict(self.contadores)} if self.activo else None
+
+
+MEDIDOR_INACTIVO = Medidor(activo=False)
+
+
+def crear_medidor(params):
+    return Medidor() if params.get("INSTRUMENTACION") else MEDIDOR_INACTIVO
+
+
+class PerfiladorMuestreo:
+    # Perfilador estadístico: un hilo auxiliar toma cada `intervalo` segundos la pila del hilo que simula y cuenta
+    # las funciones que aparecen en ella. Tiene la misma interfaz enable()/disable() que cProfile.Profile.
+    def __init__(self, intervalo=0.005):
+        self.intervalo = intervalo
+        self.propias = {}
+        self.acumuladas = {}
+        self.muestras = 0
+        self._hilo_objetivo = None
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+
+    def enable(self):
+        self._hilo_objetivo = threading.get_ident()
+
+    def disable(self):
+        self._hilo_objetivo = None
+
+    def cerrar(self):
+        self._fin.set()
+        self._hilo.join()
+
+    def _muestrear(self):
+        while not self._fin.wait(self.intervalo):
+            objetivo = self._hilo_objetivo
+            marco = sys._current_frames().get(objetivo) if objetivo is not None else None
+            if marco is None: continue
+            self.muestras += 1
+            vistas = set()
+            codigo = marco.f_code
+            nombre = f"{os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno}({codigo.co_name})"
+            self.propias[nombre] = self.propias.get(nombre, 0) + 1
+            while marco is not None:
+                codigo = marco.f_code
+                nombre = f"{os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno}({codigo.co_name})"
+                if nombre not in vistas:
+                    vistas.add(nombre)
+                    self.acumuladas[nombre] = self.acumuladas.get(nombre, 0) + 1
+                marco = marco.f_back
+
+    def informe(self, limite=30):
+        texto = f"{self.muestras} muestras cada {self.intervalo * 1000:.0f} ms\n"
+        texto += "{:>8} {:>8}  {}\n".format("propio", "acumul.", "función")
+        for nombre, cuenta in sorted(self.acumuladas.items(), key=lambda x: -x[1])[:limite]:
+            texto += "{:>7.1%} {:>7.1%}  {}\n".format(self.propias.get(nombre, 0) / max(self.muestras, 1),
+                                                     cuenta / max(self.muestras, 1), nombre)
+        return texto
+
+
+PERFILADORES = ("ninguno", "cprofile", "muestreo")
+
+
+def crear_perfilador(params):
+    modo = params.get("PERFILADO") or "ninguno"
+    if modo == "cprofile": return cProfile.Profile()
+    if modo == "muestreo": return PerfiladorMuestreo()
+    return None
+
+
+def informe_perfilador(perfilador, limite=30):
+    if isinstance(perfilador, PerfiladorMuestreo): return perfilador.informe(limite)
+    salida = io.StringIO()
+    pstats.Stats(perfilador, stream=salida).sort_stats("cumulative").print_stats(limite)
+    return salida.getvalue()
+
+
+def informe_instrumentacion(instrumentacion):
+    # Tabla de texto con el tiempo de cada fase y los contadores, en total y por tamaño de reserva
+    if not instrumentacion: return ""
+    total = instrumentacion["total"]
+    fases = sorted(total["tiempos"], key=lambda f: -total["tiempos"][f])
+    contadores = sorted(total["contadores"])
+    tiempo_total = sum(total["tiempos"].values()) or 1.0
+    texto = "Tiempo por fase:\n"
+    for fase in fases:
+        texto += f"   {fase:<14} {total['tiempos'][fase]:>10.3f} s {total['tiempos'][fase] / tiempo_total:>7.1%}\n"
+    texto += "Contadores:\n"
+    for nombre in contadores:
+        texto += f"   {nombre:<14} {total['contadores'][nombre]:>14}\n"
+    texto += "\nPor reserva (s):\n"
+    texto += "{:<10}".format("Reserva") + "".join(f" {fase:>13}" for fase in fases) + "".join(
+        f" {nombre:>15}" for nombre in contadores) + "\n"
+    for reserva, datos in instrumentacion["por_reserva"].items():
+        texto += "{:<10}".format(reserva) + "".join(
+            f" {datos['tiempos'].get(fase, 0.0):>13.3f}" for fase in fases) + "".join(
+            f" {datos['contadores'].get(nombre, 0):>15}" for nombre in contadores) + "\n"
+    return texto
+
+
+# --- DISTRIBUCIÓN DE RESULTADOS ---
+HORAS_DIA = 24
+CUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class Distribucion:
+    # Histogramas acumulables de las horas fallidas de cada réplica (año simulado) y de las horas fallidas de su
+    # peor día. Las horas son enteras y están acotadas (DIAS_POR_SIMULACION x 24 y 24), así que los histogramas dan
+    # cuantiles exactos con una memoria que no depende del número de réplicas. Los motores añaden cada bloque con
+    # agregar() y las partes calculadas en otros procesos se suman con combinar(), como en Medidor.
+    def __init__(self, activo=True):
+        self.activo = activo
+        self.horas = np.zeros(0)
+        self.peor_dia = np.zeros(HORAS_DIA + 1)
+        self.replicas = 0
+
+    def agregar(self, horas_fallidas, peor_dia):
+        if not self.activo: return
+        self.horas = _sumar_histogramas(self.horas, np.bincount(horas_fallidas))
+        self.peor_dia += np.bincount(peor_dia, minlength=HORAS_DIA + 1)
+        self.replicas += len(horas_fallidas)
+
+    def combinar(self, datos):
+        if not self.activo or datos is None: return
+        self.horas = _sumar_histogramas(self.horas, datos["horas"])
+        self.peor_dia += datos["peor_dia"]
+        self.replicas += datos["replicas"]
+
+    def datos(self):
+        if not self.activo: return None
+        return {"horas": np.trim_zeros(self.horas, "b"), "peor_dia": self.peor_dia.copy(), "replicas": self.replicas}
+
+    def a_array(self):
+        # Formato plano para la caché: [réplicas, histograma del peor día (25), histograma de horas]
+        return np.concatenate([[self.replicas], self.peor_dia, np.trim_zeros(self.horas, "b")])
+
+    @classmethod
+    def desde_array(cls, array):
+        distribucion = cls()
+        distribucion.combinar({"replicas": int(array[0]), "peor_dia": array[1:HORAS_DIA + 2],
+                               "horas": array[HORAS_DIA + 2:]})
+        return distribucion
+
+    def resumen(self, params):
+        # Cuantiles de las horas fallidas por año, probabilidad de que un año quede por debajo del objetivo y
+        # estadísticas del peor día. Los histogramas se devuelven sin los valores de peso nulo.
+        total = float(self.horas.sum()) if self.activo else 0.0
+        if total <= 0: return None
+        horas_anuales = params["DIAS_POR_SIMULACION"] * HORAS_DIA
+        valores = np.arange(len(self.horas))
+        acumulada = np.cumsum(self.horas) / total
+        cuantiles = {f"p{round(q * 100)}": int(min(np.searchsorted(acumulada, q), len(valores) - 1))
+                     for q in CUANTILES}
+        niveles = 1 - valores / horas_anuales
+        peor = self.peor_dia / self.peor_dia.sum()
+        acumulada_peor = np.cumsum(peor)
+        no_nulos = np.nonzero(self.horas)[0]
+        return {"replicas": self.replicas,
+                "media_horas": float(np.dot(valores, self.horas) / total),
+                "cuantiles_horas": cuantiles,
+                "cuantiles_nivel": {k: float(1 - v / horas_anuales) for k, v in cuantiles.items()},
+                "prob_incumplir": float(self.horas[niveles < params["NIVEL_SERVICIO_DESEADO"]].sum() / total),
+                "peor_dia_medio": float(np.dot(np.arange(HORAS_DIA + 1), peor)),
+                "peor_dia_p95": int(min(np.searchsorted(acumulada_peor, 0.95), HORAS_DIA)),
+                "peor_dia_max": int(np.nonzero(self.peor_dia)[0].max()),
+                "histograma_horas": {"horas": no_nulos, "probabilidad": self.horas[no_nulos] / total},
+                "histograma_peor_dia": peor}
+
+
+DISTRIBUCION_INACTIVA = Distribucion(activo=False)
+
+
+def _sumar_histogramas(a, b):
+    if len(a) < len(b): a, b = b, a
+    suma = np.array(a, dtype=float)
+    suma[:len(b)] += b
+    return suma
+
+
+# --- NÚMEROS ALEATORIOS POR BLOQUES ---
+# Los motores no piden al Generator un número cada vez. Los uniformes se generan en bloques grandes que se
+# reutilizan (FlujoUniformes) y las tres distribuciones discretas del modelo (número de trenes que entran a
+# mantenimiento, duración de una reparación y de un mantenimiento) se sortean por inversión de su función de
+# distribución, tabulada una vez por juego de parámetros: cada sorteo es una búsqueda en una tabla pequeña en lugar
+# de reconstruir la distribución o evaluar exp, log y potencias. La inversión es monótona, así que conserva el
+# acoplamiento de los números aleatorios comunes.
+# Para un mismo uniforme, la tabla de la Weibull discreta da el valor de sample_discrete_weibull (recortado al
+# horizonte, como el estado de los motores) y la del número a mantenimiento el de Generator.choice(LISTA_MNT,
+# p=P_MNT); los motores por lotes dan por ello los mismos resultados que antes. Toda la aleatoriedad sale del
+# Generator que recibe el motor, sembrado explícitamente para cada bloque (ver bloques_replicas).
+TAMANO_BLOQUE_UNIFORMES = 1 << 14
+
+
+class TablaInversa:
+    def __init__(self, valores, cdf, lado):
+        # `lado` es el de np.searchsorted: "right" devuelve el primer valor con cdf > u, "left" el primero con cdf >= u
+        self.valores = np.asarray(valores)
+        self.cdf = np.asarray(cdf, dtype=float)
+        self.lado = lado
+        self.ultimo = len(self.cdf) - 1
+        self._valores = self.valores.tolist()
+        self._cdf = self.cdf.tolist()
+        self._buscar = bisect.bisect_right if lado == "right" else bisect.bisect_left
+
+    def sortear(self, u):
+        # Un valor por uniforme (array de cualquier forma); la masa que no cubre la tabla va al último valor
+        return self.valores[np.minimum(np.searchsorted(self.cdf, u, side=self.lado), self.ultimo)]
+
+    def sortear_uno(self, u):
+        return self._valores[min(self._buscar(self._cdf, u), self.ultimo)]
+
+
+@functools.lru_cache(maxsize=64)
+def tabla_discreta(valores, probabilidades):
+    # Misma normalización que Generator.choice; valores y probabilidades como tuplas
+    cdf = np.cumsum(np.asarray(probabilidades, dtype=float))
+    cdf /= cdf[-1]
+    return TablaInversa(valores, cdf, "right")
+
+
+@functools.lru_cache(maxsize=64)
+def tabla_weibull_discreta(beta, eta, limite):
+    # Valores 1..K, con K el primero cuya función de distribución vale 1 en coma flotante o, si no se alcanza,
+    # `limite` (el horizonte), que absorbe la cola
+    k = np.arange(1, limite + 1)
+    cdf = -np.expm1(-(k / eta) ** beta)
+    completos = np.nonzero(cdf >= 1.0)[0]
+    if len(completos): k, cdf = k[:completos[0] + 1], cdf[:completos[0] + 1]
+    return TablaInversa(k, cdf, "left")
+
+
+def tablas_muestreo(params, lista_mnt=None, p_mnt=None):
+    # (número a mantenimiento, duración de reparación, duración de mantenimiento) para `params`
+    _, _, escala_eta_reparacion, escala_eta_mnt = calcular_escalas(params)
+    dias = int(params["DIAS_POR_SIMULACION"])
+    lista_mnt = params["LISTA_MNT"] if lista_mnt is None else lista_mnt
+    p_mnt = params["P_MNT"] if p_mnt is None else p_mnt
+    return (tabla_discreta(tuple(np.asarray(lista_mnt).tolist()), tuple(np.asarray(p_mnt, dtype=float).tolist())),
+            tabla_weibull_discreta(float(params["FORMA_BETA_REPARACION_DISCRETA"]), escala_eta_reparacion, dias),
+            tabla_weibull_discreta(float(params["FORMA_BETA_MNT_DISCRETA"]), escala_eta_mnt, dias))
+
+
+class FlujoUniformes:
+    # Uniformes de un Generator servidos desde un bloque que se rellena al agotarse. Se consumen en el mismo orden
+    # que si se pidieran uno a uno al Generator, pero sin el coste de una llamada por número.
+    def __init__(self, rng, tamano_bloque=TAMANO_BLOQUE_UNIFORMES):
+        self.rng = rng
+        self.bloque = np.empty(tamano_bloque)
+        self.lista = None  # copia del bloque como floats de Python para los sorteos sueltos
+        self.posicion = self.fin = 0
+
+    def _rellenar(self):
+        self.rng.random(out=self.bloque)
+        self.lista = None
+        self.posicion, self.fin = 0, len(self.bloque)
+
+    def uniforme(self):
+        if self.posicion == self.fin: self._rellenar()
+        if self.lista is None: self.lista = self.bloque.tolist()
+        self.posicion += 1
+        return self.lista[self.posicion - 1]
+
+    def uniformes(self, n):
+        # Array de n uniformes; si caben en el bloque es una vista, válida hasta la siguiente petición
+        if self.posicion + n <= self.fin:
+            self.posicion += n
+            return self.bloque[self.posicion - n:self.posicion]
+        salida = np.empty(n)
+        hechos = 0
+        while hechos < n:
+            if self.posicion == self.fin: self._rellenar()
+            tomar = min(n - hechos, self.fin - self.posicion)
+            salida[hechos:hechos + tomar] = self.bloque[self.posicion:self.posicion + tomar]
+            self.posicion += tomar
+            hechos += tomar
+        return salida
+
+    def elegir(self, n, k):
+        # k posiciones distintas de range(n), por Fisher-Yates parcial
+        posiciones = list(range(n))
+        for j in range(k):
+            m = j + int(self.uniforme() * (n - j))
+            posiciones[j], posiciones[m] = posiciones[m], posiciones[j]
+        return posiciones[:k]
+
+    def geometrica(self, log_q):
+        # Número de ensayos hasta el primer éxito (>= 1) con log_q = log(1 - p); None si p = 1
+        if log_q is None: return 1
+        return int(math.log1p(-self.uniforme()) / log_q) + 1
+
+
+def log_complementario(p):
+    # log(1 - p) para FlujoUniformes.geometrica
+    return math.log1p(-p) if p < 1 else None
+
+
+# --- MOTORES DE SIMULACIÓN ---
+# Todos los motores reciben la flota total y devuelven las horas con servicio fallido de cada réplica
+# (un array de tamaño num_replicas) o None si se pidió detener la simulación. El medidor opcional acumula el
+# tiempo de las fases "avance", "mantenimiento", "fallos" y "requisitos" y los contadores de sucesos; la
+# distribución opcional recibe, al terminar, las horas fallidas y las del peor día de cada réplica.
+def _simular_replicas_bucle(flota_total, params, num_replicas, rng, stop_event, medidor=MEDIDOR_INACTIVO,
+                            distribucion=DISTRIBUCION_INACTIVA):
+    # Motor de referencia: una réplica cada vez y un sorteo por tren y día. Los disponibles de cada día se guardan y
+    # las horas fallidas de la réplica salen de una sola consulta a la tabla de déficit por día.
+    dias = params["DIAS_POR_SIMULACION"]
+    deficit = deficit_por_dia(params["REQUISITOS_TRENES_HORA"], flota_total, dias)
+    indices_dia = np.arange(dias)
+    disponibles_por_dia = np.empty(dias, dtype=np.intp)
+    horas_fallidas = np.zeros(num_replicas, dtype=np.int64)
+    peor_dia = np.zeros(num_replicas, dtype=np.int64)
+    escala_lambda_falla = calcular_escalas(params)[1]
+    tabla_num_mnt, tabla_reparacion, tabla_mnt = tablas_muestreo(params)
+    flujo = FlujoUniformes(rng)
+    medidor.iniciar()
+    for sim_num in range(num_replicas):
         if stop_event.is_set(): return None
         dias_reparacion_restantes = np.zeros(flota_total, dtype=int);
         dias_mantenimiento_restantes = np.zeros(flota_total, dtype=int);
         dias_desde_ultima_falla = np.zeros(flota_total, dtype=int)
-        for dia in range(params["DIAS_POR_SIMULACION"]):
+        for dia in range(dias):
             dias_reparacion_restantes[dias_reparacion_restantes > 0] -= 1;
             dias_mantenimiento_restantes[dias_mantenimiento_restantes > 0] -= 1;
             idx_reparados_hoy = np.where(dias_reparacion_restantes == 0);
             dias_desde_ultima_falla[idx_reparados_hoy] = 0;
             disponibles_inicio_dia_idx = \
             np.where((dias_reparacion_restantes == 0) & (dias_mantenimiento_restantes == 0))[0];
-            num_a_mnt = np.random.choice(params["LISTA_MNT"], p=params["P_MNT"]);
+            medidor.marcar("avance")
+            num_a_mnt = tabla_num_mnt.sortear_uno(flujo.uniforme());
             num_a_mnt = min(num_a_mnt, len(disponibles_inicio_dia_idx))
             if num_a_mnt > 0:
-                trenes_a_mnt_idx = np.random.choice(disponibles_inicio_dia_idx, size=num_a_mnt, replace=False);
-                tiempos_mnt = sample_discrete_weibull(params["FORMA_BETA_MNT_DISCRETA"], escala_eta_mnt,
-                                                      size=num_a_mnt);
+                elegidos = flujo.elegir(len(disponibles_inicio_dia_idx), num_a_mnt)
+                trenes_a_mnt_idx = disponibles_inicio_dia_idx[elegidos];
+                tiempos_mnt = tabla_mnt.sortear(flujo.uniformes(num_a_mnt));
                 dias_mantenimiento_restantes[trenes_a_mnt_idx] = tiempos_mnt
+                medidor.contar("entradas_mnt", num_a_mnt)
+                if medidor.activo: medidor.contar("dias_mnt", tiempos_mnt.sum())
+            medidor.marcar("mantenimiento")
             operativos_idx = np.where((dias_reparacion_restantes == 0) & (dias_mantenimiento_restantes == 0))[0]
             if len(operativos_idx) > 0: dias_desde_ultima_falla[operativos_idx] += 1
             for i in operativos_idx:
                 edad_tren = dias_desde_ultima_falla[i];
                 prob_falla_tren = weibull_hazard_rate(edad_tren, params["FORMA_K_FALLA"], escala_lambda_falla)
-                if np.random.rand() < prob_falla_tren:
-                    tiempo_reparacion = \
-                    sample_discrete_weibull(params["FORMA_BETA_REPARACION_DISCRETA"], escala_eta_reparacion, size=1)[0];
+                if flujo.uniforme() < prob_falla_tren:
+                    tiempo_reparacion = tabla_reparacion.sortear_uno(flujo.uniforme());
                     dias_reparacion_restantes[i] = tiempo_reparacion
-            trenes_disponibles_hoy = len(
-                np.where((dias_reparacion_restantes == 0) & (dias_mantenimiento_restantes == 0))[0])
-            for hora in range(24):
-                if trenes_disponibles_hoy < params["REQUISITOS_TRENES_HORA"][
-                    hora]: horas_con_servicio_fallido_total += 1
-    total_horas_simuladas = params["NUM_SIMULACIONES"] * params["DIAS_POR_SIMULACION"] * 24
-    if total_horas_simuladas == 0: return 1.0
-    if horas_con_servicio_fallido_total == 0: return 1.0
-    return 1 - (horas_con_servicio_fallido_total / total_horas_simuladas)
+                    medidor.contar("fallos")
+                    medidor.contar("dias_reparacion", tiempo_reparacion)
+            medidor.marcar("fallos")
+            disponibles_por_dia[dia] = np.count_nonzero(
+                (dias_reparacion_restantes == 0) & (dias_mantenimiento_restantes == 0))
+            medidor.marcar("requisitos")
+        horas_por_dia = deficit[indices_dia, disponibles_por_dia]
+        horas_fallidas[sim_num] = horas_por_dia.sum()
+        peor_dia[sim_num] = horas_por_dia.max(initial=0)
+        medidor.marcar("requisitos")
+    _contar_resumen(medidor, horas_fallidas, flota_total, params)
+    distribucion.agregar(horas_fallidas, peor_dia)
+    return horas_fallidas
+
+
+def _contar_resumen(medidor, horas_fallidas, flota_total, params):
+    if not medidor.activo: return
+    medidor.contar("replicas", horas_fallidas.shape[-1])
+    medidor.contar("tren_dias", horas_fallidas.size * flota_total * params["DIAS_POR_SIMULACION"])
+    medidor.contar("horas_fallidas", horas_fallidas.sum())
+
+
+def _tipo_paro(dias):
+    # Menor entero con signo capaz de guardar los días fuera de servicio (recortados al horizonte)
+    return np.int16 if dias < np.iinfo(np.int16).max else np.int32
+
+
+def perfil_requisitos(requisitos_hora):
+    # REQUISITOS_TRENES_HORA como matriz (perfiles x 24). Una lista de 24 valores es un perfil único para todos los
+    # días; una matriz de 7 x 24 (semanal) o de 365 x 24 (estacional) asigna al día d el perfil d % perfiles.
+    try:
+        perfil = np.asarray(requisitos_hora)
+    except ValueError:
+        perfil = np.empty(0)  # filas de distinta longitud
+    if perfil.ndim == 1 and len(perfil) == HORAS_DIA: perfil = perfil[None, :]
+    if perfil.ndim != 2 or perfil.shape[0] == 0 or perfil.shape[1] != HORAS_DIA:
+        raise ValueError(f"REQUISITOS_TRENES_HORA debe tener {HORAS_DIA} valores o ser una matriz de perfiles x "
+                         f"{HORAS_DIA} (forma recibida: {perfil.shape if perfil.size else 'irregular o vacía'})")
+    if not np.issubdtype(perfil.dtype, np.integer):
+        if not np.issubdtype(perfil.dtype, np.number) or np.any(perfil != np.round(perfil)):
+            raise ValueError("REQUISITOS_TRENES_HORA debe contener números enteros de trenes")
+        perfil = perfil.astype(np.int64)
+    if np.any(perfil < 0): raise ValueError("REQUISITOS_TRENES_HORA no puede contener valores negativos")
+    return perfil
+
+
+def cargar_requisitos(ruta):
+    # Perfil de requisitos desde un fichero: .npy, .json (lista o matriz) o texto/CSV con 24 valores por línea
+    # (separados por comas, punto y coma o espacios; las líneas con # son comentarios). Devuelve listas de Python
+    # para que los parámetros sigan siendo JSON (caché, puntos de control, servicio HTTP).
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".npy":
+        perfil = np.load(ruta, allow_pickle=False)
+    elif extension == ".json":
+        with open(ruta, encoding="utf-8") as fichero: perfil = json.load(fichero)
+    else:
+        with open(ruta, encoding="utf-8") as fichero:
+            filas = [re.split(r"[,;\s]+", linea.split("#")[0].strip()) for linea in fichero]
+        perfil = [[float(valor) for valor in fila] for fila in filas if fila != [""]]
+    perfil = perfil_requisitos(perfil)
+    return perfil.tolist() if len(perfil) > 1 else perfil[0].tolist()
+
+
+def tabla_deficit(requisitos_hora, flota_total):
+    # Horas con servicio fallido según el perfil del día (filas) y el número de trenes disponibles (columnas
+    # 0..flota_total). Se calcula una vez por motor: en el bucle diario basta con deficit[dia % len(deficit)].
+    perfil = perfil_requisitos(requisitos_hora)
+    return (np.arange(flota_total + 1)[None, :, None] < perfil[:, None, :]).sum(axis=2)
+
+
+def deficit_por_dia(requisitos_hora, flota_total, dias):
+    # Tabla de déficit de cada día del horizonte (dias x flota_total + 1), para evaluar series diarias de una vez
+    tabla = tabla_deficit(requisitos_hora, flota_total)
+    return tabla[np.arange(dias) % len(tabla)]
+
+
+def deficit_condicionado(deficit, prob_falla):
+    # Horas fallidas esperadas de cada día (filas de `deficit`) según los trenes operativos antes de los fallos
+    # (columnas): con n operativos fallan Binomial(n, prob_falla) y el déficit es el de los que quedan.
+    flota_total = deficit.shape[1] - 1
+    binomial = np.zeros((flota_total + 1, flota_total + 1))  # [n, m]: probabilidad de que queden m de n
+    binomial[0, 0] = 1.0
+    for n in range(1, flota_total + 1):
+        binomial[n, :n + 1] = np.convolve(binomial[n - 1, :n], [prob_falla, 1 - prob_falla])
+    return deficit @ binomial.T
+
+
+def _simular_replicas_vectorizado(flota_total, params, num_replicas, rng, stop_event, medidor=MEDIDOR_INACTIVO,
+                                  distribucion=DISTRIBUCION_INACTIVA, traza=FlotaTraza.TRAZA_INACTIVA):
+    # Motor por lotes: el estado es una matriz (réplicas x trenes) y todas las réplicas avanzan juntas día a día.
+    # Reproduce paso a paso la semántica del motor de referencia y consume los números aleatorios en el mismo orden.
+    # Estado compacto: un único array `paro` con los días que le quedan a cada tren fuera de servicio, positivos
+    # en reparación y negativos en mantenimiento (0 = disponible). Las duraciones se recortan al horizonte, lo que
+    # no cambia el resultado y permite usar int16. La edad no se guarda: como explica el motor de eventos, el riesgo
+    # de un tren operativo es siempre h(1). El número de disponibles por réplica se actualiza con las entradas a
+    # mantenimiento y los fallos, y las horas fallidas salen de una tabla por día y número de disponibles. Todos los
+    # pasos escriben en buffers reservados al inicio, de modo que el bucle diario no crea arrays réplicas x trenes.
+    # Es el motor que implementa la reducción de varianza (REDUCCION_VARIANZA, ver estimar_nivel): con "control"
+    # devuelve filas adicionales sin cambiar los sorteos (el control de las horas fallidas condicionadas usa la tabla
+    # de deficit_condicionado).
+    # También es el motor que escribe la traza diaria (FlotaTraza) fuera de la búsqueda crn.
+    dias = params["DIAS_POR_SIMULACION"]
+    _, escala_lambda_falla, escala_eta_reparacion, _ = calcular_escalas(params)
+    prob_falla = weibull_hazard_rate(1, params["FORMA_K_FALLA"], escala_lambda_falla)
+    lista_mnt = np.asarray(params["LISTA_MNT"]);
+    p_mnt = np.asarray(params["P_MNT"], dtype=float)
+    tabla_num_mnt, tabla_reparacion, tabla_mnt = tablas_muestreo(params)
+    deficit = deficit_por_dia(params["REQUISITOS_TRENES_HORA"], flota_total, dias)
+    max_a_mnt = min(int(lista_mnt.max()), flota_total)
+    posiciones = np.arange(max_a_mnt)
+    filas = np.arange(num_replicas)
+    filas_mnt = np.broadcast_to(filas[:, None], (num_replicas, max_a_mnt))
+    forma = (num_replicas, flota_total)
+    modo_reduccion = params.get("REDUCCION_VARIANZA", "ninguna")
+    if modo_reduccion == "control":
+        media_mnt = float(np.dot(lista_mnt, p_mnt))
+        media_reparacion = media_weibull_discreta(params["FORMA_BETA_REPARACION_DISCRETA"], escala_eta_reparacion)
+        deficit_esperado = deficit_condicionado(deficit, min(prob_falla, 1.0))
+        controles = np.zeros((4, num_replicas))
+
+    paro = np.zeros(forma, dtype=_tipo_paro(dias))
+    signo = np.empty(forma, dtype=paro.dtype)
+    disponibles = np.empty(forma, dtype=bool)
+    mascara = np.empty(forma, dtype=bool)  # no disponibles al elegir mantenimiento, después trenes que fallan
+    uniformes = np.empty(forma)  # claves de mantenimiento y, después, sorteos de fallo
+    candidatos = np.empty((max_a_mnt, num_replicas), dtype=np.intp)
+    num_disponibles = np.empty(num_replicas, dtype=np.int64)
+    por_replica = np.empty(num_replicas, dtype=np.int64)
+    horas_fallidas = np.zeros(num_replicas, dtype=np.int64)
+    peor_dia = np.zeros(num_replicas, dtype=np.int64)
+
+    medidor.iniciar()
+    for dia in range(dias):
+        if stop_event.is_set(): return None
+        np.sign(paro, out=signo)
+        np.subtract(paro, signo, out=paro)
+        np.equal(paro, 0, out=disponibles)
+        np.sum(disponibles, axis=1, out=num_disponibles)
+        medidor.marcar("avance")
+
+        # Mantenimiento: cada réplica envía los `num_a_mnt` disponibles con menor clave aleatoria
+        sorteados = tabla_num_mnt.sortear(rng.random(num_replicas))
+        if modo_reduccion == "control": controles[2] += sorteados - media_mnt
+        num_a_mnt = np.minimum(sorteados, num_disponibles)
+        if max_a_mnt > 0 and num_a_mnt.any():
+            claves = rng.random(out=uniformes)
+            np.logical_not(disponibles, out=mascara)
+            np.copyto(claves, 2.0, where=mascara)
+            for j in range(max_a_mnt):
+                np.argmin(claves, axis=1, out=candidatos[j])
+                claves[filas, candidatos[j]] = 2.0
+            elegidos = posiciones[None, :] < num_a_mnt[:, None]
+            replicas_mnt, trenes_mnt = filas_mnt[elegidos], candidatos.T[elegidos]
+            tiempos_mnt = tabla_mnt.sortear(rng.random(len(trenes_mnt)))
+            if medidor.activo:
+                medidor.contar("entradas_mnt", len(tiempos_mnt))
+                medidor.contar("dias_mnt", tiempos_mnt.sum())
+            paro[replicas_mnt, trenes_mnt] = -tiempos_mnt
+            disponibles[replicas_mnt, trenes_mnt] = False
+            num_disponibles -= num_a_mnt
+        medidor.marcar("mantenimiento")
+
+        if modo_reduccion == "control": controles[3] -= np.take(deficit_esperado[dia], num_disponibles)
+
+        # Fallos: un único sorteo uniforme para toda la matriz contra el riesgo de un tren operativo
+        np.less(rng.random(out=uniformes), prob_falla, out=mascara)
+        fallan = np.logical_and(mascara, disponibles, out=mascara)
+        num_fallos = int(np.count_nonzero(fallan))
+        if modo_reduccion == "control": controles[0] += fallan.sum(axis=1) - min(prob_falla, 1.0) * num_disponibles
+        if num_fallos:
+            tiempos_reparacion = tabla_reparacion.sortear(rng.random(num_fallos))
+            if medidor.activo:
+                medidor.contar("fallos", num_fallos)
+                medidor.contar("dias_reparacion", tiempos_reparacion.sum())
+            paro[fallan] = tiempos_reparacion
+            if modo_reduccion == "control":
+                controles[1] += np.bincount(np.nonzero(fallan)[0], weights=tiempos_reparacion - media_reparacion,
+                                            minlength=num_replicas)
+            np.sum(fallan, axis=1, out=por_replica)
+            num_disponibles -= por_replica
+        medidor.marcar("fallos")
+
+        np.take(deficit[dia], num_disponibles, out=por_replica)
+        horas_fallidas += por_replica
+        np.maximum(peor_dia, por_replica, out=peor_dia)
+        if modo_reduccion == "control": controles[3] += por_replica
+        medidor.marcar("requisitos")
+        if traza.activa:
+            # Al final del día: los no disponibles que no están en mantenimiento están en reparación
+            np.less(paro, 0, out=mascara)
+            en_mnt = np.sum(mascara, axis=1)
+            traza.dia(dia, flota_total - num_disponibles - en_mnt, en_mnt, num_disponibles, por_replica)
+            medidor.marcar("traza")
+    traza.terminar()
+    _contar_resumen(medidor, horas_fallidas, flota_total, params)
+    distribucion.agregar(horas_fallidas, peor_dia)
+    if modo_reduccion == "control": return np.vstack([horas_fallidas, controles])
+    return horas_fallidas
+
+
+EVENTO_FIN_PARO, EVENTO_FALLO = 0, 1
+
+
+def _simular_replicas_eventos(flota_total, params, num_replicas, rng, stop_event, medidor=MEDIDOR_INACTIVO,
+                              distribucion=DISTRIBUCION_INACTIVA):
+    # Motor de eventos discretos: en lugar de recorrer cada tren cada día, se sortea directamente el día en que
+    # fallará cada tren operativo y se guarda en una cola de prioridad junto con los fines de reparación y de
+    # mantenimiento. Solo se visitan los días con eventos; entre dos eventos la disponibilidad es constante y las
+    # horas fallidas se suman en bloque.
+    # El motor de referencia reinicia cada mañana la edad de todo tren que no está en reparación, de modo que el
+    # riesgo que aplica a un tren operativo es siempre h(1) y su tiempo hasta el fallo, contado en días operativos,
+    # es geométrico. Sortearlo así mantiene la equivalencia con el bucle; al ser sin memoria, un tren que entra a
+    # mantenimiento simplemente descarta su fallo pendiente y sortea otro al volver.
+    dias = params["DIAS_POR_SIMULACION"]
+    escala_lambda_falla = calcular_escalas(params)[1]
+    prob_falla = min(weibull_hazard_rate(1, params["FORMA_K_FALLA"], escala_lambda_falla), 1.0)
+    lista_mnt = np.asarray(params["LISTA_MNT"]);
+    p_mnt = np.asarray(params["P_MNT"], dtype=float)
+    p_hay_mnt = float(p_mnt[lista_mnt > 0].sum())
+    # El número de trenes a mantenimiento se sortea condicionado a que entre alguno (el día lo da dias_hasta_mnt)
+    if p_hay_mnt > 0: lista_mnt, p_mnt = lista_mnt[lista_mnt > 0], p_mnt[lista_mnt > 0]
+    tabla_num_mnt, tabla_reparacion, tabla_mnt = tablas_muestreo(params, lista_mnt, p_mnt)
+    log_q_falla = log_complementario(prob_falla) if prob_falla > 0 else None
+    log_q_mnt = log_complementario(p_hay_mnt) if p_hay_mnt > 0 else None
+    flujo = FlujoUniformes(rng)
+    # Déficit por día y número de disponibles (listas, para consultarlo sin numpy en cada evento) y sus sumas por
+    # días: las horas fallidas de los días [a, b) con n disponibles son acumulada[b][n] - acumulada[a][n]
+    tabla = tabla_deficit(params["REQUISITOS_TRENES_HORA"], flota_total)
+    periodo, maximo = len(tabla), tabla.max(axis=0).tolist()
+    deficit = tabla[np.arange(dias) % periodo]
+    acumulada = np.zeros((dias + 1, flota_total + 1), dtype=np.int64)
+    np.cumsum(deficit, axis=0, out=acumulada[1:])
+    deficit, acumulada = deficit.tolist(), acumulada.tolist()
+    horas_fallidas = np.zeros(num_replicas, dtype=np.int64)
+    peor_dia = np.zeros(num_replicas, dtype=np.int64)
+
+    def dias_hasta_fallo():
+        return flujo.geometrica(log_q_falla) - 1 if prob_falla > 0 else dias
+
+    def dias_hasta_mnt():
+        return flujo.geometrica(log_q_mnt) if p_hay_mnt > 0 else dias
+
+    def peor_tramo(desde, hasta, n):
+        # Mayor déficit diario de los días [desde, hasta) con n disponibles
+        if hasta - desde >= periodo: return maximo[n]
+        return max(deficit[d][n] for d in range(desde, hasta))
+
+    medidor.iniciar()
+    for sim_num in range(num_replicas):
+        if stop_event.is_set(): return None
+        disponibles = list(range(flota_total));
+        posicion = list(range(flota_total));
+        version = [0] * flota_total
+        eventos = [(dias_hasta_fallo(), EVENTO_FALLO, i, 0) for i in range(flota_total)]
+        heapq.heapify(eventos)
+        proximo_mnt = dias_hasta_mnt() - 1
+        ultimo_dia = -1;
+        num_disponibles = flota_total
+
+        def retirar(tren):
+            j = posicion[tren];
+            ultimo = disponibles.pop()
+            if ultimo != tren:
+                disponibles[j] = ultimo;
+                posicion[ultimo] = j
+
+        while True:
+            dia = min(eventos[0][0] if eventos else dias, proximo_mnt, dias)
+            if dia >= dias: break
+            if dia - ultimo_dia > 1:
+                horas_fallidas[sim_num] += acumulada[dia][num_disponibles] - acumulada[ultimo_dia + 1][num_disponibles]
+                peor_dia[sim_num] = max(peor_dia[sim_num], peor_tramo(ultimo_dia + 1, dia, num_disponibles))
+
+            # 1) Trenes que terminan hoy su reparación o mantenimiento: vuelven y sortean su próximo fallo
+            while eventos and eventos[0][0] == dia and eventos[0][1] == EVENTO_FIN_PARO:
+                _, _, tren, _ = heapq.heappop(eventos)
+                posicion[tren] = len(disponibles);
+                disponibles.append(tren)
+                version[tren] += 1
+                heapq.heappush(eventos, (dia + dias_hasta_fallo(), EVENTO_FALLO, tren, version[tren]))
+            medidor.marcar("avance")
+
+            # 2) Entrada a mantenimiento entre los disponibles al inicio del día
+            if proximo_mnt == dia:
+                num_a_mnt = min(tabla_num_mnt.sortear_uno(flujo.uniforme()), len(disponibles))
+                if num_a_mnt > 0:
+                    trenes_a_mnt = [disponibles[j] for j in flujo.elegir(len(disponibles), num_a_mnt)]
+                    tiempos_mnt = [tabla_mnt.sortear_uno(flujo.uniforme()) for _ in range(num_a_mnt)]
+                    for tren, tiempo in zip(trenes_a_mnt, tiempos_mnt):
+                        retirar(tren);
+                        version[tren] += 1
+                        heapq.heappush(eventos, (dia + tiempo, EVENTO_FIN_PARO, tren, 0))
+                    medidor.contar("entradas_mnt", num_a_mnt)
+                    if medidor.activo: medidor.contar("dias_mnt", sum(tiempos_mnt))
+                proximo_mnt = dia + dias_hasta_mnt()
+            medidor.marcar("mantenimiento")
+
+            # 3) Fallos de hoy que siguen vigentes (no anulados por un mantenimiento)
+            while eventos and eventos[0][0] == dia:
+                _, _, tren, version_evento = heapq.heappop(eventos)
+                if version_evento != version[tren]: continue
+                retirar(tren)
+                tiempo_reparacion = tabla_reparacion.sortear_uno(flujo.uniforme())
+                heapq.heappush(eventos, (dia + tiempo_reparacion, EVENTO_FIN_PARO, tren, 0))
+                medidor.contar("fallos")
+                medidor.contar("dias_reparacion", tiempo_reparacion)
+            medidor.marcar("fallos")
+
+            num_disponibles = len(disponibles)
+            horas_fallidas[sim_num] += deficit[dia][num_disponibles]
+            peor_dia[sim_num] = max(peor_dia[sim_num], deficit[dia][num_disponibles])
+            ultimo_dia = dia
+            medidor.marcar("requisitos")
+        if dias - ultimo_dia > 1:
+            horas_fallidas[sim_num] += acumulada[dias][num_disponibles] - acumulada[ultimo_dia + 1][num_disponibles]
+            peor_dia[sim_num] = max(peor_dia[sim_num], peor_tramo(ultimo_dia + 1, dias, num_disponibles))
+    _contar_resumen(medidor, horas_fallidas, flota_total, params)
+    distribucion.agregar(horas_fallidas, peor_dia)
+    return horas_fallidas
+
+
+def _simular_replicas_compilado(flota_total, params, num_replicas, rng, stop_event, medidor=MEDIDOR_INACTIVO,
+                                distribucion=DISTRIBUCION_INACTIVA):
+    # Núcleo Numba de FlotaJIT, con su propio generador por réplica; sin Numba se usa el motor vectorizado.
+    # FlotaJIT se importa aquí para no cargar Numba en los procesos que no usan este motor.
+    import FlotaJIT
+    if not FlotaJIT.DISPONIBLE:
+        return _simular_replicas_vectorizado(flota_total, params, num_replicas, rng, stop_event, medidor, distribucion)
+    if stop_event.is_set(): return None
+    _, escala_lambda_falla, escala_eta_reparacion, escala_eta_mnt = calcular_escalas(params)
+    medidor.iniciar()
+    horas_fallidas, peor_dia, contadores = FlotaJIT.simular(
+        flota_total, params["DIAS_POR_SIMULACION"], num_replicas, rng,
+        min(weibull_hazard_rate(1, params["FORMA_K_FALLA"], escala_lambda_falla), 1.0),
+        params["LISTA_MNT"], params["P_MNT"], params["FORMA_BETA_MNT_DISCRETA"], escala_eta_mnt,
+        params["FORMA_BETA_REPARACION_DISCRETA"], escala_eta_reparacion,
+        tabla_deficit(params["REQUISITOS_TRENES_HORA"], flota_total))
+    medidor.marcar("nucleo_compilado")
+    if medidor.activo:
+        for nombre, valor in zip(("fallos", "dias_reparacion", "entradas_mnt", "dias_mnt"), contadores.sum(axis=0)):
+            medidor.contar(nombre, valor)
+    _contar_resumen(medidor, horas_fallidas, flota_total, params)
+    distribucion.agregar(horas_fallidas, peor_dia)
+    return horas_fallidas
+
+
+def preparar_motor_compilado():
+    # Backend del motor "compilado" y coste de su arranque en frío (compilación o carga de la caché de Numba)
+    import FlotaJIT
+    return FlotaJIT.preparar()
+
+
+MOTORES = {
+    "bucle": _simular_replicas_bucle,
+    "vectorizado": _simular_replicas_vectorizado,
+    "eventos": _simular_replicas_eventos,
+    "compilado": _simular_replicas_compilado,
+}
+
+
+def simular_replicas(trenes_reserva, params, num_replicas, stop_event, rng=None, medidor=MEDIDOR_INACTIVO,
+                     distribucion=DISTRIBUCION_INACTIVA, traza=FlotaTraza.TRAZA_INACTIVA):
+    if rng is None: rng = np.random.default_rng(params.get("SEMILLA"))
+    motor = MOTORES[params.get("MOTOR", "bucle")]
+    flota_total = params["TRENES_OPERATIVOS_REQUERIDOS"] + trenes_reserva
+    if not traza.activa: return motor(flota_total, params, num_replicas, rng, stop_event, medidor, distribucion)
+    if motor is not _simular_replicas_vectorizado: raise ValueError("La traza diaria requiere el motor vectorizado.")
+    return motor(flota_total, params, num_replicas, rng, stop_event, medidor, distribucion, traza)
+
+
+# --- CURVA COMPLETA CON NÚMEROS ALEATORIOS COMUNES ---
+def _simular_curva_crn(reservas, params, num_replicas, rng, stop_event, medidor=MEDIDOR_INACTIVO, distribuciones=(),
+                       trazas=()):
+    # Simula a la vez varios tamaños de reserva sobre los mismos números aleatorios. El estado tiene un tercer eje
+    # (tamaños x réplicas x trenes) y cada flota es un prefijo de la flota mayor: el tren j de una réplica recibe
+    # en todos los tamaños la misma clave de mantenimiento, el mismo sorteo de fallo y las mismas duraciones.
+    # Las diferencias entre tamaños se deben así a los trenes adicionales y no al ruido de muestreo.
+    # Usa el estado compacto del motor vectorizado; los trenes que no existen en un tamaño empiezan con un paro
+    # más largo que el horizonte, así que nunca están disponibles.
+    # Devuelve las horas fallidas por tamaño y réplica (len(reservas) x num_replicas) o None si se detiene;
+    # `distribuciones` y `trazas`, si se indican, tienen una Distribucion y un escritor de FlotaTraza por tamaño.
+    dias = params["DIAS_POR_SIMULACION"]
+    escala_lambda_falla = calcular_escalas(params)[1]
+    prob_falla = weibull_hazard_rate(1, params["FORMA_K_FALLA"], escala_lambda_falla)
+    lista_mnt = np.asarray(params["LISTA_MNT"]);
+    tabla_num_mnt, tabla_reparacion, tabla_mnt = tablas_muestreo(params)
+    flotas = params["TRENES_OPERATIVOS_REQUERIDOS"] + np.asarray(reservas)
+    num_tamanos, flota_maxima = len(flotas), int(flotas.max())
+    deficit = deficit_por_dia(params["REQUISITOS_TRENES_HORA"], flota_maxima, dias)
+    forma = (num_tamanos, num_replicas, flota_maxima)
+    max_a_mnt = min(int(lista_mnt.max()), flota_maxima)
+    posiciones = np.arange(max_a_mnt)
+    idx_tamano = np.broadcast_to(np.arange(num_tamanos)[:, None, None], (num_tamanos, num_replicas, max_a_mnt))
+    idx_replica = np.broadcast_to(np.arange(num_replicas)[None, :, None], (num_tamanos, num_replicas, max_a_mnt))
+
+    paro = np.zeros(forma, dtype=_tipo_paro(dias + 1))
+    for k, flota in enumerate(flotas): paro[k, :, flota:] = dias + 1
+    signo = np.empty(forma, dtype=paro.dtype)
+    disponibles = np.empty(forma, dtype=bool)
+    mascara = np.empty(forma, dtype=bool)
+    claves_tamano = np.empty(forma)
+    candidatos = np.empty((max_a_mnt, num_tamanos, num_replicas), dtype=np.intp)
+    num_disponibles = np.empty((num_tamanos, num_replicas), dtype=np.int64)
+    por_tamano = np.empty((num_tamanos, num_replicas), dtype=np.int64)
+    horas_fallidas = np.zeros((num_tamanos, num_replicas), dtype=np.int64)
+    peor_dia = np.zeros((num_tamanos, num_replicas), dtype=np.int64)
+
+    medidor.iniciar()
+    for dia in range(dias):
+        if stop_event.is_set(): return None
+        np.sign(paro, out=signo)
+        np.subtract(paro, signo, out=paro)
+        np.equal(paro, 0, out=disponibles)
+        np.sum(disponibles, axis=2, out=num_disponibles)
+        medidor.marcar("avance")
+
+        # Sorteos comunes a todos los tamaños (un valor por réplica o por réplica y tren)
+        num_sorteado = tabla_num_mnt.sortear(rng.random(num_replicas))
+        claves = rng.random((num_replicas, flota_maxima))
+        tiempos_mnt = tabla_mnt.sortear(rng.random((num_replicas, flota_maxima)))
+        uniformes_falla = rng.random((num_replicas, flota_maxima))
+        tiempos_reparacion = tabla_reparacion.sortear(rng.random((num_replicas, flota_maxima)))
+        medidor.marcar("sorteos")
+
+        num_a_mnt = np.minimum(num_sorteado[None, :], num_disponibles)
+        if max_a_mnt > 0 and num_a_mnt.any():
+            np.copyto(claves_tamano, claves[None, :, :])
+            np.logical_not(disponibles, out=mascara)
+            np.copyto(claves_tamano, 2.0, where=mascara)
+            for j in range(max_a_mnt):
+                np.argmin(claves_tamano, axis=2, out=candidatos[j])
+                claves_tamano[idx_tamano[:, :, 0], idx_replica[:, :, 0], candidatos[j]] = 2.0
+            elegidos = posiciones[None, None, :] < num_a_mnt[:, :, None]
+            tamanos_mnt, replicas_mnt = idx_tamano[elegidos], idx_replica[elegidos]
+            trenes_mnt = np.moveaxis(candidatos, 0, 2)[elegidos]
+            duraciones = tiempos_mnt[replicas_mnt, trenes_mnt]
+            if medidor.activo:
+                medidor.contar("entradas_mnt", len(trenes_mnt))
+                medidor.contar("dias_mnt", duraciones.sum())
+            paro[tamanos_mnt, replicas_mnt, trenes_mnt] = -duraciones
+            disponibles[tamanos_mnt, replicas_mnt, trenes_mnt] = False
+        medidor.marcar("mantenimiento")
+
+        np.less(uniformes_falla[None, :, :], prob_falla, out=mascara)
+        fallan = np.logical_and(mascara, disponibles, out=mascara)
+        if medidor.activo:
+            medidor.contar("fallos", np.count_nonzero(fallan))
+            medidor.contar("dias_reparacion", np.broadcast_to(tiempos_reparacion, forma)[fallan].sum())
+        np.copyto(paro, tiempos_reparacion[None, :, :], where=fallan, casting="same_kind")
+        np.logical_xor(disponibles, fallan, out=disponibles)
+        medidor.marcar("fallos")
+
+        np.sum(disponibles, axis=2, out=num_disponibles)
+        np.take(deficit[dia], num_disponibles, out=por_tamano)
+        horas_fallidas += por_tamano
+        np.maximum(peor_dia, por_tamano, out=peor_dia)
+        medidor.marcar("requisitos")
+        if trazas:
+            # Los no disponibles que no están en mantenimiento están en reparación, salvo los trenes que no existen
+            # en un tamaño (siguen con paro positivo)
+            np.less(paro, 0, out=mascara)
+            mantenimiento = np.sum(mascara, axis=2)
+            reparacion = flotas[:, None] - num_disponibles - mantenimiento
+            for k, traza in enumerate(trazas):
+                traza.dia(dia, reparacion[k], mantenimiento[k], num_disponibles[k], por_tamano[k])
+            medidor.marcar("traza")
+    for traza in trazas: traza.terminar()
+    for distribucion, horas, peor in zip(distribuciones, horas_fallidas, peor_dia): distribucion.agregar(horas, peor)
+    if medidor.activo:
+        medidor.contar("replicas", num_replicas)
+        medidor.contar("tren_dias", num_replicas * int(flotas.sum()) * dias)
+        medidor.contar("horas_fallidas", horas_fallidas.sum())
+    return horas_fallidas
+
+
+# --- EJECUCIÓN POR BLOQUES Y EN PARALELO ---
+# Las réplicas de cada tamaño de reserva se reparten en bloques de TAMANO_BLOQUE. Cada bloque tiene su propio
+# flujo aleatorio, derivado de la semilla con SeedSequence y la clave (reserva, bloque), de modo que el resultado
+# depende solo de la semilla y no del número de procesos ni del orden en que terminan los bloques.
+def bloques_replicas(params, trenes_reserva):
+    tamano = max(1, int(params.get("TAMANO_BLOQUE", 100)))
+    num_simulaciones = params["NUM_SIMULACIONES"]
+    bloques = []
+    for i, inicio in enumerate(range(0, num_simulaciones, tamano)):
+        semilla = np.random.SeedSequence(params.get("SEMILLA"), spawn_key=(trenes_reserva, i))
+        bloques.append((min(tamano, num_simulaciones - inicio), semilla))
+    return bloques
+
+
+def traza_bloque(params, trenes_reserva, bloque):
+    # Escritor de FlotaTraza para las filas de un bloque (TRAZA_INACTIVA sin TRAZA)
+    if not params.get("TRAZA"): return FlotaTraza.TRAZA_INACTIVA
+    bloques = [num_replicas for num_replicas, _ in bloques_replicas(params, trenes_reserva)]
+    clave = FlotaCache.clave_resultado(params, "traza_reserva", trenes_reserva, VERSION_MOTOR)
+    return FlotaTraza.escritor(params["TRAZA"], trenes_reserva, params, bloques, bloque, clave)
+
+
+def trazas_curva(params, reservas, bloque):
+    # Un escritor por tamaño de la ventana; sus registros dependen de toda la ventana, que forma parte de la clave
+    if not params.get("TRAZA"): return []
+    bloques = [num_replicas for num_replicas, _ in bloques_replicas(params, reservas[0])]
+    clave = FlotaCache.clave_resultado(params, "traza_curva", list(reservas), VERSION_MOTOR)
+    return [FlotaTraza.escritor(params["TRAZA"], n, params, bloques, bloque, clave) for n in reservas]
+
+
+def iterar_bloques_reserva(trenes_reserva, params, stop_event, paralelo=None, siguientes=None,
+                           medidor=MEDIDOR_INACTIVO, distribucion=DISTRIBUCION_INACTIVA, desde=0):
+    # Produce las horas fallidas de cada bloque en orden de bloque, a partir del bloque `desde`; None si la
+    # simulación se detiene. `siguientes` indica al modo paralelo qué reservas puede adelantar (por defecto, las
+    # siguientes en orden).
+    if paralelo is not None:
+        yield from paralelo.iterar(trenes_reserva, siguientes, medidor, distribucion, desde)
+        return
+    for bloque, (num_replicas, semilla) in enumerate(bloques_replicas(params, trenes_reserva)[desde:], desde):
+        horas_fallidas = simular_replicas(trenes_reserva, params, num_replicas, stop_event,
+                                          np.random.default_rng(semilla), medidor, distribucion,
+                                          traza_bloque(params, trenes_reserva, bloque))
+        yield horas_fallidas
+        if horas_fallidas is None: return
+
+
+def iterar_reserva(trenes_reserva, params, stop_event, paralelo=None, siguientes=None, secuencial=False,
+                   medidor=MEDIDOR_INACTIVO, distribucion=DISTRIBUCION_INACTIVA, inicial=None):
+    # Produce el acumulado de horas fallidas por réplica tras cada bloque (None si la simulación se detiene).
+    # Monte Carlo secuencial: se deja de simular en cuanto el intervalo de confianza queda claramente por encima o
+    # por debajo del objetivo, o es más estrecho que TOLERANCIA_ERROR; NUM_SIMULACIONES actúa como máximo.
+    # La decisión se toma bloque a bloque en orden, así que el resultado no depende del número de procesos.
+    # La distribución solo recibe los bloques consumidos, de modo que coincide con las réplicas acumuladas.
+    # `inicial` = (bloques, acumulado) continúa una reserva empezada (ver FlotaPuntoControl): se produce primero ese
+    # acumulado y después los bloques siguientes.
+    partes = []
+    desde = 0
+    if inicial is not None:
+        desde, acumulado = inicial
+        partes.append(acumulado)
+        yield acumulado
+        if secuencial and _decision_secuencial(acumulado, params): return
+    bloques = iterar_bloques_reserva(trenes_reserva, params, stop_event, paralelo, siguientes, medidor, distribucion,
+                                     desde)
+    try:
+        for horas_fallidas in bloques:
+            if horas_fallidas is None:
+                yield None
+                return
+            partes.append(horas_fallidas)
+            acumulado = np.concatenate(partes, axis=-1)
+            yield acumulado
+            if secuencial and _decision_secuencial(acumulado, params): return
+    finally:
+        bloques.close()
+
+
+def _decision_secuencial(horas_fallidas, params):
+    if horas_fallidas.shape[-1] < 2: return False
+    objetivo = params["NIVEL_SERVICIO_DESEADO"]
+    estimacion = estimar_nivel(horas_fallidas, params)
+    ic_inf, ic_sup = estimacion["ic_inf"], estimacion["ic_sup"]
+    return ic_inf >= objetivo or ic_sup < objetivo or (ic_sup - ic_inf) / 2 <= params.get("TOLERANCIA_ERROR", 0.0005)
+
+
+def _ultimo_acumulado(acumulados):
+    acumulado = np.zeros(0, dtype=np.int64)
+    for acumulado in acumulados:
+        if acumulado is None: return None
+    return acumulado
+
+
+def simular_reserva(trenes_reserva, params, stop_event, paralelo=None, siguientes=None):
+    return _ultimo_acumulado(iterar_reserva(trenes_reserva, params, stop_event, paralelo, siguientes))
+
+
+def simular_reserva_secuencial(trenes_reserva, params, stop_event, paralelo=None, siguientes=None):
+    return _ultimo_acumulado(iterar_reserva(trenes_reserva, params, stop_event, paralelo, siguientes, True))
+
+
+_evento_parada_proceso = None
+
+
+def _inicializar_proceso(evento_parada):
+    global _evento_parada_proceso
+    _evento_parada_proceso = evento_parada
+
+
+def iterar_curva(reservas, params, stop_event, paralelo=None, medidor=MEDIDOR_INACTIVO, distribuciones=(), desde=0):
+    # Horas fallidas (tamaños x réplicas) de cada bloque de la curva de `reservas`, en orden y a partir del bloque
+    # `desde`; None si se detiene. Los bloques se identifican por la primera reserva de la ventana.
+    if paralelo is not None:
+        yield from paralelo.iterar_curva(reservas, medidor, distribuciones, desde)
+        return
+    for bloque, (num_replicas, semilla) in enumerate(bloques_replicas(params, reservas[0])[desde:], desde):
+        horas_fallidas = _simular_curva_crn(reservas, params, num_replicas, np.random.default_rng(semilla), stop_event,
+                                            medidor, distribuciones, trazas_curva(params, reservas, bloque))
+        yield horas_fallidas
+        if horas_fallidas is None: return
+
+
+def simular_curva(reservas, params, stop_event, paralelo=None, medidor=MEDIDOR_INACTIVO, distribuciones=()):
+    # Horas fallidas (tamaños x réplicas) de todos los tamaños de `reservas` con números aleatorios comunes
+    partes = []
+    for horas_fallidas in iterar_curva(reservas, params, stop_event, paralelo, medidor, distribuciones):
+        if horas_fallidas is None: return None
+        partes.append(horas_fallidas)
+    return np.concatenate(partes, axis=1) if partes else np.zeros((len(reservas), 0), dtype=np.int64)
+
+
+# Los procesos devuelven (horas fallidas, pid, duración, datos del medidor o None, datos de la distribución o
+# lista de ellos por tamaño en las curvas). Los trabajadores de FlotaDistribuido pasan su propio evento de parada
+# por bloque y sustituyen el pid por su nombre. `bloque` es el índice del bloque, para la traza diaria.
+def _simular_bloque_en_proceso(trenes_reserva, params, num_replicas, semilla, bloque, evento_parada=None):
+    inicio = time.perf_counter()
+    medidor = crear_medidor(params)
+    distribucion = Distribucion()
+    if evento_parada is None: evento_parada = _evento_parada_proceso
+    horas_fallidas = simular_replicas(trenes_reserva, params, num_replicas, evento_parada,
+                                      np.random.default_rng(semilla), medidor, distribucion,
+                                      traza_bloque(params, trenes_reserva, bloque))
+    return horas_fallidas, os.getpid(), time.perf_counter() - inicio, medidor.datos(), distribucion.datos()
+
+
+def _simular_curva_en_proceso(reservas, params, num_replicas, semilla, bloque, evento_parada=None):
+    inicio = time.perf_counter()
+    medidor = crear_medidor(params)
+    distribuciones = [Distribucion() for _ in reservas]
+    if evento_parada is None: evento_parada = _evento_parada_proceso
+    horas_fallidas = _simular_curva_crn(reservas, params, num_replicas, np.random.default_rng(semilla),
+                                        evento_parada, medidor, distribuciones,
+                                        trazas_curva(params, reservas, bloque))
+    return (horas_fallidas, os.getpid(), time.perf_counter() - inicio, medidor.datos(),
+            [distribucion.datos() for distribucion in distribuciones])
+
+
+class SimuladorParalelo:
+    # Reparte los bloques de réplicas entre un ProcessPoolExecutor. Mientras se espera una reserva se adelantan
+    # los bloques de las siguientes para que ningún proceso quede ocioso; si la búsqueda termina antes, se cancelan.
+    # Con `executor` (un FlotaDistribuido.Coordinador) los bloques se calculan en los trabajadores conectados a él;
+    # ese ejecutor es compartido y no se cierra con la búsqueda.
+    def __init__(self, params, stop_event, num_procesos=None, executor=None):
+        self.params = params
+        self.stop_event = stop_event
+        self.num_procesos = num_procesos or params.get("NUM_PROCESOS", 1)
+        self.propio = executor is None
+        if self.propio:
+            contexto = multiprocessing.get_context("spawn")
+            self.evento_parada = contexto.Event()
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.num_procesos, mp_context=contexto,
+                initializer=_inicializar_proceso, initargs=(self.evento_parada,))
+        else:
+            # Los bloques ya enviados se abandonan al cancelar sus futuros
+            self.evento_parada = threading.Event()
+            self.executor = executor
+        self.futuros = {}
+        self.rendimiento = {}
+
+    def _registrar(self, num_replicas, futuro):
+        if futuro.cancelled() or futuro.exception() is not None: return
+        horas_fallidas, pid, duracion, *_ = futuro.result()
+        if horas_fallidas is None: return
+        datos = self.rendimiento.setdefault(pid, {"replicas": 0, "tiempo": 0.0})
+        datos["replicas"] += num_replicas;
+        datos["tiempo"] += duracion
+
+    def _enviar(self, trenes_reserva, desde=0):
+        # self.futuros guarda, por reserva, el primer bloque enviado y los futuros de ese bloque en adelante
+        if trenes_reserva in self.futuros: return
+        futuros = []
+        for bloque, (num_replicas, semilla) in enumerate(bloques_replicas(self.params, trenes_reserva)[desde:], desde):
+            futuro = self.executor.submit(_simular_bloque_en_proceso, trenes_reserva, self.params, num_replicas,
+                                          semilla, bloque)
+            futuro.add_done_callback(lambda f, n=num_replicas: self._registrar(n, f))
+            futuros.append(futuro)
+        self.futuros[trenes_reserva] = (desde, futuros)
+
+    def _pendientes(self):
+        return sum(not f.done() for _, futuros in self.futuros.values() for f in futuros)
+
+    def _procesos(self):
+        # En modo distribuido, los trabajadores conectados en este momento
+        return self.num_procesos if self.propio else max(1, self.executor.capacidad())
+
+    def iterar(self, trenes_reserva, siguientes=None, medidor=MEDIDOR_INACTIVO, distribucion=DISTRIBUCION_INACTIVA,
+               desde=0):
+        # Resultados de los bloques de una reserva en orden desde el bloque `desde`; los bloques no consumidos (y
+        # los anteriores a `desde` si la reserva se había adelantado) se cancelan
+        self._enviar(trenes_reserva, desde)
+        procesos = self._procesos()
+        if siguientes is None: siguientes = range(trenes_reserva + 1, trenes_reserva + 1 + 4 * procesos)
+        for n in siguientes:
+            if self._pendientes() >= 2 * procesos: break
+            self._enviar(n)
+        enviado, futuros = self.futuros.pop(trenes_reserva)
+        for futuro in futuros[:desde - enviado]: futuro.cancel()
+        futuros = futuros[desde - enviado:]
+        try:
+            for futuro in futuros:
+                horas_fallidas = self._esperar(futuro, medidor, distribucion)
+                yield horas_fallidas
+                if horas_fallidas is None: return
+        finally:
+            for futuro in futuros: futuro.cancel()
+
+    def iterar_curva(self, reservas, medidor=MEDIDOR_INACTIVO, distribuciones=(), desde=0):
+        futuros = []
+        for bloque, (num_replicas, semilla) in enumerate(bloques_replicas(self.params, reservas[0])[desde:], desde):
+            futuro = self.executor.submit(_simular_curva_en_proceso, list(reservas), self.params, num_replicas,
+                                          semilla, bloque)
+            futuro.add_done_callback(lambda f, n=num_replicas: self._registrar(n, f))
+            futuros.append(futuro)
+        try:
+            for futuro in futuros:
+                horas_fallidas = self._esperar(futuro, medidor, distribuciones)
+                yield horas_fallidas
+                if horas_fallidas is None: return
+        finally:
+            for futuro in futuros: futuro.cancel()
+
+    def _esperar(self, futuro, medidor=MEDIDOR_INACTIVO, distribucion=DISTRIBUCION_INACTIVA):
+        # `distribucion` es una Distribucion o, en las curvas, una secuencia de ellas (una por tamaño)
+        while True:
+            if self.stop_event.is_set():
+                self.detener()
+                return None
+            try:
+                horas_fallidas, _, _, datos, datos_distribucion = futuro.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                continue
+            medidor.combinar(datos)
+            if horas_fallidas is None: return None
+            if isinstance(distribucion, Distribucion):
+                distribucion.combinar(datos_distribucion)
+            else:
+                for parte, datos_parte in zip(distribucion, datos_distribucion): parte.combinar(datos_parte)
+            return horas_fallidas
+
+    def detener(self):
+        self.evento_parada.set()
+        for _, futuros in self.futuros.values():
+            for futuro in futuros: futuro.cancel()
+        self.futuros.clear()
+
+    def cerrar(self):
+        self.detener()
+        if self.propio: self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def ejecutar_simulacion_unitaria(trenes_reserva, params, stop_event, rng=None):
+    if rng is None:
+        horas_fallidas = simular_reserva(trenes_reserva, params, stop_event)
+    else:
+        horas_fallidas = simular_replicas(trenes_reserva, params, params["NUM_SIMULACIONES"], stop_event, rng)
+    if horas_fallidas is None: return None
+    return estimar_nivel(horas_fallidas, params)["nivel"]
 
 
 def get_discrete_weibull_pmf(x_range, beta, eta):
@@ -83,37 +1271,455 @@ def get_discrete_weibull_pmf(x_range, beta, eta):
     return [q ** ((k - 1) ** beta) - q ** (k ** beta) for k in x_range]
 
 
+# --- MODELO ANALÍTICO ---
+def media_weibull_discreta(beta, eta):
+    # E[T] = sum_{k>=0} P(T > k) = sum_{k>=0} q^(k^beta)
+    q = math.exp(-(1.0 / eta) ** beta)
+    k = np.arange(0, 10000)
+    return float(np.sum(q ** (k ** float(beta))))
+
+
+def nivel_servicio_analitico(trenes_reserva, params):
+    # Aproximación de tipo reparador/pérdidas de Erlang. Cada tren alterna entre operativo y parado:
+    #  - las reparaciones son de fuente finita: un tren operativo falla con la probabilidad diaria que aplica el
+    #    simulador, h(1), y queda parado E[T_rep] días, así que el número de trenes en reparación es binomial;
+    #  - el mantenimiento es un sistema con infinitos servidores alimentado con E[LISTA_MNT] trenes al día durante
+    #    E[T_mnt] días, así que el número de trenes en mantenimiento es de Poisson.
+    # La disponibilidad diaria es la flota menos la convolución de ambos y se compara hora a hora con los requisitos.
+    flota_total = params["TRENES_OPERATIVOS_REQUERIDOS"] + trenes_reserva
+    _, escala_lambda_falla, escala_eta_reparacion, escala_eta_mnt = calcular_escalas(params)
+    prob_falla = min(weibull_hazard_rate(1, params["FORMA_K_FALLA"], escala_lambda_falla), 1.0)
+    media_reparacion = media_weibull_discreta(params["FORMA_BETA_REPARACION_DISCRETA"], escala_eta_reparacion)
+    media_mnt = media_weibull_discreta(params["FORMA_BETA_MNT_DISCRETA"], escala_eta_mnt)
+    entradas_mnt = float(np.dot(params["LISTA_MNT"], params["P_MNT"]))
+    carga_mnt = min(entradas_mnt * media_mnt, flota_total)
+    fraccion_operativa = (1 - carga_mnt / flota_total) / (1 + prob_falla * media_reparacion)
+    pi_reparacion = min(max(fraccion_operativa * prob_falla * media_reparacion, 1e-12), 1 - 1e-12)
+
+    k = np.arange(flota_total + 1)
+    log_comb = np.array([math.lgamma(flota_total + 1) - math.lgamma(i + 1) - math.lgamma(flota_total - i + 1)
+                         for i in k])
+    pmf_reparacion = np.exp(log_comb + k * math.log(pi_reparacion) + (flota_total - k) * math.log1p(-pi_reparacion))
+    pmf_mnt = np.exp(-carga_mnt + k * math.log(carga_mnt) - np.array([math.lgamma(i + 1) for i in k])) \
+        if carga_mnt > 0 else (k == 0).astype(float)
+    pmf_fuera = np.convolve(pmf_reparacion, pmf_mnt)[:flota_total + 1]
+    pmf_fuera[-1] += max(0.0, 1 - pmf_fuera.sum())
+    # Horas fallidas esperadas con cada perfil de requisitos, ponderadas por los días del horizonte que lo usan
+    tabla = tabla_deficit(params["REQUISITOS_TRENES_HORA"], flota_total)
+    dias_por_perfil = np.bincount(np.arange(params["DIAS_POR_SIMULACION"]) % len(tabla), minlength=len(tabla))
+    deficit_esperado = np.average(tabla[:, flota_total - k] @ pmf_fuera, weights=dias_por_perfil)
+    return float(1 - deficit_esperado / HORAS_DIA)
+
+
+def estimar_reserva_analitica(params, max_reserva=None):
+    # Menor reserva cuyo nivel analítico alcanza el objetivo (punto de partida de la búsqueda por bisección)
+    if max_reserva is None: max_reserva = 10 * params["TRENES_OPERATIVOS_REQUERIDOS"]
+    for n_reserva in range(max_reserva + 1):
+        nivel = nivel_servicio_analitico(n_reserva, params)
+        if nivel >= params["NIVEL_SERVICIO_DESEADO"]: return n_reserva, nivel
+    return max_reserva, nivel
+
+
+# --- ESTRATEGIAS DE BÚSQUEDA ---
+# Cada estrategia es un generador de eventos de progreso ("reserva_iniciada", "bloque") que, por cada tamaño
+# evaluado, produce un evento "punto" con las horas fallidas por réplica (None si la simulación se detuvo),
+# su Distribucion (None si salió de una entrada de caché sin ella), la duración y si el resultado salió de la caché.
+# Con un punto de control (FlotaPuntoControl) los puntos ya guardados se reproducen sin simular (con "reanudado") y
+# la reserva o ventana en curso continúa desde su último bloque guardado.
+RACHA_PERFECTA = 3  # tamaños seguidos con 100% que terminan las búsquedas ordenadas
+
+
+def _evento_guardado(n_reserva, guardado, horas_fallidas, distribucion):
+    # Punto ya evaluado antes de interrumpir la búsqueda, tal como se produjo entonces
+    return {"tipo": "punto", "n_reserva": n_reserva, "horas_fallidas": horas_fallidas,
+            "distribucion": Distribucion.desde_array(distribucion) if distribucion is not None else None,
+            "duracion": guardado["duracion"], "desde_cache": guardado["desde_cache"], "medicion": guardado["medicion"],
+            "reanudado": True}
+
+
+def _evaluar_reserva(n_reserva, params, stop_event, paralelo, cache, control=None, siguientes=None):
+    yield {"tipo": "reserva_iniciada", "n_reserva": n_reserva}
+    start_time = time.time()
+    secuencial = bool(params.get("SECUENCIAL"))
+    guardado = control.punto("reserva", n_reserva) if control is not None else None
+    if guardado is not None:
+        yield _evento_guardado(n_reserva, guardado, guardado["horas"], guardado["distribucion"])
+        return
+    clave = clave_distribucion = None
+    if cache is not None:
+        tipo = "reserva_secuencial" if secuencial else "reserva"
+        clave = FlotaCache.clave_resultado(params, tipo, n_reserva, VERSION_MOTOR)
+        clave_distribucion = FlotaCache.clave_resultado(params, "distribucion_" + tipo, n_reserva, VERSION_MOTOR)
+        horas_fallidas = cache.obtener(clave)
+        if horas_fallidas is not None:
+            datos_distribucion = cache.obtener(clave_distribucion, contar=False)
+            duracion = time.time() - start_time
+            if control is not None:
+                control.guardar_punto("reserva", n_reserva, horas_fallidas, datos_distribucion, None, duracion, True)
+            yield {"tipo": "punto", "n_reserva": n_reserva, "horas_fallidas": horas_fallidas,
+                   "distribucion": Distribucion.desde_array(datos_distribucion)
+                   if datos_distribucion is not None else None,
+                   "duracion": duracion, "desde_cache": True, "medicion": None}
+            return
+    medidor = crear_medidor(params)
+    distribucion = Distribucion()
+    # Los acumuladores de una reserva empezada antes de interrumpir la búsqueda continúan desde el punto de control
+    parcial = control.parcial_de("reserva", n_reserva) if control is not None else None
+    inicial = None
+    bloques = 0
+    if parcial is not None:
+        medidor.combinar(parcial["medicion"])
+        distribucion = Distribucion.desde_array(parcial["distribucion"])
+        inicial = (parcial["bloques"], parcial["horas"])
+        bloques = parcial["bloques"] - 1
+        start_time -= parcial["duracion"]
+    horas_fallidas = np.zeros(0, dtype=np.int64)
+    for horas_fallidas in iterar_reserva(n_reserva, params, stop_event, paralelo, siguientes, secuencial, medidor,
+                                         distribucion, inicial):
+        if horas_fallidas is None: break
+        bloques += 1
+        if control is not None:
+            control.guardar_parcial("reserva", n_reserva, bloques, horas_fallidas, distribucion.a_array(),
+                                    medidor.datos(), time.time() - start_time)
+        yield dict(estimar_nivel(horas_fallidas, params), tipo="bloque", n_reserva=n_reserva)
+    duracion = time.time() - start_time
+    if horas_fallidas is not None and cache is not None:
+        cache.guardar(clave, horas_fallidas)
+        cache.guardar(clave_distribucion, distribucion.a_array())
+    if horas_fallidas is not None and control is not None:
+        control.guardar_punto("reserva", n_reserva, horas_fallidas, distribucion.a_array(), medidor.datos(), duracion)
+    yield {"tipo": "punto", "n_reserva": n_reserva, "horas_fallidas": horas_fallidas, "distribucion": distribucion,
+           "duracion": duracion, "desde_cache": False, "medicion": medidor.datos()}
+
+
+def _puntos_busqueda_lineal(params, stop_event, paralelo, cache, control=None):
+    n_reserva = 0
+    while True:
+        yield from _evaluar_reserva(n_reserva, params, stop_event, paralelo, cache, control)
+        n_reserva += 1
+
+
+def _puntos_busqueda_crn(params, stop_event, paralelo, cache, control=None):
+    # Evalúa ventanas de tamaños de una vez con números aleatorios comunes y las recorre en orden. Cada tamaño
+    # simula su propia flota, así que una ventana solo cubre los tamaños que la búsqueda puede necesitar: la primera
+    # llega hasta la estimación analítica más la racha de RACHA_PERFECTA tamaños con 100%, y cada una de las
+    # siguientes termina donde se completaría la racha si todos sus tamaños llegaran al 100%. VENTANA_CRN limita el
+    # número de tamaños por ventana.
+    maximo = max(1, int(params.get("VENTANA_CRN", 16)))
+    ancho = estimar_reserva_analitica(params)[0] + RACHA_PERFECTA + 1
+    inicio = racha = 0
+    while True:
+        ancho = min(ancho, maximo)
+        reservas = list(range(inicio, inicio + ancho))
+        yield {"tipo": "reserva_iniciada", "n_reserva": inicio, "reservas": reservas}
+        start_time = time.time()
+        guardado = control.punto("curva", inicio) if control is not None else None
+        if guardado is not None:
+            distribuciones = guardado["distribucion"] if guardado["distribucion"] is not None else [None] * ancho
+            for i, n_reserva in enumerate(reservas):
+                evento = _evento_guardado(n_reserva, guardado, guardado["horas"][i], distribuciones[i])
+                evento.update(duracion=guardado["duracion"] / ancho, etiqueta=f"{reservas[0]}-{reservas[-1]}")
+                if i > 0: evento["medicion"] = None
+                racha = 0 if guardado["horas"][i].any() else racha + 1
+                yield evento
+            inicio += ancho
+            ancho = RACHA_PERFECTA - racha
+            continue
+        clave = clave_distribucion = None
+        if cache is not None:
+            clave = FlotaCache.clave_resultado(params, "curva", reservas, VERSION_MOTOR)
+            clave_distribucion = FlotaCache.clave_resultado(params, "distribucion_curva", reservas, VERSION_MOTOR)
+        horas_fallidas = cache.obtener(clave) if cache is not None else None
+        desde_cache = horas_fallidas is not None
+        medidor = crear_medidor(params)
+        if desde_cache:
+            datos_distribucion = cache.obtener(clave_distribucion, contar=False)
+            distribuciones = [Distribucion.desde_array(fila) for fila in datos_distribucion] \
+                if datos_distribucion is not None else [None] * len(reservas)
+        else:
+            distribuciones = [Distribucion() for _ in reservas]
+            partes, desde = [], 0
+            parcial = control.parcial_de("curva", inicio) if control is not None else None
+            if parcial is not None:
+                medidor.combinar(parcial["medicion"])
+                distribuciones = [Distribucion.desde_array(fila) for fila in parcial["distribucion"]]
+                partes, desde = [parcial["horas"]], parcial["bloques"]
+                start_time -= parcial["duracion"]
+            horas_fallidas = np.concatenate(partes, axis=1) if partes else np.zeros((ancho, 0), dtype=np.int64)
+            for bloques, horas_bloque in enumerate(iterar_curva(reservas, params, stop_event, paralelo, medidor,
+                                                                distribuciones, desde), desde + 1):
+                if horas_bloque is None:
+                    horas_fallidas = None
+                    break
+                partes.append(horas_bloque)
+                horas_fallidas = np.concatenate(partes, axis=1)
+                if control is not None:
+                    control.guardar_parcial("curva", inicio, bloques, horas_fallidas,
+                                            _apilar([d.a_array() for d in distribuciones]), medidor.datos(),
+                                            time.time() - start_time)
+            if horas_fallidas is not None and cache is not None:
+                cache.guardar(clave, horas_fallidas)
+                cache.guardar(clave_distribucion, _apilar([d.a_array() for d in distribuciones]))
+        duration = time.time() - start_time
+        if horas_fallidas is None:
+            yield {"tipo": "punto", "n_reserva": inicio, "horas_fallidas": None, "distribucion": None,
+                   "duracion": duration, "desde_cache": False, "medicion": None}
+            return
+        if control is not None:
+            control.guardar_punto("curva", inicio, horas_fallidas,
+                                  None if distribuciones[0] is None else _apilar([d.a_array() for d in distribuciones]),
+                                  medidor.datos(), duration, desde_cache)
+        # La ventana se simula de una vez: su medición se atribuye al primer tamaño con la etiqueta "inicio-fin".
+        # Un tamaño llega al 100% cuando ninguna réplica tiene horas fallidas.
+        for i, n_reserva in enumerate(reservas):
+            racha = 0 if horas_fallidas[i].any() else racha + 1
+            yield {"tipo": "punto", "n_reserva": n_reserva, "horas_fallidas": horas_fallidas[i],
+                   "distribucion": distribuciones[i],
+                   "duracion": duration / ancho, "desde_cache": desde_cache,
+                   "medicion": medidor.datos() if i == 0 else None, "etiqueta": f"{reservas[0]}-{reservas[-1]}"}
+        inicio += ancho
+        ancho = RACHA_PERFECTA - racha
+
+
+def _puntos_busqueda_biseccion(params, stop_event, paralelo, cache, control=None):
+    # Parte de la estimación analítica, galopa (pasos 1, 2, 4...) hasta acotar la reserva mínima entre una que no
+    # cumple y otra que sí, y divide el intervalo por la mitad. Supone que el nivel crece con la reserva, así que
+    # solo se simula un número logarítmico de tamaños. No busca la flota 'perfecta'.
+    n_reserva, _ = estimar_reserva_analitica(params)
+    bajo, alto = -1, None  # Mayor reserva que no cumple y menor reserva que cumple
+    paso = 1
+    while alto is None or alto - bajo > 1:
+        for evento in _evaluar_reserva(n_reserva, params, stop_event, paralelo, cache, control, siguientes=()):
+            yield evento
+        horas_fallidas = evento["horas_fallidas"]
+        if horas_fallidas is None: return
+        nivel = estimar_nivel(horas_fallidas, params)["nivel"]
+        if nivel >= params["NIVEL_SERVICIO_DESEADO"]:
+            alto = n_reserva
+        else:
+            bajo = n_reserva
+        if alto is None:
+            n_reserva = bajo + paso;
+            paso *= 2
+        elif bajo == -1 and alto > 0:
+            n_reserva = max(alto - paso, 0);
+            paso *= 2
+        else:
+            n_reserva = (bajo + alto) // 2
+
+
+def _apilar(arrays):
+    # Filas de distinta longitud completadas con ceros (los histogramas recortados de cada tamaño de la ventana)
+    filas = np.zeros((len(arrays), max(len(a) for a in arrays)))
+    for fila, array in zip(filas, arrays): fila[:len(array)] = array
+    return filas
+
+
+MODOS_BUSQUEDA = {
+    "lineal": _puntos_busqueda_lineal,
+    "crn": _puntos_busqueda_crn,
+    "biseccion": _puntos_busqueda_biseccion,
+}
+# Modos que recorren las reservas en orden creciente y aplican la regla de la racha de 100%
+MODOS_ORDENADOS = {"lineal", "crn"}
+
+
 # --- FUNCIÓN PRINCIPAL DE ANÁLISIS ---
+# iterar_analisis() es la API de streaming: produce eventos estructurados y no acumula el log. Cada evento con
+# texto lleva solo sus propias líneas, de modo que el log completo es la concatenación de los textos y cualquier
+# consumidor puede procesar cada actualización en tiempo constante. Eventos:
+#   "inicio"             -> {"texto", "params"}
+#   "reserva_iniciada"   -> {"n_reserva"} (en modo crn, además "reservas" de la ventana)
+#   "bloque"             -> {"n_reserva", "replicas", "nivel", "ic_inf", "ic_sup"} (estadísticas acumuladas)
+#   "reserva_finalizada" -> {"n_reserva", "punto", "nivel", "ic_inf", "ic_sup", "replicas", "duracion",
+#                            "error_estandar", "tamano_efectivo", "desde_cache", "comentario", "trenes_optimos",
+#                            "texto", "distribucion", "reanudado"} (distribucion: Distribucion.resumen() o None;
+#                            reanudado: el punto procede del punto de control de una ejecución interrumpida)
+#   "fin"                -> {"texto", "resultados"} (resultados sin "log_text")
+# Con INSTRUMENTACION, "reserva_finalizada" lleva además "medicion" y los resultados "instrumentacion"; con
+# PERFILADO ("cprofile" o "muestreo") los resultados incluyen el informe en "perfil". El perfilador solo observa
+# el hilo que consume el generador, y solo mientras el generador trabaja; con varios procesos el tiempo de los
+# motores queda fuera del perfil pero sí aparece en los tiempos por fase.
+def iterar_analisis(params, stop_event):
+    # La reducción de varianza la implementa el motor vectorizado; la búsqueda crn ya correlaciona los tamaños con
+    # números aleatorios comunes y sus curvas no admiten filas adicionales, así que en ella se desactiva
+    avisos = []
+    reduccion = params.get("REDUCCION_VARIANZA", "ninguna")
+    if reduccion not in MODOS_REDUCCION:
+        raise ValueError(f"REDUCCION_VARIANZA debe ser uno de: {', '.join(MODOS_REDUCCION)} (no '{reduccion}')")
+    if reduccion != "ninguna" and params.get("MODO_BUSQUEDA") == "crn":
+        avisos.append(f"La búsqueda crn no admite la reducción de varianza '{reduccion}': se desactiva.")
+        params = dict(params, REDUCCION_VARIANZA="ninguna")
+    elif reduccion != "ninguna" and params.get("MOTOR") != "vectorizado":
+        avisos.append(f"La reducción de varianza '{reduccion}' usa el motor vectorizado en lugar de "
+                      f"'{params.get('MOTOR', 'bucle')}'.")
+        params = dict(params, MOTOR="vectorizado")
+    # La búsqueda crn simula cada ventana con todas las réplicas, así que tampoco admite la parada secuencial
+    if params.get("SECUENCIAL") and params.get("MODO_BUSQUEDA") == "crn":
+        avisos.append("La búsqueda crn no admite el Monte Carlo secuencial: se simulan todas las réplicas.")
+        params = dict(params, SECUENCIAL=False)
+    # La traza diaria la escriben el motor vectorizado y el de curvas crn, y solo en los puntos que se simulan
+    if params.get("TRAZA"):
+        if params.get("MODO_BUSQUEDA") != "crn" and params.get("MOTOR") != "vectorizado":
+            avisos.append(f"La traza diaria usa el motor vectorizado en lugar de '{params.get('MOTOR', 'bucle')}'.")
+            params = dict(params, MOTOR="vectorizado")
+        if params.get("CACHE"):
+            avisos.append("La traza diaria necesita simular todos los puntos: se desactiva la caché.")
+            params = dict(params, CACHE=False)
+    # El motor compilado se prepara antes de la búsqueda para medir su arranque en frío; sin Numba se sustituye
+    # por el vectorizado también en los parámetros, de modo que la caché no mezcle resultados de ambos
+    motor_compilado = None
+    if params.get("MOTOR") == "compilado":
+        motor_compilado = preparar_motor_compilado()
+        if motor_compilado["backend"] != "numba": params = dict(params, MOTOR="vectorizado")
+    # Con PUNTO_CONTROL la búsqueda guarda su progreso en ese fichero y, si ya contiene el de una ejecución con los
+    # mismos parámetros, continúa desde él con su semilla (ver FlotaPuntoControl)
+    control = FlotaPuntoControl.abrir(params, VERSION_MOTOR) if params.get("PUNTO_CONTROL") else None
+    if control is not None: params = control.params
+    # Se fija la semilla de la ejecución para poder reproducirla aunque el usuario no haya indicado ninguna
+    if params.get("SEMILLA") is None: params = dict(params, SEMILLA=np.random.SeedSequence().entropy)
+    # Con DISTRIBUIDO ("host:puerto") los bloques se reparten entre los trabajadores de FlotaDistribuido
+    coordinador = FlotaDistribuido.coordinador(params["DISTRIBUIDO"]) if params.get("DISTRIBUIDO") else None
+    if coordinador is not None:
+        paralelo = SimuladorParalelo(params, stop_event, executor=coordinador)
+    else:
+        paralelo = SimuladorParalelo(params, stop_event) if params.get("NUM_PROCESOS", 1) > 1 else None
+    cache = FlotaCache.CacheResultados(params.get("DIRECTORIO_CACHE"), params.get("TAMANO_MAX_CACHE_MB", 256)) \
+        if params.get("CACHE") else None
+    perfilador = crear_perfilador(params)
+    try:
+        eventos = _iterar_analisis(params, stop_event, paralelo, cache, motor_compilado, avisos, control)
+        if perfilador is None:
+            yield from eventos
+        else:
+            yield from _perfilar(eventos, perfilador)
+    finally:
+        if paralelo is not None: paralelo.cerrar()
+        if coordinador is not None: FlotaDistribuido.soltar(coordinador)
+        if cache is not None: cache.cerrar()
+        if isinstance(perfilador, PerfiladorMuestreo): perfilador.cerrar()
+        if control is not None: control.cerrar()
+
+
+def _perfilar(eventos, perfilador):
+    # Activa el perfilador solo mientras se calcula el siguiente evento, no mientras el consumidor lo procesa
+    while True:
+        perfilador.enable()
+        try:
+            evento = next(eventos)
+        except StopIteration:
+            return
+        finally:
+            perfilador.disable()
+        if evento["tipo"] == "fin": evento["resultados"]["perfil"] = informe_perfilador(perfilador)
+        yield evento
+
+
 def run_full_analysis(params, stop_event, progress_callback=None):
+    log_text = ""
+    history = []
+    results = None
+    for evento in iterar_analisis(params, stop_event):
+        log_text += evento.get("texto", "")
+        if evento["tipo"] == "reserva_finalizada":
+            history.append(evento["punto"])
+            if progress_callback:
+                progress_callback(log_text, history)
+        elif evento["tipo"] == "fin":
+            results = evento["resultados"]
+    results["log_text"] = log_text
+    return results
+
+
+def _iterar_analisis(params, stop_event, paralelo, cache, motor_compilado=None, avisos=(), control=None):
+    modo = params.get("MODO_BUSQUEDA", "lineal")
+    reduccion = params.get("REDUCCION_VARIANZA", "ninguna")
+    busqueda_ordenada = modo in MODOS_ORDENADOS
+    reserva_analitica, nivel_analitico = estimar_reserva_analitica(params)
     log_text = f"Iniciando búsqueda de flota...\n"
     log_text += f"1º Objetivo: Encontrar la flota mínima para un servicio >= {params['NIVEL_SERVICIO_DESEADO']:.2%}\n"
-    log_text += f"2º Objetivo: Continuar hasta encontrar una flota 'perfecta' (3x 100% seguidos)\n"
-    log_text += "-" * 80 + "\n"
-    log_text += "{:<15} | {:<16} | {:<12} | {}\n".format("Trenes Reserva", "Nivel Servicio", "Tiempo (s)", "Comentario")
-    log_text += "-" * 80 + "\n"
+    if busqueda_ordenada:
+        log_text += f"2º Objetivo: Continuar hasta encontrar una flota 'perfecta' ({RACHA_PERFECTA}x 100% seguidos)\n"
+    else:
+        log_text += f"Búsqueda por galope y bisección a partir de la estimación analítica\n"
+    log_text += f"Estimación analítica: {reserva_analitica} trenes de reserva (nivel estimado {nivel_analitico:.4%})\n"
+    log_text += f"Motor de simulación: {params.get('MOTOR', 'bucle')} | Procesos: {params.get('NUM_PROCESOS', 1)}"
+    log_text += f" | Semilla: {params['SEMILLA']} | Búsqueda: {modo}\n"
+    if motor_compilado is not None and motor_compilado["backend"] == "numba":
+        log_text += f"Núcleo compilado: Numba {motor_compilado['version']} con {motor_compilado['hilos']} hilos, " \
+                    f"arranque {motor_compilado['tiempo_compilacion']:.2f} s " \
+                    f"({'caché de Numba' if motor_compilado['desde_cache'] else 'compilación'})\n"
+    elif motor_compilado is not None:
+        log_text += "Numba no está disponible: se usa el motor vectorizado.\n"
+    for aviso in avisos: log_text += aviso + "\n"
+    if reduccion != "ninguna":
+        log_text += f"Reducción de varianza: {reduccion}; el comentario indica el tamaño efectivo de muestra (ESS) " \
+                    f"y el error estándar (EE)\n"
+    if cache is not None:
+        log_text += f"Caché de resultados: {cache.directorio}\n"
+    perfiles = len(perfil_requisitos(params["REQUISITOS_TRENES_HORA"]))
+    if perfiles > 1:
+        log_text += f"Requisitos por hora: {perfiles} perfiles diarios (el día d usa el perfil d % {perfiles})\n"
+    if params.get("TRAZA"):
+        log_text += f"Traza diaria: {params['TRAZA']} (consulta con FlotaTraza.py)\n"
+    if paralelo is not None and not paralelo.propio:
+        host, puerto = paralelo.executor.direccion
+        log_text += f"Ejecución distribuida: coordinador en {host}:{puerto} " \
+                    f"({paralelo.executor.capacidad()} trabajadores conectados)\n"
+    if control is not None:
+        log_text += f"Punto de control: {control.ruta}" + (f" (se reanuda: {control.descripcion()})"
+                                                           if control.puntos or control.parcial else "") + "\n"
+    if params.get("SECUENCIAL"):
+        log_text += f"Monte Carlo secuencial: IC {params.get('CONFIANZA', 0.95):.0%}, tolerancia " \
+                    f"±{params.get('TOLERANCIA_ERROR', 0.0005):.4%}, máximo {params['NUM_SIMULACIONES']} réplicas\n"
+    log_text += "-" * 120 + "\n"
+    log_text += "{:<15} | {:<16} | {:<23} | {:<9} | {:<12} | {}\n".format(
+        "Trenes Reserva", "Nivel Servicio", f"IC {params.get('CONFIANZA', 0.95):.0%}", "Réplicas", "Tiempo (s)",
+        "Comentario")
+    log_text += "-" * 120 + "\n"
+    yield {"tipo": "inicio", "texto": log_text, "params": params}
 
-    n_reserva = 0
     flota_minima_requerida = -1
+    flota_perfecta = None
     consecutive_100_percent_count = 0
     history = []
+    mediciones = {} if params.get("INSTRUMENTACION") else None
+    estimaciones = {}
+    distribuciones = {}
 
-    while True:
-        if stop_event.is_set():
-            log_text += "\nSimulación detenida por el usuario.\n"
-            return {"log_text": log_text, "stopped": True, "plot_history": history,
-                    "trenes_optimos": flota_minima_requerida}
+    for evento in MODOS_BUSQUEDA[modo](params, stop_event, paralelo, cache, control):
+        if evento["tipo"] != "punto":
+            yield evento
+            continue
+        n_reserva, horas_fallidas = evento["n_reserva"], evento["horas_fallidas"]
+        if stop_event.is_set() or horas_fallidas is None:
+            if control is not None: control.cerrar()
+            yield {"tipo": "fin", "texto": "\nSimulación detenida por el usuario.\n",
+                   "resultados": {"stopped": True, "plot_history": history, "trenes_optimos": flota_minima_requerida,
+                                  "instrumentacion": _resumen_mediciones(mediciones),
+                                  "distribuciones": distribuciones}}
+            return
+        if mediciones is not None and evento["medicion"] is not None:
+            mediciones[evento.get("etiqueta", str(n_reserva))] = evento["medicion"]
 
-        start_time = time.time()
-        nivel = ejecutar_simulacion_unitaria(n_reserva, params, stop_event)
-        duration = time.time() - start_time
-
-        if nivel is None:
-            return {"log_text": log_text, "stopped": True, "history": history, "trenes_optimos": flota_minima_requerida}
-
-        history.append((n_reserva, nivel))
+        estimacion = estimar_nivel(horas_fallidas, params)
+        nivel, ic_inf, ic_sup, replicas = (estimacion["nivel"], estimacion["ic_inf"], estimacion["ic_sup"],
+                                           estimacion["replicas"])
+        estimaciones[n_reserva] = {"error_estandar": estimacion["error_estandar"],
+                                   "tamano_efectivo": estimacion["tamano_efectivo"], "replicas": replicas}
+        punto = (n_reserva, nivel, ic_inf, ic_sup, replicas)
+        history.append(punto)
+        distribucion = evento["distribucion"].resumen(params) if evento["distribucion"] is not None else None
+        distribuciones[n_reserva] = distribucion
 
         comment = ""
-        if nivel >= params["NIVEL_SERVICIO_DESEADO"]:
+        if not busqueda_ordenada:
+            cumplen = {h[0] for h in history if h[1] >= params["NIVEL_SERVICIO_DESEADO"]}
+            no_cumplen = {h[0] for h in history if h[1] < params["NIVEL_SERVICIO_DESEADO"]}
+            acotadas = [n for n in cumplen if n == 0 or n - 1 in no_cumplen]
+            flota_minima_requerida = min(acotadas) if acotadas else -1
+            comment = "Cumple el objetivo." if n_reserva in cumplen else "No alcanza el objetivo."
+        elif nivel >= params["NIVEL_SERVICIO_DESEADO"]:
             # Se cumple el objetivo mínimo
             if flota_minima_requerida == -1:
                 flota_minima_requerida = n_reserva
@@ -122,7 +1728,7 @@ def run_full_analysis(params, stop_event, progress_callback=None):
             # Independientemente de si es el primero o no, se busca la racha de 100%
             if nivel >= 1.0:
                 consecutive_100_percent_count += 1
-                if not comment: comment = f"¡100% ALCANZADO! Racha: {consecutive_100_percent_count}/3."
+                if not comment: comment = f"¡100% ALCANZADO! Racha: {consecutive_100_percent_count}/{RACHA_PERFECTA}."
             else:
                 consecutive_100_percent_count = 0
                 if not comment: comment = "Estable, pero no 100%. Racha reiniciada."
@@ -132,42 +1738,90 @@ def run_full_analysis(params, stop_event, progress_callback=None):
             flota_minima_requerida = -1  # Se resetea si una flota superior falla
             consecutive_100_percent_count = 0
 
-        log_text += "{:<15} | {:<16.4%} | {:<12.2f} | {}\n".format(n_reserva, nivel, duration, comment)
+        if evento["desde_cache"]: comment = "[caché] " + comment
+        if reduccion != "ninguna":
+            comment += f" [ESS {estimacion['tamano_efectivo']:.0f}, EE {estimacion['error_estandar']:.2e}]"
+        intervalo = f"[{ic_inf:.4%}, {ic_sup:.4%}]"
+        linea = "{:<15} | {:<16.4%} | {:<23} | {:<9} | {:<12.2f} | {}\n".format(
+            n_reserva, nivel, intervalo, replicas, evento["duracion"], comment)
+        yield {"tipo": "reserva_finalizada", "n_reserva": n_reserva, "punto": punto, "nivel": nivel,
+               "ic_inf": ic_inf, "ic_sup": ic_sup, "replicas": replicas, "duracion": evento["duracion"],
+               "error_estandar": estimacion["error_estandar"], "tamano_efectivo": estimacion["tamano_efectivo"],
+               "desde_cache": evento["desde_cache"], "comentario": comment,
+               "trenes_optimos": flota_minima_requerida, "texto": linea, "medicion": evento["medicion"],
+               "distribucion": distribucion, "reanudado": evento.get("reanudado", False)}
+        if control is not None:
+            control.anotar_estado(n_reserva=n_reserva, trenes_optimos=flota_minima_requerida,
+                                  racha=consecutive_100_percent_count, historial=history)
 
-        if progress_callback:
-            progress_callback(log_text, history)
-
-        if consecutive_100_percent_count >= 3:
+        if busqueda_ordenada and consecutive_100_percent_count >= RACHA_PERFECTA:
             flota_perfecta = n_reserva
             break  # Búsqueda de perfección finalizada
 
-        n_reserva += 1
-
-    log_text += "-" * 80 + "\n"
+    log_text = "-" * 120 + "\n"
+    log_text += f"Réplicas simuladas en total: {sum(h[4] for h in history)}\n"
     if flota_minima_requerida != -1:
-        log_text += f"\n✅ Flota Mínima Requerida: {flota_minima_requerida} trenes de reserva.\n"
-        log_text += f"   (Se encontró una flota 'perfecta' con {flota_perfecta} trenes para referencia).\n"
+        log_text += f"\n✅ Flota Mínima Requerida: {flota_minima_requerida} trenes de reserva " \
+                    f"(estimación analítica: {reserva_analitica}).\n"
+        if flota_perfecta is not None:
+            log_text += f"   (Se encontró una flota 'perfecta' con {flota_perfecta} trenes para referencia).\n"
+        log_text += informe_distribucion(distribuciones.get(flota_minima_requerida))
     else:
         log_text += "\n⚠️ No se encontró una flota que cumpliera el objetivo mínimo en el rango simulado.\n"
+    if cache is not None:
+        log_text += f"Caché: {cache.aciertos} aciertos, {cache.fallos} fallos.\n"
+    rendimiento_procesos = dict(paralelo.rendimiento) if paralelo is not None else {}
+    if rendimiento_procesos:
+        log_text += "\nRendimiento por proceso:\n"
+        for pid, datos in sorted(rendimiento_procesos.items()):
+            velocidad = datos["replicas"] / datos["tiempo"] if datos["tiempo"] > 0 else 0.0
+            log_text += f"   Proceso {pid}: {datos['replicas']} réplicas en {datos['tiempo']:.1f} s " \
+                        f"({velocidad:.1f} réplicas/s)\n"
+    instrumentacion = _resumen_mediciones(mediciones)
+    if instrumentacion is not None:
+        log_text += "\nInstrumentación de los motores:\n" + informe_instrumentacion(instrumentacion)
 
     # Preparar datos para gráficos
-    tasa_fallo = 1 - params["DISPONIBILIDAD"];
-    mttf_falla = round(1 / tasa_fallo, 2);
-    escala_eta_reparacion = params["REPARACION_MEDIA"] / math.gamma(1 + 1 / params["FORMA_BETA_REPARACION_DISCRETA"]);
-    escala_eta_mnt = params["MNT_MEDIO"] / math.gamma(1 + 1 / params["FORMA_BETA_MNT_DISCRETA"]);
-    escala_lambda_falla = mttf_falla / math.gamma(1 + 1 / params["FORMA_K_FALLA"]);
+    mttf_falla, escala_lambda_falla, escala_eta_reparacion, escala_eta_mnt = calcular_escalas(params)
     x_range = np.arange(1, 11);
     pmf_reparacion = get_discrete_weibull_pmf(x_range, params["FORMA_BETA_REPARACION_DISCRETA"], escala_eta_reparacion);
     pmf_mnt = get_discrete_weibull_pmf(x_range, params["FORMA_BETA_MNT_DISCRETA"], escala_eta_mnt);
     edades = np.arange(1, 31);
     tasas_de_falla = [weibull_hazard_rate(t, params["FORMA_K_FALLA"], escala_lambda_falla) for t in edades]
     results = {
-        "log_text": log_text, "stopped": False,
+        "stopped": False,
         "trenes_optimos": flota_minima_requerida,  # ✅ El valor óptimo reportado es la flota mínima
         "plot_history": history,
+        "semilla": params["SEMILLA"], "rendimiento_procesos": rendimiento_procesos,
+        "estimacion_analitica": {"trenes": reserva_analitica, "nivel": nivel_analitico},
+        "cache": {"aciertos": cache.aciertos, "fallos": cache.fallos} if cache is not None else None,
+        "instrumentacion": instrumentacion, "perfil": None, "motor_compilado": motor_compilado,
+        "reduccion_varianza": {"modo": reduccion, "por_reserva": estimaciones},
+        "distribuciones": distribuciones,
         "plot_reparacion": {"x": x_range, "y": pmf_reparacion, "beta": params["FORMA_BETA_REPARACION_DISCRETA"],
                             "eta": escala_eta_reparacion},
         "plot_mnt": {"x": x_range, "y": pmf_mnt, "beta": params["FORMA_BETA_MNT_DISCRETA"], "eta": escala_eta_mnt},
         "plot_falla": {"x": edades, "y": tasas_de_falla, "mttf": mttf_falla},
     }
-    return results
\ No newline at end of file
+    if control is not None: control.terminar()
+    yield {"tipo": "fin", "texto": log_text, "resultados": results}
+
+
+def informe_distribucion(distribucion):
+    # Líneas del log con la distribución de los años simulados de una reserva
+    if distribucion is None: return ""
+    cuantiles = distribucion["cuantiles_horas"]
+    texto = f"   Años por debajo del objetivo: {distribucion['prob_incumplir']:.2%} de {distribucion['replicas']}" \
+            f" réplicas | horas fallidas por año: media {distribucion['media_horas']:.1f}, " \
+            + ", ".join(f"{k} {v}" for k, v in cuantiles.items()) + "\n"
+    texto += f"   Año percentil 95: nivel {distribucion['cuantiles_nivel']['p95']:.4%} | peor día: media " \
+             f"{distribucion['peor_dia_medio']:.1f} h, p95 {distribucion['peor_dia_p95']} h, " \
+             f"máximo {distribucion['peor_dia_max']} h\n"
+    return texto
+
+
+def _resumen_mediciones(mediciones):
+    if mediciones is None: return None
+    total = Medidor()
+    for datos in mediciones.values(): total.combinar(datos)
+    return {"por_reserva": mediciones, "total": total.datos()}
@@ -0,0 +1,372 @@
+# FlotaServicio.py
+# Servicio HTTP/JSON local para lanzar estudios de flota sin abrir una ventana por planificador. Cada trabajo es un
+# iterar_analisis con unos params (con la forma de default_params; las claves omitidas toman su valor por
+# defecto) que se ejecuta en un ProcessPoolExecutor compartido de --procesos procesos; los trabajos que no caben
+# esperan en su cola. Dentro de cada trabajo NUM_PROCESOS se fija a 1: el paralelismo lo da el reparto de trabajos.
+# Las claves con rutas o direcciones (CLAVES_SERVIDOR) se rechazan con 400 si no llevan su valor por defecto.
+# El progreso se sigue con server-sent events: /trabajos/<id>/eventos reproduce los eventos ya emitidos (a partir
+# de Last-Event-ID o ?desde=N) y después los nuevos hasta el final del trabajo. Los eventos son los de
+# iterar_analisis en JSON, más "error" y "cancelado".
+# Dos envíos idénticos mientras el primero sigue en cola o en marcha comparten trabajo; DELETE retira un envío y el
+# trabajo solo se detiene (stop_event) o se saca de la cola cuando ya no queda ninguno.
+# Los procesos reciben al arrancar un array compartido con una bandera de parada por trabajo activo y la cola por la
+# que devuelven los eventos: comprobar la bandera no cuesta una llamada entre procesos, y los motores la consultan
+# en cada día simulado.
+#
+# Uso:
+#   python FlotaServicio.py --puerto 8765 --procesos 4
+#   curl -X POST localhost:8765/trabajos -d '{"NUM_SIMULACIONES": 2000, "SEMILLA": 7}'
+#   curl -N localhost:8765/trabajos/<id>/eventos
+#   curl -X DELETE localhost:8765/trabajos/<id>
+
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import http
+import json
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+import numpy as np
+
+PUERTO_POR_DEFECTO = 8765
+# Rutas y direcciones del propio servidor: un cliente no puede hacerle escribir ficheros ni abrir puertos
+CLAVES_SERVIDOR = {"PUNTO_CONTROL", "TRAZA", "DIRECTORIO_CACHE", "DISTRIBUIDO"}
+MAX_TRABAJOS_POR_DEFECTO = 64
+# Trabajos terminados que se conservan para consultar su resultado
+MAX_TERMINADOS = 256
+MAX_CUERPO = 1 << 20
+INTERVALO_LATIDO_SSE = 15
+ESTADOS_FINALES = ("terminado", "detenido", "cancelado", "error")
+
+
+def _a_json(valor):
+    # Eventos y resultados a tipos JSON estrictos (sin NaN ni infinitos)
+    if isinstance(valor, dict): return {str(k): _a_json(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)): return [_a_json(v) for v in valor]
+    if isinstance(valor, np.ndarray): return _a_json(valor.tolist())
+    if isinstance(valor, np.generic): return _a_json(valor.item())
+    if isinstance(valor, float) and not math.isfinite(valor): return None
+    if valor is None or isinstance(valor, (str, int, float, bool)): return valor
+    return str(valor)
+
+
+# --- PROCESOS DEL POOL ---
+_banderas_parada = None
+_cola_eventos = None
+
+
+class _ParadaCompartida:
+    # stop_event de un trabajo: su casilla del array compartido de banderas
+    def __init__(self, casilla):
+        self.casilla = casilla
+
+    def is_set(self):
+        return _banderas_parada[self.casilla] != 0
+
+    def set(self):
+        _banderas_parada[self.casilla] = 1
+
+
+def _inicializar_proceso(banderas, cola):
+    global _banderas_parada, _cola_eventos
+    _banderas_parada, _cola_eventos = banderas, cola
+
+
+def _ejecutar_trabajo(id_trabajo, casilla, params):
+    import FlotaReserva as sim
+
+    try:
+        for evento in sim.iterar_analisis(params, _ParadaCompartida(casilla)):
+            _cola_eventos.put((id_trabajo, evento["tipo"], json.dumps(_a_json(evento), allow_nan=False)))
+    except Exception as e:
+        error = {"tipo": "error", "texto": f"\nError en la simulación: {type(e).__name__}: {e}\n"}
+        _cola_eventos.put((id_trabajo, "error", json.dumps(error)))
+    finally:
+        _cola_eventos.put((id_trabajo, None, None))
+
+
+# --- SERVICIO ---
+class Trabajo:
+    def __init__(self, id_trabajo, clave, params, casilla):
+        self.id = id_trabajo
+        self.clave = clave
+        self.params = params
+        self.casilla = casilla
+        self.estado = "en_cola"
+        self.creado = time.time()
+        self.terminado = None
+        self.solicitantes = 1
+        self.futuro = None
+        # (tipo, JSON) de cada evento en orden; `aviso` se activa y se sustituye con cada evento nuevo
+        self.eventos = []
+        self.textos = []
+        self.resultados = None
+        self.aviso = asyncio.Event()
+
+    def final(self):
+        return self.estado in ESTADOS_FINALES
+
+    def resumen(self):
+        resumen = {"id": self.id, "estado": self.estado, "creado": self.creado, "terminado": self.terminado,
+                   "solicitantes": self.solicitantes, "eventos": len(self.eventos)}
+        if self.resultados is not None: resumen["trenes_optimos"] = self.resultados.get("trenes_optimos")
+        return resumen
+
+
+class Servicio:
+    def __init__(self, procesos, max_trabajos=MAX_TRABAJOS_POR_DEFECTO):
+        self.procesos = procesos
+        self.contexto = multiprocessing.get_context("spawn")
+        self.banderas = self.contexto.Array("b", max_trabajos, lock=False)
+        self.cola_eventos = self.contexto.Queue()
+        self.casillas_libres = list(range(max_trabajos))
+        self.pool = self._crear_pool()
+        self.trabajos = {}
+        self.activos = {}
+        self.loop = None
+
+    def _crear_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.procesos, mp_context=self.contexto,
+                                                      initializer=_inicializar_proceso,
+                                                      initargs=(self.banderas, self.cola_eventos))
+
+    # Se ejecuta en un hilo aparte: pasa al bucle de asyncio los eventos que envían los procesos
+    def _leer_eventos(self):
+        while True:
+            mensaje = self.cola_eventos.get()
+            if mensaje is None: return
+            self.loop.call_soon_threadsafe(self._recibir, *mensaje)
+
+    def _publicar(self, trabajo, tipo, texto_json, evento=None):
+        trabajo.eventos.append((tipo, texto_json))
+        evento = evento if evento is not None else json.loads(texto_json)
+        trabajo.textos.append(evento.get("texto", ""))
+        trabajo.aviso.set()
+        trabajo.aviso = asyncio.Event()
+
+    def _recibir(self, id_trabajo, tipo, texto_json):
+        trabajo = self.trabajos.get(id_trabajo)
+        if trabajo is None or trabajo.final(): return
+        if tipo is None:
+            # El proceso terminó sin "fin" ni "error" (no debería ocurrir)
+            self._error(trabajo, "El trabajo terminó sin resultados.")
+            return
+        evento = json.loads(texto_json)
+        if tipo == "inicio": trabajo.estado = "ejecutando"
+        if tipo == "fin":
+            trabajo.resultados = evento["resultados"]
+            self._publicar(trabajo, tipo, texto_json, evento)
+            self._finalizar(trabajo, "detenido" if trabajo.resultados.get("stopped") else "terminado")
+        elif tipo == "error":
+            self._publicar(trabajo, tipo, texto_json, evento)
+            self._finalizar(trabajo, "error")
+        else:
+            self._publicar(trabajo, tipo, texto_json, evento)
+
+    def _error(self, trabajo, texto):
+        evento = {"tipo": "error", "texto": f"\n{texto}\n"}
+        self._publicar(trabajo, "error", json.dumps(evento), evento)
+        self._finalizar(trabajo, "error")
+
+    def _finalizar(self, trabajo, estado):
+        trabajo.estado = estado
+        trabajo.terminado = time.time()
+        if self.activos.get(trabajo.clave) is trabajo: del self.activos[trabajo.clave]
+        self.casillas_libres.append(trabajo.casilla)
+        trabajo.aviso.set()
+        terminados = [t for t in self.trabajos.values() if t.final()]
+        for antiguo in sorted(terminados, key=lambda t: t.terminado)[:max(0, len(terminados) - MAX_TERMINADOS)]:
+            del self.trabajos[antiguo.id]
+
+    def _al_terminar_futuro(self, trabajo, futuro):
+        # Los trabajos normales terminan con sus eventos; aquí solo llegan los cancelados en cola y los fallos del
+        # propio pool (un proceso muerto rompe el pool, que se sustituye)
+        if trabajo.final(): return
+        if futuro.cancelled():
+            evento = {"tipo": "cancelado", "texto": "\nTrabajo cancelado antes de empezar.\n"}
+            self._publicar(trabajo, "cancelado", json.dumps(evento), evento)
+            self._finalizar(trabajo, "cancelado")
+        elif futuro.exception() is not None:
+            if isinstance(futuro.exception(), concurrent.futures.process.BrokenProcessPool):
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._crear_pool()
+            self._error(trabajo, f"Error en el proceso del trabajo: {futuro.exception()!r}")
+
+    def enviar(self, cambios):
+        # -> (trabajo, duplicado); ValueError si los parámetros no son válidos, LookupError si no caben más trabajos
+        import FlotaReserva as sim
+
+        if not isinstance(cambios, dict): raise ValueError("el cuerpo debe ser un objeto JSON con parámetros")
+        desconocidos = sorted(set(cambios) - set(sim.default_params))
+        if desconocidos: raise ValueError(f"parámetros desconocidos: {', '.join(desconocidos)}")
+        reservados = sorted(k for k in set(cambios) & CLAVES_SERVIDOR if cambios[k] != sim.default_params[k])
+        if reservados: raise ValueError(f"parámetros reservados al servidor: {', '.join(reservados)}")
+        params = {**sim.default_params, **cambios, "NUM_PROCESOS": 1}
+        sim.perfil_requisitos(params["REQUISITOS_TRENES_HORA"])
+        clave = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        trabajo = self.activos.get(clave)
+        if trabajo is not None:
+            trabajo.solicitantes += 1
+            return trabajo, True
+        if not self.casillas_libres: raise LookupError("demasiados trabajos activos; inténtelo más tarde")
+        casilla = self.casillas_libres.pop()
+        self.banderas[casilla] = 0
+        trabajo = Trabajo(uuid.uuid4().hex[:12], clave, params, casilla)
+        self.trabajos[trabajo.id] = trabajo
+        self.activos[clave] = trabajo
+        trabajo.futuro = self.pool.submit(_ejecutar_trabajo, trabajo.id, casilla, params)
+        trabajo.futuro.add_done_callback(
+            lambda f, t=trabajo: self.loop.call_soon_threadsafe(self._al_terminar_futuro, t, f))
+        return trabajo, False
+
+    def retirar(self, trabajo):
+        # Retira un envío; sin envíos pendientes se saca de la cola o se detiene con su bandera de parada
+        if trabajo.final(): return
+        trabajo.solicitantes = max(0, trabajo.solicitantes - 1)
+        if trabajo.solicitantes > 0: return
+        if self.activos.get(trabajo.clave) is trabajo: del self.activos[trabajo.clave]
+        if not trabajo.futuro.cancel(): self.banderas[trabajo.casilla] = 1
+
+    def cerrar(self):
+        for trabajo in self.trabajos.values():
+            if not trabajo.final(): self.banderas[trabajo.casilla] = 1
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.cola_eventos.put(None)
+
+    # --- HTTP ---
+    async def atender(self, lector, escritor):
+        try:
+            linea = await lector.readline()
+            if not linea: return
+            metodo, destino, _ = linea.decode("latin-1").split(" ", 2)
+            cabeceras = {}
+            while True:
+                linea = await lector.readline()
+                if linea in (b"\r\n", b"\n", b""): break
+                nombre, _, valor = linea.decode("latin-1").partition(":")
+                cabeceras[nombre.strip().lower()] = valor.strip()
+            longitud = int(cabeceras.get("content-length") or 0)
+            if longitud > MAX_CUERPO:
+                await _responder(escritor, 413, {"error": "cuerpo demasiado grande"})
+                return
+            cuerpo = await lector.readexactly(longitud)
+            url = urllib.parse.urlsplit(destino)
+            consulta = dict(urllib.parse.parse_qsl(url.query))
+            await self._despachar(metodo.upper(), url.path.rstrip("/") or "/", consulta, cabeceras, cuerpo, escritor)
+        except (ValueError, asyncio.IncompleteReadError):
+            await _responder(escritor, 400, {"error": "petición HTTP mal formada"})
+        except ConnectionError:
+            pass
+        finally:
+            escritor.close()
+
+    async def _despachar(self, metodo, ruta, consulta, cabeceras, cuerpo, escritor):
+        partes = ruta.strip("/").split("/")
+        if ruta == "/" and metodo == "GET":
+            estados = {}
+            for trabajo in self.trabajos.values(): estados[trabajo.estado] = estados.get(trabajo.estado, 0) + 1
+            await _responder(escritor, 200, {"procesos": self.procesos, "trabajos": estados})
+        elif partes == ["trabajos"] and metodo == "GET":
+            await _responder(escritor, 200, [trabajo.resumen() for trabajo in self.trabajos.values()])
+        elif partes == ["trabajos"] and metodo == "POST":
+            try:
+                trabajo, duplicado = self.enviar(json.loads(cuerpo or b"{}"))
+            except ValueError as e:
+                await _responder(escritor, 400, {"error": str(e)})
+                return
+            except LookupError as e:
+                await _responder(escritor, 503, {"error": str(e)})
+                return
+            await _responder(escritor, 200 if duplicado else 202, dict(
+                trabajo.resumen(), duplicado=duplicado, url_eventos=f"/trabajos/{trabajo.id}/eventos"))
+        elif len(partes) in (2, 3) and partes[0] == "trabajos":
+            trabajo = self.trabajos.get(partes[1])
+            if trabajo is None:
+                await _responder(escritor, 404, {"error": f"no existe el trabajo {partes[1]}"})
+            elif len(partes) == 3 and partes[2] == "eventos" and metodo == "GET":
+                desde = int(cabeceras["last-event-id"]) + 1 if "last-event-id" in cabeceras \
+                    else int(consulta.get("desde", 0))
+                await self._transmitir(trabajo, desde, escritor)
+            elif len(partes) == 2 and metodo == "GET":
+                contenido = trabajo.resumen()
+                if trabajo.final():
+                    contenido["resultados"] = trabajo.resultados
+                    contenido["log_text"] = "".join(trabajo.textos)
+                await _responder(escritor, 200, contenido)
+            elif len(partes) == 2 and metodo == "DELETE":
+                self.retirar(trabajo)
+                await _responder(escritor, 200, trabajo.resumen())
+            else:
+                await _responder(escritor, 405, {"error": f"{metodo} no admitido en {ruta}"})
+        else:
+            await _responder(escritor, 404, {"error": f"ruta desconocida: {ruta}"})
+
+    async def _transmitir(self, trabajo, desde, escritor):
+        escritor.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                       b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        indice = max(0, desde)
+        while True:
+            while indice < len(trabajo.eventos):
+                tipo, texto_json = trabajo.eventos[indice]
+                escritor.write(f"id: {indice}\nevent: {tipo}\ndata: {texto_json}\n\n".encode("utf-8"))
+                indice += 1
+            await escritor.drain()
+            # Durante drain() pueden llegar eventos, incluido el final: se escriben antes de cerrar o de esperar
+            if indice < len(trabajo.eventos): continue
+            if trabajo.final(): return
+            try:
+                await asyncio.wait_for(trabajo.aviso.wait(), INTERVALO_LATIDO_SSE)
+            except asyncio.TimeoutError:
+                escritor.write(b": latido\n\n")
+
+
+async def _responder(escritor, estado, contenido):
+    cuerpo = json.dumps(contenido, ensure_ascii=False).encode("utf-8")
+    cabecera = f"HTTP/1.1 {estado} {http.HTTPStatus(estado).phrase}\r\n" \
+               f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(cuerpo)}\r\n" \
+               f"Connection: close\r\n\r\n"
+    escritor.write(cabecera.encode("latin-1") + cuerpo)
+    await escritor.drain()
+
+
+async def servir(servicio, host, puerto, al_escuchar=None):
+    # al_escuchar(host, puerto) recibe la dirección real (con puerto 0 la elige el sistema)
+    servicio.loop = asyncio.get_running_loop()
+    threading.Thread(target=servicio._leer_eventos, name="servicio-eventos", daemon=True).start()
+    servidor = await asyncio.start_server(servicio.atender, host, puerto)
+    if al_escuchar is not None: al_escuchar(*servidor.sockets[0].getsockname()[:2])
+    async with servidor:
+        await servidor.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON local de simulaciones de flota.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz de escucha (por defecto solo local).")
+    parser.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO)
+    parser.add_argument("--procesos", type=int, default=0,
+                        help="Trabajos simulados a la vez (0 = uno por núcleo).")
+    parser.add_argument("--max-trabajos", type=int, default=MAX_TRABAJOS_POR_DEFECTO,
+                        help="Trabajos en cola o en marcha admitidos a la vez.")
+    args = parser.parse_args(argv)
+
+    servicio = Servicio(args.procesos or os.cpu_count() or 1, args.max_trabajos)
+    try:
+        asyncio.run(servir(servicio, args.host, args.puerto, lambda host, puerto: print(
+            f"Servicio en http://{host}:{puerto} con {servicio.procesos} procesos", file=sys.stderr)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servicio.cerrar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
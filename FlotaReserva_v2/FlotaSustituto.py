@@ -0,0 +1,334 @@
+# FlotaSustituto.py
+# Modelo sustituto para explorar escenarios sin esperar a una búsqueda completa. Una etapa previa simula un diseño
+# de hipercubo latino sobre una caja de parámetros (por defecto DISPONIBILIDAD, REPARACION_MEDIA, FORMA_K_FALLA y
+# MNT_MEDIO) y, en cada punto, la curva de todas las reservas con números aleatorios comunes. Todos los puntos usan
+# la misma semilla, así que las diferencias entre ellos se deben a los parámetros y no al ruido de muestreo.
+# Sobre esos niveles se ajusta un proceso gaussiano (kriging) del logaritmo del déficit en función de los
+# parámetros y de la reserva, con el error de Monte Carlo de cada punto como ruido. El modelo se guarda en un .npz y
+# responde en milisegundos con la media, un intervalo y la probabilidad de cumplir el objetivo.
+#
+#   python FlotaSustituto.py construir modelo.npz --puntos 40 --procesos 4 \
+#       --rango DISPONIBILIDAD=0.90,0.97 --rango REPARACION_MEDIA=1,4 --fijar NUM_SIMULACIONES=400
+#   python FlotaSustituto.py consultar modelo.npz --fijar DISPONIBILIDAD=0.94 --fijar MNT_MEDIO=2 --verificar
+
+import argparse
+import concurrent.futures
+import json
+import math
+import multiprocessing
+import statistics
+import sys
+import threading
+import time
+
+import numpy as np
+
+import FlotaReserva as sim
+
+RANGOS_POR_DEFECTO = {"DISPONIBILIDAD": (0.90, 0.97), "REPARACION_MEDIA": (1, 4), "FORMA_K_FALLA": (1.0, 3.0),
+                      "MNT_MEDIO": (1, 3)}
+# Medias en días enteros, como exige la interfaz
+ENTEROS = {"REPARACION_MEDIA", "MNT_MEDIO"}
+# Parámetros que definen el sistema simulado; los que no están en la caja quedan fijos en el modelo
+CLAVES_SISTEMA = ("TRENES_OPERATIVOS_REQUERIDOS", "DIAS_POR_SIMULACION", "DISPONIBILIDAD", "FORMA_K_FALLA",
+                  "FORMA_BETA_REPARACION_DISCRETA", "REPARACION_MEDIA", "FORMA_BETA_MNT_DISCRETA", "MNT_MEDIO",
+                  "LISTA_MNT", "P_MNT", "REQUISITOS_TRENES_HORA")
+MARGEN_RESERVAS = 4  # Reservas simuladas por encima de la mayor estimación analítica del diseño
+ESCALAS_LONGITUD = np.geomspace(0.05, 5.0, 12)  # Candidatas por dimensión, en coordenadas normalizadas
+VARIANZA_CENSURA = 0.25  # Ruido (log10) de los puntos sin ninguna hora fallida: solo acotan el déficit por arriba
+VARIANZA_MINIMA = 1e-4
+CONFIANZA = 0.95
+
+
+def diseno_hipercubo(rangos, num_puntos, rng):
+    # Hipercubo latino: cada dimensión se divide en num_puntos estratos y cada estrato se usa una sola vez
+    claves = list(rangos)
+    estratos = rng.permuted(np.tile(np.arange(num_puntos), (len(claves), 1)), axis=1).T
+    unitarios = (estratos + rng.random((num_puntos, len(claves)))) / num_puntos
+    puntos = []
+    for fila in unitarios:
+        punto = {}
+        for clave, u in zip(claves, fila):
+            bajo, alto = rangos[clave]
+            valor = bajo + u * (alto - bajo)
+            punto[clave] = int(round(valor)) if clave in ENTEROS else float(valor)
+        puntos.append(punto)
+    return puntos
+
+
+def simular_punto(params, reservas):
+    # Nivel y error estándar de cada reserva de un punto del diseño (se ejecuta también en procesos hijos)
+    horas_fallidas = sim.simular_curva(reservas, params, threading.Event())
+    estimaciones = [sim.estimar_nivel(fila, params) for fila in horas_fallidas]
+    return [e["nivel"] for e in estimaciones], [e["error_estandar"] for e in estimaciones]
+
+
+def _transformar(nivel, piso):
+    return np.log10(np.maximum(1 - np.asarray(nivel, dtype=float), 0.0) + piso)
+
+
+def _destransformar(y, piso):
+    return np.clip(1 - (10 ** np.asarray(y) - piso), 0.0, 1.0)
+
+
+def _varianza_ruido(nivel, error, piso):
+    # Método delta: error del nivel llevado a la escala log10 del déficit
+    deficit = np.maximum(1 - np.asarray(nivel, dtype=float), 0.0)
+    varianza = (np.asarray(error, dtype=float) / ((deficit + piso) * math.log(10))) ** 2
+    return np.maximum(np.where(deficit > 0, varianza, VARIANZA_CENSURA), VARIANZA_MINIMA)
+
+
+def _base_media(X):
+    return np.column_stack([np.ones(len(X)), X])
+
+
+def _nucleo(diferencias, escalas, varianza):
+    return varianza * np.exp(-0.5 * np.einsum("k...,k->...", diferencias, 1 / escalas ** 2))
+
+
+def _verosimilitud(diferencias, escalas, varianza, ruido, residuos):
+    K = _nucleo(diferencias, escalas, varianza) + np.diag(ruido)
+    try:
+        L = np.linalg.cholesky(K)
+    except np.linalg.LinAlgError:
+        return -math.inf
+    z = np.linalg.solve(L, residuos)
+    return float(-0.5 * z @ z - np.log(np.diag(L)).sum())
+
+
+def ajustar(X, y, ruido):
+    # Media lineal por mínimos cuadrados y proceso gaussiano de núcleo exponencial cuadrático sobre los residuos.
+    # Las escalas de longitud se eligen por búsqueda coordenada de la verosimilitud marginal sobre ESCALAS_LONGITUD.
+    beta = np.linalg.lstsq(_base_media(X), y, rcond=None)[0]
+    residuos = y - _base_media(X) @ beta
+    varianza = max(float(residuos.var()), VARIANZA_MINIMA)
+    diferencias = (X.T[:, :, None] - X.T[:, None, :]) ** 2
+    escalas = np.full(X.shape[1], 0.5)
+    for _ in range(2):
+        for k in range(X.shape[1]):
+            candidatas = []
+            for escala in ESCALAS_LONGITUD:
+                prueba = escalas.copy()
+                prueba[k] = escala
+                candidatas.append((_verosimilitud(diferencias, prueba, varianza, ruido, residuos), escala))
+            escalas[k] = max(candidatas)[1]
+    L = np.linalg.cholesky(_nucleo(diferencias, escalas, varianza) + np.diag(ruido))
+    L_inv = np.linalg.solve(L, np.eye(len(X)))
+    alfa = L_inv.T @ (L_inv @ residuos)
+    # Error de validación cruzada dejando uno fuera, en forma cerrada: alfa_i / (K^-1)_ii
+    loo = alfa / np.einsum("ij,ij->j", L_inv, L_inv)
+    return {"beta": beta, "escalas": escalas, "varianza": varianza, "alfa": alfa, "L_inv": L_inv,
+            "error_loo": float(np.sqrt(np.mean(loo ** 2)))}
+
+
+def _distintos(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    return a.shape != b.shape or not np.allclose(a, b)
+
+
+class ModeloSustituto:
+    def __init__(self, datos, metadatos):
+        self.datos = datos
+        self.meta = metadatos
+        self.claves = metadatos["claves"]
+        self.bajos = np.array([metadatos["rangos"][k][0] for k in self.claves], dtype=float)
+        self.altos = np.array([metadatos["rangos"][k][1] for k in self.claves], dtype=float)
+        self.reservas = np.arange(metadatos["reserva_max"] + 1)
+
+    def _normalizar(self, params, reservas):
+        x = (np.array([float(params[k]) for k in self.claves]) - self.bajos) / (self.altos - self.bajos)
+        return np.column_stack([np.tile(x, (len(reservas), 1)), np.asarray(reservas) / self.meta["reserva_max"]])
+
+    def predecir(self, params, reservas=None):
+        # Media y desviación típica del log10 del déficit y nivel con su intervalo para cada reserva
+        reservas = self.reservas if reservas is None else np.asarray(reservas)
+        Xq = self._normalizar(params, reservas)
+        d = self.datos
+        diferencias = (Xq.T[:, :, None] - d["X"].T[:, None, :]) ** 2
+        k = _nucleo(diferencias, d["escalas"], float(d["varianza"]))
+        media = _base_media(Xq) @ d["beta"] + k @ d["alfa"]
+        v = k @ d["L_inv"].T
+        desviacion = np.sqrt(np.maximum(float(d["varianza"]) - (v ** 2).sum(axis=1), 1e-12))
+        z = statistics.NormalDist().inv_cdf(0.5 + CONFIANZA / 2)
+        piso = float(d["piso"])
+        return {"reservas": reservas, "media_log": media, "desviacion_log": desviacion,
+                "nivel": _destransformar(media, piso), "nivel_inf": _destransformar(media + z * desviacion, piso),
+                "nivel_sup": _destransformar(media - z * desviacion, piso)}
+
+    def incompatibles(self, params):
+        # Parámetros fijos del modelo que difieren en `params`: la predicción no es válida para ellos
+        base = self.meta["params_base"]
+        return [k for k in CLAVES_SISTEMA if k not in self.claves and k in params and _distintos(params[k], base[k])]
+
+    def fuera_de_rango(self, params):
+        return [k for k, bajo, alto in zip(self.claves, self.bajos, self.altos) if not bajo <= params[k] <= alto]
+
+    def consultar(self, params):
+        # Reserva mínima prevista para el objetivo de `params` y probabilidad de que cada reserva lo cumpla
+        inicio = time.perf_counter()
+        prediccion = self.predecir(params)
+        objetivo = params["NIVEL_SERVICIO_DESEADO"]
+        limite = _transformar(objetivo, float(self.datos["piso"]))
+        prob_cumple = np.array([statistics.NormalDist(m, s).cdf(float(limite))
+                                for m, s in zip(prediccion["media_log"], prediccion["desviacion_log"])])
+        cumplen = np.nonzero(prediccion["nivel"] >= objetivo)[0]
+        seguras = np.nonzero(prob_cumple >= CONFIANZA)[0]
+        reserva_minima = int(cumplen[0]) if len(cumplen) else None
+        return dict(prediccion, objetivo=objetivo, prob_cumple=prob_cumple, reserva_minima=reserva_minima,
+                    reserva_segura=int(seguras[0]) if len(seguras) else None,
+                    incompatibles=self.incompatibles(params), fuera_de_rango=self.fuera_de_rango(params),
+                    error_loo=self.meta["error_loo"], duracion=time.perf_counter() - inicio)
+
+    def guardar(self, ruta):
+        np.savez(ruta, metadatos=np.array(json.dumps(self.meta, default=str)), **self.datos)
+
+
+def cargar(ruta):
+    with np.load(ruta, allow_pickle=False) as fichero:
+        datos = {k: fichero[k] for k in fichero.files if k != "metadatos"}
+        metadatos = json.loads(str(fichero["metadatos"]))
+    return ModeloSustituto(datos, metadatos)
+
+
+def construir(params_base, rangos=None, num_puntos=40, num_procesos=1, reserva_max=None, stop_event=None,
+              progreso=None):
+    # Simula el diseño (en paralelo si num_procesos > 1) y ajusta el modelo; None si se detiene
+    rangos = dict(rangos or RANGOS_POR_DEFECTO)
+    stop_event = stop_event or threading.Event()
+    params_base = dict(params_base, REDUCCION_VARIANZA="ninguna")
+    if params_base.get("SEMILLA") is None: params_base["SEMILLA"] = np.random.SeedSequence().entropy
+    puntos = diseno_hipercubo(rangos, num_puntos, np.random.default_rng(params_base["SEMILLA"]))
+    if reserva_max is None:
+        reserva_max = max(sim.estimar_reserva_analitica(dict(params_base, **p))[0] for p in puntos) + MARGEN_RESERVAS
+    reservas = list(range(reserva_max + 1))
+    resultados = [None] * len(puntos)
+    inicio = time.perf_counter()
+    if num_procesos > 1:
+        contexto = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_procesos, mp_context=contexto) as ejecutor:
+            futuros = {ejecutor.submit(simular_punto, dict(params_base, **p), reservas): i
+                       for i, p in enumerate(puntos)}
+            try:
+                for hechos, futuro in enumerate(concurrent.futures.as_completed(futuros), 1):
+                    if stop_event.is_set(): return None
+                    resultados[futuros[futuro]] = futuro.result()
+                    if progreso: progreso(hechos, len(puntos))
+            finally:
+                for futuro in futuros: futuro.cancel()
+    else:
+        for i, p in enumerate(puntos):
+            if stop_event.is_set(): return None
+            resultados[i] = simular_punto(dict(params_base, **p), reservas)
+            if progreso: progreso(i + 1, len(puntos))
+    tiempo_simulacion = time.perf_counter() - inicio
+
+    piso = 1 / (2 * params_base["NUM_SIMULACIONES"] * params_base["DIAS_POR_SIMULACION"] * sim.HORAS_DIA)
+    claves = list(rangos)
+    bajos = np.array([rangos[k][0] for k in claves], dtype=float)
+    altos = np.array([rangos[k][1] for k in claves], dtype=float)
+    X, niveles, errores = [], [], []
+    for punto, (niveles_punto, errores_punto) in zip(puntos, resultados):
+        x = (np.array([punto[k] for k in claves], dtype=float) - bajos) / (altos - bajos)
+        for reserva, nivel, error in zip(reservas, niveles_punto, errores_punto):
+            X.append(np.append(x, reserva / reserva_max))
+            niveles.append(nivel)
+            errores.append(error)
+    X = np.array(X)
+    inicio = time.perf_counter()
+    ajuste = ajustar(X, _transformar(niveles, piso), _varianza_ruido(niveles, errores, piso))
+    datos = dict(ajuste, X=X, niveles=np.array(niveles), piso=np.array(piso))
+    error_loo = datos.pop("error_loo")
+    metadatos = {"claves": claves, "rangos": {k: list(v) for k, v in rangos.items()}, "reserva_max": reserva_max,
+                 "params_base": params_base, "puntos": puntos, "error_loo": error_loo,
+                 "tiempo_simulacion": tiempo_simulacion, "tiempo_ajuste": time.perf_counter() - inicio,
+                 "version_motor": sim.VERSION_MOTOR}
+    return ModeloSustituto(datos, metadatos)
+
+
+def informe_consulta(consulta):
+    if consulta["incompatibles"]:
+        return "Modelo no aplicable: difieren " + ", ".join(consulta["incompatibles"]) + "."
+    texto = ""
+    if consulta["reserva_minima"] is None:
+        texto += f"Ninguna reserva hasta {consulta['reservas'][-1]} alcanza el objetivo.\n"
+    else:
+        i = consulta["reserva_minima"]
+        texto += f"Reserva mínima prevista: {i} trenes, nivel {consulta['nivel'][i]:.4%} " \
+                 f"[{consulta['nivel_inf'][i]:.4%}, {consulta['nivel_sup'][i]:.4%}], " \
+                 f"P(cumple) {consulta['prob_cumple'][i]:.0%}\n"
+    if consulta["reserva_segura"] is not None:
+        texto += f"Cumple con probabilidad >= {CONFIANZA:.0%}: {consulta['reserva_segura']} trenes\n"
+    if consulta["fuera_de_rango"]:
+        texto += "Extrapolación (fuera de la caja): " + ", ".join(consulta["fuera_de_rango"]) + "\n"
+    texto += f"Error de validación cruzada: {consulta['error_loo']:.2f} décadas | {consulta['duracion'] * 1000:.1f} ms"
+    return texto
+
+
+def _asignacion(texto):
+    clave, separador, valor = texto.partition("=")
+    if not separador or not clave: raise argparse.ArgumentTypeError(f"se esperaba CLAVE=VALOR: {texto!r}")
+    try:
+        return clave.strip(), json.loads(valor)
+    except ValueError:
+        return clave.strip(), valor.strip()
+
+
+def _rango(texto):
+    clave, valor = _asignacion(texto)
+    if not isinstance(valor, str) or valor.count(",") != 1:
+        raise argparse.ArgumentTypeError(f"se esperaba CLAVE=MIN,MAX: {texto!r}")
+    bajo, alto = (float(v) for v in valor.split(","))
+    if not bajo < alto: raise argparse.ArgumentTypeError(f"rango vacío: {texto!r}")
+    return clave, (bajo, alto)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Modelo sustituto del simulador de flota para consultas rápidas.")
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+    p_construir = subparsers.add_parser("construir", help="Simula el diseño y guarda el modelo ajustado.")
+    p_construir.add_argument("salida", help="Fichero .npz del modelo.")
+    p_construir.add_argument("--rango", type=_rango, action="append", default=[], metavar="CLAVE=MIN,MAX",
+                             help="Dimensión de la caja (por defecto " + ", ".join(RANGOS_POR_DEFECTO) + ").")
+    p_construir.add_argument("--puntos", type=int, default=40, help="Puntos del hipercubo latino.")
+    p_construir.add_argument("--procesos", type=int, default=1, help="Procesos que simulan el diseño.")
+    p_construir.add_argument("--reserva-max", type=int, help="Mayor reserva simulada (por defecto, analítica + 4).")
+    p_consultar = subparsers.add_parser("consultar", help="Predice la reserva mínima para unos parámetros.")
+    p_consultar.add_argument("modelo", help="Fichero .npz del modelo.")
+    p_consultar.add_argument("--verificar", action="store_true",
+                             help="Ejecuta además la búsqueda completa y compara los resultados.")
+    for subparser in (p_construir, p_consultar):
+        subparser.add_argument("--fijar", type=_asignacion, action="append", default=[], metavar="CLAVE=VALOR",
+                               help="Parámetro distinto del valor por defecto.")
+    args = parser.parse_args(argv)
+    for clave, _ in args.fijar + getattr(args, "rango", []):
+        if clave not in sim.default_params: parser.error(f"parámetro desconocido: {clave}")
+
+    if args.accion == "construir":
+        params = dict(sim.default_params, **dict(args.fijar))
+        rangos = dict(args.rango) or RANGOS_POR_DEFECTO
+        modelo = construir(params, rangos, args.puntos, args.procesos, args.reserva_max,
+                           progreso=lambda i, n: print(f"[{i}/{n}] puntos simulados", file=sys.stderr))
+        modelo.guardar(args.salida)
+        print(f"Modelo guardado en {args.salida}: {args.puntos} puntos x {modelo.meta['reserva_max'] + 1} reservas, "
+              f"simulación {modelo.meta['tiempo_simulacion']:.1f} s, ajuste {modelo.meta['tiempo_ajuste']:.1f} s, "
+              f"error de validación cruzada {modelo.meta['error_loo']:.2f} décadas")
+        return 0
+
+    modelo = cargar(args.modelo)
+    params = dict(sim.default_params, **modelo.meta["params_base"])
+    params.update(dict(args.fijar))
+    consulta = modelo.consultar(params)
+    print(informe_consulta(consulta))
+    if args.verificar:
+        results = sim.run_full_analysis(params, threading.Event())
+        simulada = results["trenes_optimos"]
+        print(f"Simulación completa: {simulada} trenes de reserva (modelo: {consulta['reserva_minima']})")
+        for n_reserva, nivel, ic_inf, ic_sup, _ in results["plot_history"]:
+            if n_reserva < len(consulta["nivel"]):
+                print(f"   reserva {n_reserva}: simulado {nivel:.4%} [{ic_inf:.4%}, {ic_sup:.4%}], "
+                      f"modelo {consulta['nivel'][n_reserva]:.4%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# FlotaTraza.py
+# Trazas diarias del estado de la flota para auditar resultados. Con TRAZA = directorio, los motores vectorizado y
+# de curvas crn escriben, por cada réplica y día simulados, un registro de ancho fijo con los trenes en reparación,
+# en mantenimiento, disponibles y las horas con servicio fallido del día. Hay un fichero por tamaño de reserva
+# (reserva_NNNN.traza) con una cabecera pequeña y los registros en una matriz réplicas x días, de modo que una
+# réplica es un tramo contiguo y el lector la obtiene con np.memmap sin cargar el resto.
+# Cada bloque de réplicas escribe sus filas del fichero al terminar y después marca su byte en la tabla de
+# bloques completos: los procesos (y los trabajadores de FlotaDistribuido, si comparten el directorio) nunca
+# escriben en la misma zona. Un bloque detenido a medias queda sin marcar. Como cada bloque tiene su propia semilla,
+# repetir o reanudar la búsqueda vuelve a escribir exactamente los mismos registros.
+#
+# Formato: "FLOTATRZ", longitud de la cabecera JSON (uint32, little endian), cabecera JSON, un byte por bloque
+# (1 = completo) y, alineados a ALINEACION bytes, réplicas x días registros REGISTRO.
+#
+# Uso:
+#   python FlotaTraza.py resumen trazas/
+#   python FlotaTraza.py exportar trazas/ --reserva 4 --replicas 0:10 --salida reserva4.csv
+
+import argparse
+import csv
+import glob
+import json
+import os
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+import FlotaCache
+
+FORMATO = 1
+MAGICO = b"FLOTATRZ"
+ALINEACION = 4096
+REGISTRO = np.dtype([("reparacion", "<u2"), ("mantenimiento", "<u2"), ("disponibles", "<u2"),
+                     ("horas_fallidas", "u1")])
+
+
+def ruta_traza(directorio, trenes_reserva):
+    return os.path.join(directorio, f"reserva_{trenes_reserva:04d}.traza")
+
+
+def _desplazamientos(longitud_cabecera, num_bloques):
+    inicio_bloques = len(MAGICO) + 4 + longitud_cabecera
+    inicio_datos = -(-(inicio_bloques + num_bloques) // ALINEACION) * ALINEACION
+    return inicio_bloques, inicio_datos
+
+
+def _leer_cabecera(ruta):
+    with open(ruta, "rb") as fichero:
+        if fichero.read(len(MAGICO)) != MAGICO: raise ValueError(f"{ruta} no es una traza de flota")
+        longitud, = struct.unpack("<I", fichero.read(4))
+        cabecera = json.loads(fichero.read(longitud).decode("utf-8"))
+    if cabecera.get("formato") != FORMATO:
+        raise ValueError(f"{ruta}: formato de traza no admitido ({cabecera.get('formato')})")
+    return cabecera, _desplazamientos(longitud, len(cabecera["bloques"]))
+
+
+def _crear(ruta, cabecera):
+    # Fichero completo (cabecera, tabla de bloques a cero y datos dispersos) en un temporal que se enlaza con el
+    # nombre definitivo solo si aún no existe: varios procesos pueden intentarlo a la vez y gana el primero
+    texto = json.dumps(cabecera, separators=(",", ":"), default=str).encode("utf-8")
+    inicio_bloques, inicio_datos = _desplazamientos(len(texto), len(cabecera["bloques"]))
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=".traza_", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as fichero:
+            fichero.write(MAGICO + struct.pack("<I", len(texto)) + texto)
+            fichero.truncate(inicio_datos + cabecera["replicas"] * cabecera["dias"] * REGISTRO.itemsize)
+        try:
+            os.link(temporal, ruta)
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(temporal)
+
+
+class TrazaInactiva:
+    # Los motores llaman siempre a dia() y terminar(); sin TRAZA no hacen nada
+    activa = False
+
+    def dia(self, dia, reparacion, mantenimiento, disponibles, horas_fallidas):
+        pass
+
+    def terminar(self):
+        pass
+
+
+TRAZA_INACTIVA = TrazaInactiva()
+
+
+class EscritorBloque:
+    activa = True
+
+    def __init__(self, ruta, bloque, inicio_bloques, inicio_datos, primera_replica, num_replicas, dias):
+        self.ruta = ruta
+        self.bloque = bloque
+        self.inicio_bloques = inicio_bloques
+        self.desplazamiento = inicio_datos + primera_replica * dias * REGISTRO.itemsize
+        self.forma = (num_replicas, dias)
+        # Los motores entregan un día (una columna) cada vez: se acumulan en memoria por días, de forma contigua, y
+        # se copian al fichero de una vez al terminar, en vez de tocar todas las páginas del bloque en cada día
+        self.columnas = {nombre: np.zeros((dias, num_replicas), dtype=REGISTRO[nombre]) for nombre in REGISTRO.names}
+
+    def dia(self, dia, reparacion, mantenimiento, disponibles, horas_fallidas):
+        self.columnas["reparacion"][dia] = reparacion
+        self.columnas["mantenimiento"][dia] = mantenimiento
+        self.columnas["disponibles"][dia] = disponibles
+        self.columnas["horas_fallidas"][dia] = horas_fallidas
+
+    def terminar(self):
+        destino = np.memmap(self.ruta, REGISTRO, "r+", self.desplazamiento, self.forma)
+        for nombre, columna in self.columnas.items(): destino[nombre] = columna.T
+        destino.flush()
+        del destino
+        with open(self.ruta, "r+b") as fichero:
+            fichero.seek(self.inicio_bloques + self.bloque)
+            fichero.write(b"\x01")
+
+
+def escritor(directorio, trenes_reserva, params, bloques, bloque, clave):
+    # Escritor de las filas del bloque `bloque` en la traza de `trenes_reserva`. `bloques` son las réplicas de cada
+    # bloque y `clave` identifica la simulación (parámetros, tipo de punto y semilla): una traza existente con otra
+    # clave es de otra simulación y no se mezcla con esta.
+    ruta = ruta_traza(directorio, trenes_reserva)
+    cabecera = {"formato": FORMATO, "clave": clave, "trenes_reserva": trenes_reserva,
+                "flota_total": params["TRENES_OPERATIVOS_REQUERIDOS"] + trenes_reserva,
+                "dias": params["DIAS_POR_SIMULACION"], "replicas": int(sum(bloques)), "bloques": list(bloques),
+                "campos": [nombre for nombre in REGISTRO.names],
+                # Solo los parámetros con efecto en el resultado: igual con cualquier número de procesos
+                "params": {k: v for k, v in params.items() if k not in FlotaCache.CLAVES_SIN_EFECTO}}
+    if not os.path.exists(ruta): _crear(ruta, cabecera)
+    existente, (inicio_bloques, inicio_datos) = _leer_cabecera(ruta)
+    if existente["clave"] != clave:
+        raise ValueError(f"La traza {ruta} corresponde a otra simulación; elija otro directorio de trazas o "
+                         f"bórrela.")
+    return EscritorBloque(ruta, bloque, inicio_bloques, inicio_datos, int(sum(bloques[:bloque])), bloques[bloque],
+                          cabecera["dias"])
+
+
+class Traza:
+    # Lectura de una traza sin cargarla: `registros` es un np.memmap de solo lectura (réplicas x días) y cualquier
+    # corte (traza[10:20], traza.campo("disponibles")[:, 100:200]) solo lee las páginas que toca
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.cabecera, (self.inicio_bloques, inicio_datos) = _leer_cabecera(ruta)
+        self.trenes_reserva = self.cabecera["trenes_reserva"]
+        self.registros = np.memmap(ruta, REGISTRO, "r", inicio_datos, (self.cabecera["replicas"],
+                                                                        self.cabecera["dias"]))
+
+    def bloques_completos(self):
+        with open(self.ruta, "rb") as fichero:
+            fichero.seek(self.inicio_bloques)
+            return np.frombuffer(fichero.read(len(self.cabecera["bloques"])), dtype=np.uint8).astype(bool)
+
+    def replicas_completas(self):
+        # Máscara por réplica: solo las réplicas de bloques completos tienen registros válidos
+        return np.repeat(self.bloques_completos(), self.cabecera["bloques"])
+
+    def campo(self, nombre):
+        return self.registros[nombre]
+
+    def __getitem__(self, indice):
+        return self.registros[indice]
+
+    def __len__(self):
+        return self.cabecera["replicas"]
+
+
+def abrir(directorio):
+    # {trenes de reserva: Traza} de todas las trazas del directorio
+    trazas = {}
+    for ruta in glob.glob(os.path.join(directorio, "reserva_*.traza")):
+        traza = Traza(ruta)
+        trazas[traza.trenes_reserva] = traza
+    return dict(sorted(trazas.items()))
+
+
+def _corte(texto):
+    inicio, separador, fin = texto.partition(":")
+    if not separador: return slice(int(inicio), int(inicio) + 1)
+    return slice(int(inicio) if inicio else None, int(fin) if fin else None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta de trazas diarias del estado de la flota.")
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+    resumen = subparsers.add_parser("resumen", help="Réplicas completas y medias diarias por tamaño de reserva.")
+    resumen.add_argument("directorio")
+    exportar = subparsers.add_parser("exportar", help="Exporta a CSV un corte de la traza de una reserva.")
+    exportar.add_argument("directorio")
+    exportar.add_argument("--reserva", type=int, required=True)
+    exportar.add_argument("--replicas", type=_corte, default=slice(None), metavar="INICIO:FIN")
+    exportar.add_argument("--dias", type=_corte, default=slice(None), metavar="INICIO:FIN")
+    exportar.add_argument("--salida", default="-", help="Fichero CSV (por defecto la salida estándar).")
+    args = parser.parse_args(argv)
+
+    trazas = abrir(args.directorio)
+    if args.accion == "resumen":
+        if not trazas: print(f"No hay trazas en {args.directorio}.")
+        for trenes_reserva, traza in trazas.items():
+            completas = traza.replicas_completas()
+            texto = f"{trenes_reserva:>4} trenes de reserva: {completas.sum()}/{len(traza)} réplicas completas"
+            if completas.any():
+                # Medias réplica a réplica para no leer de golpe la traza entera
+                medias = np.zeros(len(REGISTRO.names))
+                for replica in np.nonzero(completas)[0]:
+                    fila = traza[replica]
+                    medias += [fila[nombre].mean() for nombre in REGISTRO.names]
+                medias /= completas.sum()
+                texto += " | media diaria: " + ", ".join(f"{nombre} {valor:.2f}"
+                                                         for nombre, valor in zip(REGISTRO.names, medias))
+            print(texto)
+        return 0
+
+    if args.reserva not in trazas: parser.error(f"no hay traza de {args.reserva} trenes de reserva")
+    traza = trazas[args.reserva]
+    replicas = range(len(traza))[args.replicas]
+    dias = range(traza.cabecera["dias"])[args.dias]
+    completas = traza.replicas_completas()
+    fichero = sys.stdout if args.salida == "-" else open(args.salida, "w", newline="", encoding="utf-8")
+    try:
+        escritor_csv = csv.writer(fichero)
+        escritor_csv.writerow(["replica", "dia", *REGISTRO.names])
+        for replica in replicas:
+            if not completas[replica]: continue
+            fila = traza[replica, args.dias]
+            for dia, registro in zip(dias, fila.tolist()): escritor_csv.writerow([replica, dia, *registro])
+    finally:
+        if fichero is not sys.stdout: fichero.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,48 @@
 # interfaz_simulador.py
 
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
+from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
 import queue
+import functools
+import os
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.collections import LineCollection
 import math
 import numpy as np
 
+import FlotaCache
+import FlotaPuntoControl
 import FlotaReserva as sim
+import FlotaSustituto
 from FlotaReserva import get_discrete_weibull_pmf, weibull_hazard_rate
 
 plt.style.use('seaborn-v0_8-whitegrid')
 
 
+# Cálculos de las previsualizaciones, memorizados por sus parámetros
+@functools.lru_cache(maxsize=128)
+def _preview_pmf(beta, media):
+    eta = media / math.gamma(1 + 1 / beta)
+    return eta, tuple(get_discrete_weibull_pmf(np.arange(1, 11), beta, eta))
+
+
+@functools.lru_cache(maxsize=128)
+def _preview_hazard(k, disponibilidad):
+    tasa_fallo = 1 - disponibilidad
+    mttf_falla = round(1 / tasa_fallo, 2) if tasa_fallo > 0 else float('inf')
+    escala_lambda_falla = mttf_falla / math.gamma(1 + 1 / k)
+    return mttf_falla, tuple(weibull_hazard_rate(t, k, escala_lambda_falla) for t in range(1, 31))
+
+
 class SimuladorApp(tk.Tk):
+    # Las actualizaciones de progreso del hilo de simulación se acumulan en results_queue y se aplican en el hilo
+    # de Tk a lo sumo una vez por fotograma.
+    FRAME_MS = 100
+    # Las previsualizaciones se redibujan tras una pausa al teclear y solo si cambió alguno de sus parámetros
+    PREVIEW_DEBOUNCE_MS = 250
+
     def __init__(self):
         super().__init__()
         self.title("Simulador de Flota v12.2 - Corrección Final")
@@ -28,13 +55,21 @@ class SimuladorApp(tk.Tk):
         self.PREVIEW_PARAM_KEYS = {"FORMA_BETA_REPARACION_DISCRETA", "REPARACION_MEDIA", "FORMA_BETA_MNT_DISCRETA",
                                    "MNT_MEDIO", "FORMA_K_FALLA", "DISPONIBILIDAD"}
         self.params = sim.default_params.copy()
+        self._preview_key = None
+        self._preview_after_id = None
+        self.surrogate = None
+        self._surrogate_after_id = None
 
         self.param_vars = {}
+        self.option_vars = {}
         self.widget_map = {}
         self.hourly_req_widgets = []
+        self.requirements_profile = None  # matriz de perfiles x 24 cargada de un fichero (sustituye a las 24 casillas)
         self.maintenance_rule_rows = []
 
         self.results_queue = queue.Queue()
+        self.history = []
+        self.log_parts = []
         self.stop_event = threading.Event()
 
         canvas = tk.Canvas(self);
@@ -62,15 +97,71 @@ class SimuladorApp(tk.Tk):
         self.stop_button = ttk.Button(sim_controls_frame, text="■ Detener Simulación", command=self.request_stop,
                                       state='disabled');
         self.stop_button.pack(fill=tk.X, expand=True, pady=2)
+        self.resume_button = ttk.Button(sim_controls_frame, text="⟳ Reanudar desde Punto de Control...",
+                                        command=self._resume_checkpoint);
+        self.resume_button.pack(fill=tk.X, expand=True, pady=2)
         self.validation_status_label = ttk.Label(sim_controls_frame, text="", font=("Helvetica", 10, "bold"));
         self.validation_status_label.pack(fill=tk.X, expand=True, pady=5)
 
+        surrogate_frame = ttk.LabelFrame(parent, text="Consulta Rápida (Modelo Sustituto)", padding="10");
+        surrogate_frame.pack(fill=tk.X, expand=True, padx=5, pady=5)
+        ttk.Button(surrogate_frame, text="Cargar modelo...", command=self._load_surrogate).pack(fill=tk.X, expand=True,
+                                                                                                pady=2)
+        self.surrogate_label = ttk.Label(surrogate_frame, text="Sin modelo (créelo con FlotaSustituto.py construir).",
+                                         wraplength=330, justify=tk.LEFT);
+        self.surrogate_label.pack(fill=tk.X, expand=True, pady=2)
+        self.verify_button = ttk.Button(surrogate_frame, text="Verificar con simulación completa",
+                                        command=self.start_simulation_thread, state='disabled');
+        self.verify_button.pack(fill=tk.X, expand=True, pady=2)
+
         general_frame = ttk.LabelFrame(parent, text="Configuración General", padding="10");
         general_frame.pack(fill=tk.X, expand=True, padx=5, pady=5);
         self._create_entry(general_frame, "TRENES_OPERATIVOS_REQUERIDOS", "Trenes operativos:");
         self._create_entry(general_frame, "NIVEL_SERVICIO_DESEADO", "Objetivo de Servicio (0-1):");
         self._create_entry(general_frame, "NUM_SIMULACIONES", "Nº de simulaciones:");
         self._create_entry(general_frame, "DIAS_POR_SIMULACION", "Días por simulación:")
+        calculo_frame = ttk.LabelFrame(parent, text="Opciones de Cálculo", padding="10");
+        calculo_frame.pack(fill=tk.X, expand=True, padx=5, pady=5);
+        self._create_option(calculo_frame, "MOTOR", "Motor de simulación:", list(sim.MOTORES))
+        self._create_entry(calculo_frame, "NUM_PROCESOS", "Nº de procesos en paralelo:")
+        distributed_frame = ttk.Frame(calculo_frame);
+        distributed_frame.pack(fill=tk.X, expand=True, pady=2);
+        ttk.Label(distributed_frame, text="Coordinador distribuido (host:puerto):", width=32).pack(side=tk.LEFT)
+        self.distributed_var = tk.StringVar(value="");
+        tk.Entry(distributed_frame, textvariable=self.distributed_var, relief='sunken', borderwidth=1).pack(
+            side=tk.RIGHT, fill=tk.X, expand=True)
+        self._create_option(calculo_frame, "MODO_BUSQUEDA", "Modo de búsqueda:", list(sim.MODOS_BUSQUEDA))
+        self._create_entry(calculo_frame, "VENTANA_CRN", "Máximo de tamaños por ventana (crn):")
+        self._create_check(calculo_frame, "SECUENCIAL", "Parada por intervalo de confianza")
+        self._create_entry(calculo_frame, "CONFIANZA", "Confianza del intervalo (0-1):")
+        self._create_entry(calculo_frame, "TOLERANCIA_ERROR", "Tolerancia del intervalo (±):")
+        self._create_option(calculo_frame, "REDUCCION_VARIANZA", "Reducción de varianza:", list(sim.MODOS_REDUCCION))
+        self._create_check(calculo_frame, "CACHE", "Reutilizar resultados en caché (requiere semilla)")
+        ttk.Button(calculo_frame, text="Vaciar caché", command=self._clear_cache).pack(fill=tk.X, expand=True, pady=2)
+        checkpoint_frame = ttk.Frame(calculo_frame);
+        checkpoint_frame.pack(fill=tk.X, expand=True, pady=2);
+        ttk.Label(checkpoint_frame, text="Punto de control (vacío = ninguno):", width=32).pack(side=tk.LEFT)
+        ttk.Button(checkpoint_frame, text="...", width=3, command=self._choose_checkpoint).pack(side=tk.RIGHT)
+        self.checkpoint_var = tk.StringVar(value="");
+        tk.Entry(checkpoint_frame, textvariable=self.checkpoint_var, relief='sunken', borderwidth=1).pack(
+            side=tk.RIGHT, fill=tk.X, expand=True)
+        self._create_entry(calculo_frame, "INTERVALO_PUNTO_CONTROL", "Segundos entre puntos de control:")
+        self._create_check(calculo_frame, "INSTRUMENTACION", "Medir tiempos por fase de los motores")
+        self._create_option(calculo_frame, "PERFILADO", "Perfilado:", list(sim.PERFILADORES))
+        trace_frame = ttk.Frame(calculo_frame);
+        trace_frame.pack(fill=tk.X, expand=True, pady=2);
+        ttk.Label(trace_frame, text="Traza diaria (vacío = ninguna):", width=32).pack(side=tk.LEFT)
+        ttk.Button(trace_frame, text="...", width=3, command=self._choose_trace_dir).pack(side=tk.RIGHT)
+        self.trace_var = tk.StringVar(value="");
+        tk.Entry(trace_frame, textvariable=self.trace_var, relief='sunken', borderwidth=1).pack(
+            side=tk.RIGHT, fill=tk.X, expand=True)
+        seed_frame = ttk.Frame(calculo_frame);
+        seed_frame.pack(fill=tk.X, expand=True, pady=2);
+        ttk.Label(seed_frame, text="Semilla (vacío = aleatoria):", width=32).pack(side=tk.LEFT)
+        self.seed_var = tk.StringVar(value="");
+        self.seed_entry = tk.Entry(seed_frame, textvariable=self.seed_var, relief='sunken', borderwidth=1);
+        self.seed_entry.pack(side=tk.RIGHT, fill=tk.X, expand=True)
+        self.seed_var.trace_add("write", self._run_all_validations)
         falla_frame = ttk.LabelFrame(parent, text="Parámetros de Falla", padding="10");
         falla_frame.pack(fill=tk.X, expand=True, padx=5, pady=5);
         self._create_entry(falla_frame, "DISPONIBILIDAD", "Disponibilidad (0-1):");
@@ -106,6 +197,13 @@ class SimuladorApp(tk.Tk):
             entry.grid(row=i, column=1, sticky="ew", pady=1, padx=5)
             self.hourly_req_widgets.append({'var': var, 'widget': entry})
             var.trace_add("write", self._run_all_validations)
+        profile_frame = ttk.Frame(req_frame);
+        profile_frame.grid(row=24, column=0, columnspan=2, sticky="ew", pady=(6, 1))
+        ttk.Button(profile_frame, text="Cargar perfil...", command=self._load_requirements_profile).pack(side=tk.LEFT)
+        ttk.Button(profile_frame, text="Quitar", command=lambda: self._set_requirements_profile(None)).pack(
+            side=tk.LEFT, padx=5)
+        self.profile_label = ttk.Label(req_frame, text="Un único perfil para todos los días")
+        self.profile_label.grid(row=25, column=0, columnspan=2, sticky="w")
 
     def _create_entry(self, parent, key, text):
         frame = ttk.Frame(parent);
@@ -118,6 +216,20 @@ class SimuladorApp(tk.Tk):
         self.widget_map[key] = entry
         var.trace_add("write", self._run_all_validations)
 
+    def _create_option(self, parent, key, text, values):
+        frame = ttk.Frame(parent);
+        frame.pack(fill=tk.X, expand=True, pady=2);
+        ttk.Label(frame, text=text, width=32).pack(side=tk.LEFT)
+        var = tk.StringVar(value=str(self.params[key]));
+        self.option_vars[key] = var
+        combo = ttk.Combobox(frame, textvariable=var, values=values, state='readonly');
+        combo.pack(side=tk.RIGHT, fill=tk.X, expand=True)
+
+    def _create_check(self, parent, key, text):
+        var = tk.BooleanVar(value=bool(self.params[key]));
+        self.option_vars[key] = var
+        ttk.Checkbutton(parent, text=text, variable=var).pack(fill=tk.X, expand=True, pady=2)
+
     def _add_maintenance_row(self, trains_val="", prob_val=""):
         row_frame = ttk.Frame(self.maintenance_rows_frame);
         row_frame.pack(fill=tk.X, pady=2)
@@ -161,7 +273,10 @@ class SimuladorApp(tk.Tk):
                 "NIVEL_SERVICIO_DESEADO": lambda v: 0 <= v <= 1, "DISPONIBILIDAD": lambda v: 0 <= v <= 1,
                 "FORMA_K_FALLA": lambda v: v > 0, "FORMA_BETA_REPARACION_DISCRETA": lambda v: v > 0,
                 "FORMA_BETA_MNT_DISCRETA": lambda v: v > 0, "REPARACION_MEDIA": lambda v: v > 0 and v == int(v),
-                "MNT_MEDIO": lambda v: v > 0 and v == int(v)
+                "MNT_MEDIO": lambda v: v > 0 and v == int(v),
+                "NUM_PROCESOS": lambda v: v >= 1 and v == int(v), "VENTANA_CRN": lambda v: v >= 1 and v == int(v),
+                "CONFIANZA": lambda v: 0 < v < 1, "TOLERANCIA_ERROR": lambda v: v > 0,
+                "INTERVALO_PUNTO_CONTROL": lambda v: v >= 0
             }
             for key, rule in params_to_validate.items():
                 widget = self.widget_map[key];
@@ -170,6 +285,10 @@ class SimuladorApp(tk.Tk):
                 is_valid = rule(val);
                 self._set_widget_validity(widget, is_valid)
                 if not is_valid: is_form_fully_valid = False
+            semilla = self.seed_var.get().strip()
+            is_valid_seed = not semilla or semilla.isdigit()
+            self._set_widget_validity(self.seed_entry, is_valid_seed)
+            if not is_valid_seed: is_form_fully_valid = False
             for item in self.hourly_req_widgets:
                 val = int(item['var'].get());
                 is_valid = 0 <= val <= trenes_operativos
@@ -197,31 +316,116 @@ class SimuladorApp(tk.Tk):
         if is_form_fully_valid:
             self.validation_status_label.config(text="✅ Todos los parámetros son válidos.", foreground="green")
             self.run_button.config(state="normal")
+            self._schedule_surrogate_query()
         else:
             self.validation_status_label.config(text="❌ Hay errores en los parámetros (campos en rojo).",
                                                 foreground="red")
             self.run_button.config(state="disabled")
-        self._update_preview_plots()
+        if self.surrogate is not None:
+            self.verify_button.config(state="normal" if is_form_fully_valid else "disabled")
+        self._schedule_preview_update()
         return is_form_fully_valid
 
-    def start_simulation_thread(self):
+    def _collect_params(self):
+        is_valid, trains_list, probs_list = self._get_maintenance_policy_data()
+        params = {key: float(var.get()) if '.' in var.get() else int(var.get()) for key, var in
+                  self.param_vars.items()}
+        params.update({key: var.get() for key, var in self.option_vars.items()})
+        params["SEMILLA"] = int(self.seed_var.get()) if self.seed_var.get().strip() else None
+        params["REQUISITOS_TRENES_HORA"] = self.requirements_profile or [
+            int(item['var'].get()) for item in self.hourly_req_widgets];
+        params["LISTA_MNT"] = trains_list;
+        params["P_MNT"] = probs_list
+        params["PUNTO_CONTROL"] = self.checkpoint_var.get().strip() or None
+        params["DISTRIBUIDO"] = self.distributed_var.get().strip() or None
+        params["TRAZA"] = self.trace_var.get().strip() or None
+        return params
+
+    def _apply_params(self, params):
+        # Rellena el formulario con unos parámetros (los de un punto de control)
+        for key, var in self.param_vars.items():
+            if key in params: var.set(str(params[key]))
+        for key, var in self.option_vars.items():
+            if key in params: var.set(params[key])
+        self.seed_var.set("" if params.get("SEMILLA") is None else str(params["SEMILLA"]))
+        self.distributed_var.set(params.get("DISTRIBUIDO") or "")
+        self.trace_var.set(params.get("TRAZA") or "")
+        perfil = sim.perfil_requisitos(params["REQUISITOS_TRENES_HORA"])
+        self._set_requirements_profile(perfil.tolist() if len(perfil) > 1 else None)
+        for item, valor in zip(self.hourly_req_widgets, perfil[0]): item['var'].set(str(valor))
+        for row in list(self.maintenance_rule_rows): self._remove_maintenance_row(row['frame'])
+        for trenes, prob in zip(params["LISTA_MNT"], params["P_MNT"]):
+            self._add_maintenance_row(trains_val=str(trenes), prob_val=f"{prob * 100:g}")
+
+    def _choose_checkpoint(self):
+        ruta = filedialog.asksaveasfilename(title="Punto de control", defaultextension=".npz",
+                                            filetypes=[("Punto de control", "*.npz")], confirmoverwrite=False)
+        if ruta: self.checkpoint_var.set(ruta)
+
+    def _load_requirements_profile(self):
+        # Requisitos por día de la semana (7 x 24), estacionales (365 x 24) o cualquier otra matriz de perfiles x 24
+        ruta = filedialog.askopenfilename(title="Perfil de requisitos por hora",
+                                          filetypes=[("Perfil de requisitos", "*.csv *.txt *.json *.npy"),
+                                                     ("Todos los ficheros", "*")])
+        if not ruta: return
+        try:
+            perfil = sim.cargar_requisitos(ruta)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Perfil de requisitos", f"No se pudo leer {ruta}:\n{e}")
+            return
+        if isinstance(perfil[0], list):
+            self._set_requirements_profile(perfil, os.path.basename(ruta))
+        else:
+            self._set_requirements_profile(None)
+            for item, valor in zip(self.hourly_req_widgets, perfil): item['var'].set(str(valor))
+
+    def _set_requirements_profile(self, perfil, nombre=None):
+        self.requirements_profile = perfil
+        estado = 'disabled' if perfil else 'normal'
+        for item in self.hourly_req_widgets: item['widget'].config(state=estado)
+        if perfil:
+            self.profile_label.config(text=f"{len(perfil)} perfiles diarios{f' ({nombre})' if nombre else ''}: "
+                                           f"el día d usa el perfil d % {len(perfil)}")
+        else:
+            self.profile_label.config(text="Un único perfil para todos los días")
+
+    def _choose_trace_dir(self):
+        ruta = filedialog.askdirectory(title="Directorio de la traza diaria", mustexist=False)
+        if ruta: self.trace_var.set(ruta)
+
+    def _resume_checkpoint(self):
+        # Carga los parámetros de la búsqueda guardada y la continúa con ellos (misma semilla y mismas opciones)
+        ruta = filedialog.askopenfilename(title="Reanudar búsqueda", filetypes=[("Punto de control", "*.npz")])
+        if not ruta: return
+        try:
+            control = FlotaPuntoControl.cargar(ruta)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Punto de control", f"No se pudo leer {ruta}:\n{e}")
+            return
+        self._apply_params(control.params)
+        self.checkpoint_var.set(ruta)
+        self.start_simulation_thread(dict(control.params, PUNTO_CONTROL=ruta))
+
+    def start_simulation_thread(self, params=None):
         self.validation_status_label.config(text="Ejecutando simulación...");
 
-        is_valid, trains_list, probs_list = self._get_maintenance_policy_data()
-        self.params = {key: float(var.get()) if '.' in var.get() else int(var.get()) for key, var in
-                       self.param_vars.items()}
-        self.params["REQUISITOS_TRENES_HORA"] = [int(item['var'].get()) for item in self.hourly_req_widgets];
-        self.params["LISTA_MNT"] = trains_list;
-        self.params["P_MNT"] = probs_list
+        self.params = params or self._collect_params()
         self._clear_plots(clear_previews=False)
         self.run_button.config(state='disabled');
+        self.verify_button.config(state='disabled');
+        self.resume_button.config(state='disabled');
         self.stop_button.config(state='normal');
         self.stop_event.clear()
-        self.update_progress("Iniciando búsqueda...\n", [])
-        thread = threading.Thread(target=self.run_simulation_in_background, args=(self.update_progress,));
+        self.history = [];
+        self.log_parts = []
+        self.log_text.config(state='normal');
+        self.log_text.delete('1.0', tk.END);
+        self.log_text.config(state='disabled')
+        self.update_performance_tab({})
+        thread = threading.Thread(target=self.run_simulation_in_background);
         thread.daemon = True;
         thread.start()
-        self.after(100, self.check_queue)
+        self.after(self.FRAME_MS, self.check_queue)
 
     def _get_maintenance_policy_data(self):
         trains = [];
@@ -254,95 +458,211 @@ class SimuladorApp(tk.Tk):
         self.canvas3 = FigureCanvasTkAgg(self.fig3, master=plot3_tab);
         self.canvas3.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         notebook.add(plot3_tab, text="Tasa de Falla (Desgaste)")
+        dist_tab = ttk.Frame(notebook);
+        self.fig4, self.axes4 = plt.subplots(1, 2);
+        self.fig4.tight_layout(pad=3.0);
+        self.canvas4 = FigureCanvasTkAgg(self.fig4, master=dist_tab);
+        self.canvas4.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        notebook.add(dist_tab, text="Distribución de Resultados")
+        perf_tab = ttk.Frame(notebook)
+        self.perf_text = scrolledtext.ScrolledText(perf_tab, wrap=tk.NONE, state='disabled', font=("Courier New", 10));
+        self.perf_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        notebook.add(perf_tab, text="Rendimiento")
+        self._init_history_plot()
 
     def _clear_plots(self, clear_previews=True):
-        self.ax1.clear();
-        self.ax1.set_title("Historial de Búsqueda");
-        self.canvas1.draw()
+        self._init_history_plot()
+        self.update_distribution_plot({})
         if clear_previews: self._update_preview_plots()
 
+    def _clear_cache(self):
+        cache = FlotaCache.CacheResultados(self.params.get("DIRECTORIO_CACHE"))
+        try:
+            stats = cache.estadisticas();
+            cache.invalidar()
+        finally:
+            cache.cerrar()
+        messagebox.showinfo("Caché", f"Se eliminaron {stats['entradas']} resultados "
+                                     f"({stats['bytes'] / 1024:.0f} KB).\n"
+                                     f"Aciertos acumulados: {stats['aciertos_totales']}, "
+                                     f"fallos: {stats['fallos_totales']}.")
+
     def request_stop(self):
         # ✅ CORREGIDO: Usar el nuevo nombre de la variable
         self.validation_status_label.config(text="Deteniendo simulación...")
         self.stop_event.set();
         self.stop_button.config(state='disabled')
 
-    def run_simulation_in_background(self, progress_callback):
+    def run_simulation_in_background(self):
+        # Hilo de trabajo: no toca widgets, solo deja los eventos en la cola para el hilo de Tk
         try:
-            results = sim.run_full_analysis(self.params, self.stop_event, progress_callback);
-            self.results_queue.put(results)
+            for evento in sim.iterar_analisis(self.params, self.stop_event):
+                self.results_queue.put(("evento", evento))
         except Exception as e:
-            self.results_queue.put(f"ERROR INESPERADO: {e}")
+            self.results_queue.put(("error", f"ERROR INESPERADO: {e}"))
 
     def check_queue(self):
-        try:
-            result = self.results_queue.get_nowait()
-            safe_result = {}
-            if isinstance(result, dict):
-                safe_result['plot_history'] = result.get('plot_history', result.get('history', []));
-                safe_result['log_text'] = result.get('log_text', 'Log no disponible.');
-                safe_result['stopped'] = result.get('stopped', False);
-                safe_result['trenes_optimos'] = result.get('trenes_optimos', -1)
-                safe_result['plot_reparacion'] = result.get('plot_reparacion');
-                safe_result['plot_mnt'] = result.get('plot_mnt');
-                safe_result['plot_falla'] = result.get('plot_falla')
-            else:
-                messagebox.showerror("Error de Simulación", str(result))
-                # ✅ CORREGIDO: Usar el nuevo nombre de la variable
-                self.validation_status_label.config(text="Error durante la simulación.")
-                self.reset_ui_state();
-                return
-            self.update_gui_with_results(safe_result)
-            if safe_result['stopped']:
-                # ✅ CORREGIDO: Usar el nuevo nombre de la variable
-                self.validation_status_label.config(text="Búsqueda detenida por el usuario.")
-            else:
-                # ✅ CORREGIDO: Usar el nuevo nombre de la variable
-                self.validation_status_label.config(text="Búsqueda completada con éxito.")
-            self.reset_ui_state()
-        except queue.Empty:
-            self.after(100, self.check_queue)
+        # Se vacía la cola completa y se aplica todo de una vez: un único insert en el log y un único redibujado
+        nuevo_texto = [];
+        history_changed = False;
+        ultimo_bloque = None;
+        final = None
+        while final is None:
+            try:
+                tipo, contenido = self.results_queue.get_nowait()
+            except queue.Empty:
+                break
+            if tipo == "error":
+                final = contenido;
+                break
+            texto = contenido.get("texto", "")
+            if texto: nuevo_texto.append(texto)
+            if contenido["tipo"] == "reserva_finalizada":
+                self.history.append(contenido["punto"]);
+                history_changed = True
+            elif contenido["tipo"] == "bloque":
+                ultimo_bloque = contenido
+            elif contenido["tipo"] == "fin":
+                final = contenido["resultados"]
+        if nuevo_texto:
+            self.log_parts.extend(nuevo_texto)
+            self.log_text.config(state='normal');
+            self.log_text.insert(tk.END, "".join(nuevo_texto));
+            self.log_text.see(tk.END);
+            self.log_text.config(state='disabled')
+        if history_changed: self.update_history_plot({"plot_history": self.history})
+        if ultimo_bloque is not None and final is None:
+            self.validation_status_label.config(
+                text=f"Reserva {ultimo_bloque['n_reserva']}: {ultimo_bloque['replicas']} réplicas, "
+                     f"nivel {ultimo_bloque['nivel']:.4%}")
+        if final is None:
+            self.after(self.FRAME_MS, self.check_queue)
+            return
+
+        result = final
+        safe_result = {}
+        if isinstance(result, dict):
+            safe_result['plot_history'] = result.get('plot_history', result.get('history', []));
+            safe_result['log_text'] = "".join(self.log_parts);
+            safe_result['stopped'] = result.get('stopped', False);
+            safe_result['trenes_optimos'] = result.get('trenes_optimos', -1)
+            safe_result['plot_reparacion'] = result.get('plot_reparacion');
+            safe_result['plot_mnt'] = result.get('plot_mnt');
+            safe_result['plot_falla'] = result.get('plot_falla')
+            safe_result['instrumentacion'] = result.get('instrumentacion');
+            safe_result['perfil'] = result.get('perfil')
+            safe_result['distribuciones'] = result.get('distribuciones', {})
+        else:
+            messagebox.showerror("Error de Simulación", str(result))
+            # ✅ CORREGIDO: Usar el nuevo nombre de la variable
+            self.validation_status_label.config(text="Error durante la simulación.")
+            self.reset_ui_state();
+            return
+        self.update_gui_with_results(safe_result)
+        if safe_result['stopped']:
+            # ✅ CORREGIDO: Usar el nuevo nombre de la variable
+            self.validation_status_label.config(text="Búsqueda detenida por el usuario.")
+        else:
+            # ✅ CORREGIDO: Usar el nuevo nombre de la variable
+            self.validation_status_label.config(text="Búsqueda completada con éxito.")
+        self.reset_ui_state()
 
     def reset_ui_state(self):
         self.run_button.config(state='normal');
+        self.resume_button.config(state='normal');
         self.stop_button.config(state='disabled')
         self._run_all_validations()
 
-    def update_progress(self, text, history):
-        self.log_text.config(state='normal');
-        self.log_text.delete('1.0', tk.END);
-        self.log_text.insert('1.0', text);
-        self.log_text.see(tk.END);
-        self.log_text.config(state='disabled')
-        self.update_history_plot({"plot_history": history})
-
-    def update_history_plot(self, results):
-        self.ax1.clear();
-        history = results.get("plot_history", [])
-        if not history: self.canvas1.draw();return
-        x_vals, y_vals = zip(*history)
+    def _target_service_level(self):
         try:
-            objetivo = float(self.param_vars["NIVEL_SERVICIO_DESEADO"].get())
+            return float(self.param_vars["NIVEL_SERVICIO_DESEADO"].get())
         except ValueError:
-            objetivo = 0.99  # Valor por defecto si la entrada es inválida
-        self.ax1.plot(x_vals, y_vals, marker='o', linestyle='--', color='gray', label='Intentos')
-        for x, y in history:
-            color = 'green' if y >= objetivo else 'red'
-            self.ax1.scatter(x, y, color=color, zorder=5)
+            return 0.99  # Valor por defecto si la entrada es inválida
+
+    def _init_history_plot(self):
+        # Los artistas del historial se crean una vez por búsqueda y después solo se actualizan sus datos
+        self.ax1.clear()
+        objetivo = self._target_service_level()
+        self.history_line, = self.ax1.plot([], [], marker='o', linestyle='--', color='gray', label='Intentos')
+        self.history_errors = LineCollection([], colors='gray', label='IC')
+        self.ax1.add_collection(self.history_errors)
+        self.history_points = self.ax1.scatter([], [], zorder=5)
         self.ax1.axhline(y=objetivo, color='darkorange', linestyle=':', label=f'Objetivo ({objetivo:.2%})')
-        if results.get("trenes_optimos", -1) != -1:
-            self.ax1.axvline(x=results["trenes_optimos"], color='blue', linestyle='-',
-                             label=f'Flota Mínima: {results["trenes_optimos"]}')
+        self.optimum_line = self.ax1.axvline(x=0, color='blue', linestyle='-', label='_Flota Mínima')
+        self.optimum_line.set_visible(False)
         self.ax1.set_title('Historial de Búsqueda de Flota', fontsize=14, fontweight='bold');
         self.ax1.set_xlabel('Nº de Trenes de Reserva Probados');
         self.ax1.set_ylabel('Nivel de Servicio Alcanzado');
         self.ax1.yaxis.set_major_formatter(plt.FuncFormatter(lambda y, _: f'{y:.2%}'));
         self.ax1.legend();
         self.ax1.grid(True)
-        self.canvas1.draw()
+        self.canvas1.draw_idle()
+
+    def update_history_plot(self, results):
+        history = results.get("plot_history", [])
+        objetivo = self._target_service_level()
+        x_vals = [h[0] for h in history];
+        y_vals = [h[1] for h in history]
+        self.history_line.set_data(x_vals, y_vals)
+        self.history_points.set_offsets(np.column_stack([x_vals, y_vals]) if history else np.empty((0, 2)))
+        self.history_points.set_color(['green' if y >= objetivo else 'red' for y in y_vals])
+        segments = [[(h[0], h[2]), (h[0], h[3])] for h in history if len(h) >= 4]
+        self.history_errors.set_segments(segments)
+        trenes_optimos = results.get("trenes_optimos", -1)
+        if trenes_optimos != -1:
+            self.optimum_line.set_xdata([trenes_optimos, trenes_optimos])
+            self.optimum_line.set_label(f'Flota Mínima: {trenes_optimos}')
+            self.optimum_line.set_visible(True)
+            self.ax1.legend()
+        self.ax1.relim()
+        if segments: self.ax1.update_datalim([p for segment in segments for p in segment])
+        self.ax1.autoscale_view()
+        self.canvas1.draw_idle()
+
+    def update_distribution_plot(self, results):
+        # Izquierda: probabilidad de que un año quede por debajo del objetivo por reserva; derecha: distribución de
+        # las horas fallidas por año de la flota mínima (o de la última reserva evaluada)
+        for ax in self.axes4: ax.clear()
+        distribuciones = {n: d for n, d in (results.get("distribuciones") or {}).items() if d is not None}
+        if distribuciones:
+            reservas = sorted(distribuciones)
+            self.axes4[0].bar(reservas, [distribuciones[n]["prob_incumplir"] for n in reservas], color='indianred')
+            self.axes4[0].yaxis.set_major_formatter(plt.FuncFormatter(lambda y, _: f'{y:.0%}'))
+            n_reserva = results.get("trenes_optimos", -1)
+            if n_reserva not in distribuciones: n_reserva = reservas[-1]
+            distribucion = distribuciones[n_reserva]
+            histograma = distribucion["histograma_horas"]
+            self.axes4[1].bar(histograma["horas"], histograma["probabilidad"], width=1.0, color='steelblue')
+            for clave, color in (("p50", 'gray'), ("p95", 'darkorange'), ("p99", 'crimson')):
+                self.axes4[1].axvline(x=distribucion["cuantiles_horas"][clave], color=color, linestyle='--',
+                                      label=f'{clave}: {distribucion["cuantiles_horas"][clave]} h')
+            self.axes4[1].set_title(f'Horas Fallidas por Año ({n_reserva} trenes de reserva)\n'
+                                    f'peor día: media {distribucion["peor_dia_medio"]:.1f} h, '
+                                    f'máximo {distribucion["peor_dia_max"]} h')
+            self.axes4[1].legend()
+        self.axes4[0].set_title('Probabilidad de un Año por Debajo del Objetivo');
+        self.axes4[0].set_xlabel('Nº de Trenes de Reserva');
+        self.axes4[1].set_xlabel('Horas con servicio fallido en el año');
+        self.axes4[1].set_ylabel('Probabilidad');
+        self.canvas4.draw_idle()
+
+    def update_performance_tab(self, results):
+        texto = ""
+        if results.get("instrumentacion"):
+            texto += "=== Instrumentación de los motores ===\n" + sim.informe_instrumentacion(results["instrumentacion"])
+        if results.get("perfil"):
+            texto += "\n=== Perfil ===\n" + results["perfil"]
+        if not texto and results:
+            texto = "Active 'Medir tiempos por fase' o un modo de perfilado para ver el coste de cada fase.\n"
+        self.perf_text.config(state='normal');
+        self.perf_text.delete('1.0', tk.END);
+        self.perf_text.insert(tk.END, texto);
+        self.perf_text.config(state='disabled')
 
     def update_gui_with_results(self, results):
-        self.update_progress(results["log_text"], results["plot_history"])
+        self.update_history_plot(results)
+        self.update_performance_tab(results)
+        self.update_distribution_plot(results)
         if not results.get("stopped") and results.get('plot_reparacion'):
             self.axes2[0].clear();
             self.axes2[1].clear()
@@ -377,23 +697,55 @@ class SimuladorApp(tk.Tk):
             self.ax3.grid(True)
             self.canvas3.draw()
 
+    def _load_surrogate(self):
+        ruta = filedialog.askopenfilename(title="Modelo sustituto", filetypes=[("Modelo sustituto", "*.npz")])
+        if not ruta: return
+        try:
+            self.surrogate = FlotaSustituto.cargar(ruta)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Modelo sustituto", f"No se pudo cargar {ruta}:\n{e}")
+            return
+        self._run_all_validations()
+
+    def _schedule_surrogate_query(self):
+        # Las consultas al modelo sustituto tardan milisegundos, pero se agrupan como las previsualizaciones
+        if self.surrogate is None: return
+        if self._surrogate_after_id is not None: self.after_cancel(self._surrogate_after_id)
+        self._surrogate_after_id = self.after(self.PREVIEW_DEBOUNCE_MS, self._update_surrogate_query)
+
+    def _update_surrogate_query(self):
+        self._surrogate_after_id = None
+        try:
+            consulta = self.surrogate.consultar(self._collect_params())
+        except (ValueError, KeyError, ZeroDivisionError):
+            return
+        self.surrogate_label.config(text=FlotaSustituto.informe_consulta(consulta))
+
+    def _current_preview_key(self):
+        try:
+            return tuple(self.param_vars[key].get() for key in sorted(self.PREVIEW_PARAM_KEYS))
+        except KeyError:
+            return None  # El panel aún se está construyendo
+
+    def _schedule_preview_update(self):
+        key = self._current_preview_key()
+        if key is None or key == self._preview_key: return
+        if self._preview_after_id is not None: self.after_cancel(self._preview_after_id)
+        self._preview_after_id = self.after(self.PREVIEW_DEBOUNCE_MS, self._update_preview_plots)
+
     def _update_preview_plots(self, *args):
+        self._preview_after_id = None
+        self._preview_key = self._current_preview_key()
         try:
-            params = {key: float(var.get()) if '.' in var.get() else int(var.get()) for key, var in
-                      self.param_vars.items()}
-            escala_eta_reparacion = params["REPARACION_MEDIA"] / math.gamma(
-                1 + 1 / params["FORMA_BETA_REPARACION_DISCRETA"]);
+            params = {key: float(self.param_vars[key].get()) if '.' in self.param_vars[key].get()
+                      else int(self.param_vars[key].get()) for key in self.PREVIEW_PARAM_KEYS}
+            escala_eta_reparacion, pmf_reparacion = _preview_pmf(params["FORMA_BETA_REPARACION_DISCRETA"],
+                                                                 params["REPARACION_MEDIA"])
             x_range_rep = np.arange(1, 11);
-            pmf_reparacion = get_discrete_weibull_pmf(x_range_rep, params["FORMA_BETA_REPARACION_DISCRETA"],
-                                                      escala_eta_reparacion)
-            escala_eta_mnt = params["MNT_MEDIO"] / math.gamma(1 + 1 / params["FORMA_BETA_MNT_DISCRETA"]);
+            escala_eta_mnt, pmf_mnt = _preview_pmf(params["FORMA_BETA_MNT_DISCRETA"], params["MNT_MEDIO"])
             x_range_mnt = np.arange(1, 11);
-            pmf_mnt = get_discrete_weibull_pmf(x_range_mnt, params["FORMA_BETA_MNT_DISCRETA"], escala_eta_mnt)
-            tasa_fallo = 1 - params["DISPONIBILIDAD"];
-            mttf_falla = round(1 / tasa_fallo, 2) if tasa_fallo > 0 else float('inf');
-            escala_lambda_falla = mttf_falla / math.gamma(1 + 1 / params["FORMA_K_FALLA"]);
+            mttf_falla, tasas_de_falla = _preview_hazard(params["FORMA_K_FALLA"], params["DISPONIBILIDAD"])
             edades = np.arange(1, 31);
-            tasas_de_falla = [weibull_hazard_rate(t, params["FORMA_K_FALLA"], escala_lambda_falla) for t in edades]
             self.axes2[0].clear();
             self.axes2[1].clear()
             self.axes2[0].bar(x_range_rep, pmf_reparacion,